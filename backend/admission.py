@@ -0,0 +1,128 @@
+"""
+Admission control and load shedding for the scoring routes
+A concurrency limit with a bounded wait queue sits in front of /predict so a
+burst rejects the excess fast (503 + Retry-After) instead of slowing every
+request down. Cheap routes such as /ping and /health are never gated.
+
+Only requests that reach a worker thread are seen here, so gunicorn needs
+more threads than ADMISSION_MAX_CONCURRENT + ADMISSION_MAX_QUEUE for the limit
+to take effect; cpu_config.py raises the thread count to guarantee that.
+"""
+import os
+import time
+import threading
+from functools import wraps
+from flask import jsonify
+
+
+class AdmissionController:
+    """Counting semaphore with a bounded, timed wait queue and counters"""
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, retry_after):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._cond = threading.Condition(threading.Lock())
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_waiting_seen = 0
+        self.total_wait_s = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_concurrent > 0
+
+    def acquire(self):
+        """Admit the caller, wait in the queue, or return False to shed it"""
+        with self._cond:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                return False
+
+            self.waiting += 1
+            self.queued += 1
+            self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+            start = time.monotonic()
+            deadline = start + self.queue_timeout
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+                self.total_wait_s += time.monotonic() - start
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            rejected = self.rejected_queue_full + self.rejected_timeout
+            return {
+                'name': self.name,
+                'enabled': self.enabled,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_s': self.queue_timeout,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'max_queue_depth_seen': self.max_waiting_seen,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': rejected,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout,
+                'avg_queue_wait_ms': round(self.total_wait_s / self.queued * 1000, 3) if self.queued else 0.0
+            }
+
+
+def controller_from_env(name, default_concurrency, default_queue=8):
+    """Build a controller from ADMISSION_* environment variables"""
+    return AdmissionController(
+        name,
+        max_concurrent=int(os.environ.get('ADMISSION_MAX_CONCURRENT', default_concurrency)),
+        max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', default_queue)),
+        queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '2.0')),
+        retry_after=int(os.environ.get('ADMISSION_RETRY_AFTER', '1'))
+    )
+
+
+def admission_controlled(controller):
+    """Route decorator that sheds load with 503 + Retry-After when the controller is full"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not controller.enabled:
+                return view(*args, **kwargs)
+            if not controller.acquire():
+                response = jsonify({
+                    'error': 'Server is busy, please retry shortly.',
+                    'status': 'overloaded'
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(controller.retry_after)
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.release()
+        return wrapper
+    return decorator
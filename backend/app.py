@@ -1,22 +1,33 @@
+import time
+
+# Measured first so the startup report covers the rest of the module import
+_import_started = time.perf_counter()
+
 import os
 import sys
+import gc
 import json
+import math
+import importlib
+import threading
+import weakref
 import traceback
 import pickle
 import logging
 from datetime import datetime
-from flask import Flask, request, jsonify
+from functools import wraps
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-import numpy as np # Add missing import for numpy
-
-# Flask 3.x compatibility check
-try:
-    import flask
-    print(f"✅ Flask imported successfully: {flask.__version__}")
-except Exception as e:
-    print(f"❌ Flask import failed: {e}")
-    sys.exit(1)
-
+from profiling import init_profiling, profile_stage, register_memory_target
+from memory_stats import process_memory, worker_memory_report
+from cpu_config import load_cpu_config
+from admission import admission_controlled, controller_from_env
+from explanations import ContributionCache, explain_batch, format_explanation
+from drift import monitor_from_env
+from model_registry import registry_from_env
+from price_alerts import engine_from_env, parse_alert, parse_event
+from price_lookup import PriceLookupError, PriceNotFound, lookup_from_env
+from storage_optimizer import DEFAULT_HORIZON_DAYS, MAX_HORIZON_DAYS, forecast_from_prediction, optimize_lots, as_number, lot_number
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +39,53 @@ app = Flask(__name__)
 # Global flag to track if models are loaded
 models_loaded = False
 
+# Set when the models were loaded in the gunicorn master before forking
+models_preloaded = False
+
+# Only one thread may unpickle the bundle, others wait for its result
+_model_load_lock = threading.Lock()
+
+# ML libraries imported during model loading, not at app import, so /ping
+# answers right after a cold start
+HEAVY_MODULES = ['numpy', 'scipy', 'sklearn', 'xgboost']
+
+# Filled in as the app starts, shown on /debug
+startup_report = {
+    'imports_ms': {},
+    'artifacts_ms': {},
+    'ml_modules_imported_at_startup': [m for m in HEAVY_MODULES if m in sys.modules]
+}
+
+# Worker/thread budget from calibrate_cpu.py (or defaults and env overrides)
+cpu_settings = load_cpu_config()
+
+# Concurrency limit + bounded queue in front of the scoring routes
+prediction_admission = controller_from_env('prediction', default_concurrency=cpu_settings['admission_concurrency'],
+                                           default_queue=cpu_settings['admission_queue'])
+
+# Feature contributions per (model version, feature vector), see /explain
+contribution_cache = ContributionCache()
+EXPLAIN_MAX_BATCH = int(os.environ.get('EXPLAIN_MAX_BATCH', '1000'))
+
+# Streaming sketches of live inputs/predictions, compared with the training profile on /drift
+drift_monitor = monitor_from_env()
+
+# Primary bundle plus optional canary candidate (MODEL_CANDIDATE_DIR) and shadow (MODEL_SHADOW_DIR)
+model_registry = registry_from_env()
+
+# Per-worker booster copies used by the batch routes, see batch_booster()
+_batch_boosters = weakref.WeakKeyDictionary()
+
+# Lots accepted by one /storage/optimize call
+STORAGE_MAX_LOTS = int(os.environ.get('STORAGE_MAX_LOTS', '1000'))
+
+# Registered price alerts (SQLite store shared by the workers) and their notification sink
+alert_engine = engine_from_env()
+ALERTS_MAX_EVENTS = int(os.environ.get('ALERTS_MAX_EVENTS', '10000'))
+
+# Current mandi prices from data.gov.in (pooled session, coalesced lookups, daily-TTL SQLite store)
+price_lookup = lookup_from_env()
+
 # Correctly configure CORS *before* any routes
 # This handles the OPTIONS preflight requests automatically for all routes
 CORS(app, resources={
@@ -45,21 +103,97 @@ encoders = {}
 feature_columns = []
 model_metadata = {}
 
+# Opt-in request profiling and memory diagnostics
+init_profiling(app)
+register_memory_target('model', lambda: model)
+register_memory_target('encoders', lambda: encoders)
+register_memory_target('feature_columns', lambda: feature_columns)
+register_memory_target('model_metadata', lambda: model_metadata)
+register_memory_target('explain_cache', lambda: contribution_cache.entries())
+register_memory_target('drift_sketches', lambda: (drift_monitor.features, drift_monitor.crops))
+register_memory_target('alert_index', lambda: (alert_engine.indexes, alert_engine.alerts))
+register_memory_target('extra_model_bundles', lambda: {
+    role: bundle for role, bundle in model_registry.bundles.items() if role != 'primary'
+})
+
+startup_report['app_import_ms'] = round((time.perf_counter() - _import_started) * 1000, 2)
+
 def load_models_on_demand():
     """Load ML models when needed"""
     global models_loaded
     
     if not models_loaded:
-        logger.info("🔄 Loading ML models on demand...")
-        if load_ml_models():
-            models_loaded = True
-            logger.info("✅ ML models loaded successfully")
-        else:
-            models_loaded = False
-            logger.error("❌ Failed to load ML models")
+        with _model_load_lock:
+            if models_loaded:
+                return models_loaded
+            logger.info("🔄 Loading ML models on demand...")
+            with profile_stage('load_models'):
+                loaded = load_ml_models()
+            if loaded:
+                models_loaded = True
+                logger.info("✅ ML models loaded successfully")
+            else:
+                models_loaded = False
+                logger.error("❌ Failed to load ML models")
     
     return models_loaded
 
+def warm_models_in_background():
+    """Load the models off the request path so liveness checks answer immediately"""
+    if models_loaded or os.environ.get('WARM_MODELS_ON_START', '1') == '0':
+        return None
+    thread = threading.Thread(target=load_models_on_demand, name='model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+def import_ml_modules():
+    """Import the heavy ML libraries, timing each one for the startup report"""
+    for name in HEAVY_MODULES:
+        if name in sys.modules:
+            startup_report['imports_ms'].setdefault(name, 0.0)
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Optional module {name} not available: {e}")
+            continue
+        startup_report['imports_ms'][name] = round((time.perf_counter() - start) * 1000, 2)
+
+def preload_models():
+    """Load the model bundle in the gunicorn master so forked workers share its pages"""
+    global models_preloaded
+
+    if not load_models_on_demand():
+        return False
+
+    # Nothing may write to the shared bundles after fork, or pages get copied per worker
+    for bundle in model_registry.bundles.values():
+        for encoder in bundle['encoders'].values():
+            if hasattr(encoder, 'classes_'):
+                encoder.classes_.setflags(write=False)
+
+    # Move everything allocated so far out of the collector's reach, otherwise
+    # the first GC pass in each worker touches every object header and copies it
+    gc.collect()
+    gc.freeze()
+    models_preloaded = True
+    logger.info(f"✅ Models preloaded in master process {os.getpid()}")
+    return True
+
+def post_fork_setup(nthread=None):
+    """Per-worker setup after forking from a preloaded master"""
+    # The master never ran a prediction, so no OpenMP pool was inherited; size the
+    # worker's pool explicitly to avoid workers x cores threads competing for CPUs
+    if model is not None and nthread:
+        model.set_params(n_jobs=int(nthread))
+        candidate = model_registry.get('candidate')
+        if candidate:
+            candidate['model'].set_params(n_jobs=int(nthread))
+    if not models_preloaded:
+        warm_models_in_background()
+    logger.info(f"👷 Worker {os.getpid()} ready (preloaded: {models_preloaded}, nthread: {nthread or 'default'})")
+
 def load_ml_models():
     """Load ML models and related components with comprehensive error handling"""
     global model, encoders, feature_columns, model_metadata
@@ -78,17 +212,21 @@ def load_ml_models():
         model_files = os.listdir('models')
         logger.info(f"Model files found: {model_files}")
         
-        # Load all components
+        import_ml_modules()
+        
+        # Load all components (from one resolved directory if models/ is a symlink being swapped)
+        models_dir = os.path.realpath('models')
         components = {
-            'metadata': 'models/model_metadata.pkl',
-            'feature_columns': 'models/feature_columns.pkl',
-            'encoders': 'models/encoders.pkl',
-            'model': 'models/market_price_model.pkl'
+            'metadata': os.path.join(models_dir, 'model_metadata.pkl'),
+            'feature_columns': os.path.join(models_dir, 'feature_columns.pkl'),
+            'encoders': os.path.join(models_dir, 'encoders.pkl'),
+            'model': os.path.join(models_dir, 'market_price_model.pkl')
         }
 
         for name, path in components.items():
             try:
                 if os.path.exists(path):
+                    start = time.perf_counter()
                     with open(path, 'rb') as f:
                         if name == 'metadata':
                             model_metadata = pickle.load(f)
@@ -98,6 +236,7 @@ def load_ml_models():
                             encoders = pickle.load(f)
                         elif name == 'model':
                             model = pickle.load(f)
+                    startup_report['artifacts_ms'][name] = round((time.perf_counter() - start) * 1000, 2)
                     logger.info(f"✅ {name.replace('_', ' ').title()} loaded successfully")
                 else:
                     logger.error(f"❌ {name.replace('_', ' ').title()} file not found at: {path}")
@@ -108,6 +247,17 @@ def load_ml_models():
         
         # Verify all components are loaded
         if model and encoders and feature_columns and model_metadata:
+            model.set_params(n_jobs=cpu_settings['xgb_nthread'])
+            drift_monitor.set_profile(model_metadata.get('training_profile'))
+            model_registry.register('primary', {
+                'model': model,
+                'encoders': encoders,
+                'feature_columns': feature_columns,
+                'metadata': model_metadata
+            }, 'models')
+            load_extra_bundles()
+            startup_report['pandas_imported'] = 'pandas' in sys.modules
+            startup_report['models_ready_s'] = round(time.perf_counter() - _import_started, 3)
             logger.info("✅ All ML components loaded successfully!")
             return True
         else:
@@ -119,16 +269,22 @@ def load_ml_models():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return False
 
-def encode_categorical_features(input_data):
-    """Encode categorical features using the trained encoders"""
+def encode_categorical_features(input_data, fallbacks=None, encoder_map=None):
+    """Encode categorical features using the trained encoders
+    
+    Unseen values are appended to fallbacks as (column, value) when a list is given.
+    encoder_map defaults to the primary bundle's encoders.
+    """
     encoded_data = input_data.copy()
     
-    for column, encoder in encoders.items():
+    for column, encoder in (encoders if encoder_map is None else encoder_map).items():
         if column in encoded_data:
             try:
                 if encoded_data[column] in encoder.classes_:
                     encoded_data[column] = encoder.transform([encoded_data[column]])[0]
                 else:
+                    if fallbacks is not None:
+                        fallbacks.append((column, encoded_data[column]))
                     # Use most common category for unseen values (the first class)
                     encoded_data[column] = encoder.transform([encoder.classes_[0]])[0]
             except Exception as e:
@@ -160,11 +316,10 @@ def create_features(input_data):
     features['is_weekend'] = 1 if current_date.weekday() >= 5 else 0
     
     # Seasonal features
-    # Ensure numpy is imported for these functions
-    features['month_sin'] = np.sin(2 * np.pi * current_date.month / 12)
-    features['month_cos'] = np.cos(2 * np.pi * current_date.month / 12)
-    features['day_sin'] = np.sin(2 * np.pi * current_date.day / 31)
-    features['day_cos'] = np.cos(2 * np.pi * current_date.day / 31)
+    features['month_sin'] = math.sin(2 * math.pi * current_date.month / 12)
+    features['month_cos'] = math.cos(2 * math.pi * current_date.month / 12)
+    features['day_sin'] = math.sin(2 * math.pi * current_date.day / 31)
+    features['day_cos'] = math.cos(2 * math.pi * current_date.day / 31)
     features['year_progress'] = current_date.timetuple().tm_yday / 365
     
     # Historical price features (simulated based on current price)
@@ -222,19 +377,121 @@ def create_features(input_data):
     
     return features
 
+def build_feature_vector(input_data, fallbacks=None, bundle=None):
+    """Create the model's feature vector (in feature_columns order) for one input"""
+    with profile_stage('create_features'):
+        features = create_features(input_data)
+    with profile_stage('encode_categorical_features'):
+        encoded_features = encode_categorical_features(features, fallbacks, bundle['encoders'] if bundle else None)
+    
+    # Create feature vector in the correct order
+    feature_vector = []
+    for col in (bundle['feature_columns'] if bundle else feature_columns):
+        feature_vector.append(encoded_features.get(col, 0)) # Use .get with a default value
+    return feature_vector
+
+def load_extra_bundles():
+    """Load the optional canary candidate and shadow bundles next to the primary"""
+    for role, env_name, nthread in (('candidate', 'MODEL_CANDIDATE_DIR', cpu_settings['xgb_nthread']),
+                                    ('shadow', 'MODEL_SHADOW_DIR', 1)):
+        models_dir = os.environ.get(env_name)
+        if not models_dir:
+            continue
+        try:
+            bundle = model_registry.load(role, models_dir, nthread=nthread)
+            if bundle is None:
+                logger.error(f"❌ {role.title()} bundle not found in {models_dir}")
+            else:
+                logger.info(f"✅ {role.title()} model {bundle['version']} loaded from {models_dir}")
+        except Exception as e:
+            # The primary keeps serving if an extra bundle is broken
+            logger.error(f"❌ Failed to load {role} bundle from {models_dir}: {e}")
+
+def batch_booster(batch_model):
+    """This worker's copy of the model's booster sized for batch calls (XGB_BATCH_NTHREAD)
+
+    Single-row predictions keep using the shared model with xgb_nthread; changing
+    nthread on it would race them, so batch routes predict through a private copy.
+    """
+    booster = batch_model.get_booster()
+    nthread = cpu_settings['batch_nthread']
+    if not nthread or nthread == batch_model.get_params().get('n_jobs'):
+        return booster
+    cached = _batch_boosters.get(batch_model)
+    if cached is None or cached[0] != os.getpid():
+        copy = booster.copy()
+        copy.set_param({'nthread': int(nthread)})
+        cached = _batch_boosters[batch_model] = (os.getpid(), copy)
+    return cached[1]
+
+def predict_batch(batch_model, vectors):
+    """Predictions for many feature vectors in one call with the batch thread count"""
+    booster = batch_booster(batch_model)
+    if booster is batch_model.get_booster():
+        return batch_model.predict(vectors)
+    import numpy as np
+    return booster.inplace_predict(np.asarray(vectors, dtype=np.float32))
+
+def score_bundle(bundle, input_data):
+    """Predict one input with any registered bundle (used for shadow scoring)"""
+    feature_vector = build_feature_vector(input_data, bundle=bundle)
+    return float(bundle['model'].predict([feature_vector])[0])
+
+model_registry.scorer = score_bundle
+
+def number_field(data, field, default=None, integer=False, minimum=None):
+    """data[field] as a finite number (default when absent); raises ValueError with a message for a 400"""
+    value = data.get(field)
+    if value is None:
+        return default
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+        if not math.isfinite(number) or (integer and not number.is_integer()):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be {'an integer' if integer else 'a number'}")
+    if minimum is not None and number < minimum:
+        raise ValueError(f'{field} must be at least {minimum}')
+    return int(number) if integer else number
+
+def date_field(data, field='currentDate'):
+    """data[field] as a YYYY-MM-DD string (None when absent); raises ValueError with a message for a 400"""
+    value = data.get(field)
+    if value is None:
+        return None
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a date in YYYY-MM-DD format')
+    return value
+
+def price_horizons(prediction, current_price):
+    """Next week/month prices extrapolated from the next-day prediction"""
+    price_change_pct = (prediction - current_price) / current_price * 100 if current_price > 0 else 0.0
+    return (prediction * (1 + price_change_pct / 100 * 0.5),
+            prediction * (1 + price_change_pct / 100))
+
 def predict_market_price(input_data):
     """Make prediction using the trained XGBoost model"""
     try:
-        features = create_features(input_data)
-        encoded_features = encode_categorical_features(features)
+        role = model_registry.route(input_data)
+        bundle = model_registry.get(role) or model_registry.get('primary')
+        metadata = bundle['metadata']
         
-        # Create feature vector in the correct order
-        feature_vector = []
-        for col in feature_columns:
-            feature_vector.append(encoded_features.get(col, 0)) # Use .get with a default value
+        start = time.perf_counter()
+        fallbacks = []
+        feature_vector = build_feature_vector(input_data, fallbacks, bundle)
         
-        prediction = float(model.predict([feature_vector])[0])
-        mape = model_metadata.get('performance_metrics', {}).get('mape', 12.54)
+        with profile_stage('model_predict'):
+            prediction = float(bundle['model'].predict([feature_vector])[0])
+        model_registry.record_served(role, (time.perf_counter() - start) * 1000)
+        with profile_stage('drift_observe'):
+            drift_monitor.observe(dict(zip(bundle['feature_columns'], feature_vector)),
+                                  input_data.get('crop', 'Wheat'), prediction, fallbacks)
+        model_registry.submit(input_data, role, prediction)
+        mape = metadata.get('performance_metrics', {}).get('mape', 12.54)
         uncertainty = float(prediction * (mape / 100))
         confidence = 0.95
         margin = 1.96 * uncertainty
@@ -260,14 +517,15 @@ def predict_market_price(input_data):
         else: risk_level = 'high'
         
         expected_gain = float(price_change * 0.8) if action in ['hold', 'store'] else 0.0
+        next_week, next_month = price_horizons(prediction, current_price)
         
-        r2_score = model_metadata.get('performance_metrics', {}).get('r2', 0.8953)
+        r2_score = metadata.get('performance_metrics', {}).get('r2', 0.8953)
         model_accuracy = f"{r2_score * 100:.2f}%" if r2_score is not None else "89.53%"
         
         return {
             'nextDayPrice': float(round(prediction, 2)),
-            'nextWeekPrice': float(round(prediction * (1 + price_change_pct/100 * 0.5), 2)),
-            'nextMonthPrice': float(round(prediction * (1 + price_change_pct/100), 2)),
+            'nextWeekPrice': float(round(next_week, 2)),
+            'nextMonthPrice': float(round(next_month, 2)),
             'predictionConfidence': float(confidence),
             'priceRange': {
                 'min': float(round(prediction - margin, 2)),
@@ -281,13 +539,14 @@ def predict_market_price(input_data):
             'reasoning': reasoning,
             'expectedGain': float(round(expected_gain, 2)),
             'riskLevel': risk_level,
-            'modelVersion': model_metadata.get('version', '2.0_fixed'),
-            'trainingDate': model_metadata.get('training_date', '2025-03-12'),
+            'modelVersion': metadata.get('version', '2.0_fixed'),
+            'servedBy': role,
+            'trainingDate': metadata.get('training_date', '2025-03-12'),
             'lastUpdated': datetime.now().isoformat(),
             'modelAccuracy': model_accuracy,
-            'mae': float(model_metadata.get('performance_metrics', {}).get('mae', 256.39)),
-            'rmse': float(model_metadata.get('performance_metrics', {}).get('rmse', 446.96)),
-            'mape': float(model_metadata.get('performance_metrics', {}).get('mape', 12.54))
+            'mae': float(metadata.get('performance_metrics', {}).get('mae', 256.39)),
+            'rmse': float(metadata.get('performance_metrics', {}).get('rmse', 446.96)),
+            'mape': float(metadata.get('performance_metrics', {}).get('mape', 12.54))
         }
     except Exception as e:
         logger.error(f"Prediction error: {e}")
@@ -329,7 +588,41 @@ def health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+def admin_forbidden(env_name):
+    """403 response unless X-Admin-Token matches the token in env_name (unset tokens deny everyone)"""
+    token = os.environ.get(env_name)
+    if not token or request.headers.get('X-Admin-Token') != token:
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+def with_live_price(view):
+    """Look up the current mandi price for requests that ask for it with livePrice
+
+    Applied inside admission control: a slow upstream holds a prediction slot, so
+    live-price requests are bounded by the limiter and never take the worker
+    threads kept free for /ping and /health.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and data.get('livePrice'):
+            crop, mandi = data.get('crop'), data.get('mandi')
+            if not isinstance(crop, str) or not crop.strip() or not isinstance(mandi, str) or not mandi.strip():
+                return jsonify({'error': "'crop' and 'mandi' are required for livePrice"}), 400
+            try:
+                with profile_stage('price_lookup'):
+                    g.price_data = price_lookup.lookup(crop, mandi, data.get('district'),
+                                                       data.get('state', 'Punjab'))
+            except PriceNotFound as e:
+                return jsonify({'error': str(e), 'status': 'price_not_found'}), 404
+            except PriceLookupError as e:
+                return jsonify({'error': str(e), 'status': 'price_unavailable'}), 502
+        return view(*args, **kwargs)
+    return wrapper
+
 @app.route('/predict', methods=['POST'])
+@admission_controlled(prediction_admission)
+@with_live_price
 def predict():
     """Handle POST requests for prediction"""
     if not models_loaded:
@@ -345,15 +638,285 @@ def predict():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
+        price_data = g.get('price_data')
+        if price_data is not None:
+            data = dict(data, currentPrice=price_data['price'])
+        
         # Use your custom prediction function
         result = predict_market_price(data)
+        if price_data is not None:
+            result['currentPrice'] = price_data['price']
+            result['currentPriceData'] = price_data
         
-        return jsonify(result)
+        with profile_stage('serialize'):
+            return jsonify(result)
         
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+@app.route('/explain', methods=['POST'])
+@admission_controlled(prediction_admission)
+def explain():
+    """Per-feature contributions for one input or a batch ({'inputs': [...]})"""
+    if not models_loaded:
+        logger.warning("Models not loaded at explain time. Attempting on-demand load...")
+        if not load_models_on_demand():
+            return jsonify({
+                'error': 'ML models not available. Please try again later.',
+                'status': 'model_not_loaded'
+            }), 503
+    
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        inputs = data.get('inputs', [data]) if isinstance(data, dict) else data
+        if not isinstance(inputs, list) or not inputs:
+            return jsonify({'error': "'inputs' must be a non-empty list"}), 400
+        if len(inputs) > EXPLAIN_MAX_BATCH:
+            return jsonify({'error': f'At most {EXPLAIN_MAX_BATCH} inputs per request'}), 400
+        if not all(isinstance(item, dict) for item in inputs):
+            return jsonify({'error': 'Each input must be an object'}), 400
+        try:
+            options = request.args if 'top' in request.args else (data if isinstance(data, dict) else {})
+            top = number_field(options, 'top', integer=True, minimum=1)
+            for item in inputs:
+                date_field(item)
+            inputs = [dict(item, currentPrice=number_field(item, 'currentPrice', default=2000)) for item in inputs]
+        except ValueError as e:
+            return jsonify({'error': f'Invalid input: {e}'}), 400
+        
+        # Explain each input with the bundle that would serve it (canary routing)
+        by_role = {}
+        for index, item in enumerate(inputs):
+            by_role.setdefault(model_registry.route(item), []).append(index)
+        explanations = [None] * len(inputs)
+        versions = {}
+        cached = computed = 0
+        for role, indexes in by_role.items():
+            bundle = model_registry.get(role) or model_registry.get('primary')
+            with profile_stage('build_feature_vectors'):
+                vectors = [build_feature_vector(inputs[i], bundle=bundle) for i in indexes]
+            with profile_stage('contributions'):
+                rows, role_cached, role_computed = explain_batch(batch_booster(bundle['model']), bundle['version'],
+                                                                 vectors, bundle['feature_columns'], contribution_cache)
+            role_top = min(top, len(bundle['feature_columns'])) if top else None
+            for index, row, vector in zip(indexes, rows, vectors):
+                explanations[index] = dict(format_explanation(row, bundle['feature_columns'], vector, role_top),
+                                           servedBy=role, modelVersion=bundle['version'])
+            versions[role] = bundle['version']
+            cached += role_cached
+            computed += role_computed
+        
+        with profile_stage('serialize'):
+            return jsonify({
+                'explanations': explanations,
+                'modelVersion': next(iter(versions.values())) if len(versions) == 1 else None,
+                'modelVersions': versions,
+                'count': len(explanations),
+                'cached': cached,
+                'computed': computed
+            })
+        
+    except Exception as e:
+        logger.error(f"Explain error: {e}")
+        return jsonify({'error': f'Explanation failed: {str(e)}'}), 500
+
+@app.route('/storage/optimize', methods=['POST'])
+@admission_controlled(prediction_admission)
+def storage_optimize():
+    """Optimal hold/sell day and net gain for a batch of stored lots"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('lots'), list) or not data['lots']:
+            return jsonify({'error': "'lots' must be a non-empty list"}), 400
+        lots = data['lots']
+        if len(lots) > STORAGE_MAX_LOTS:
+            return jsonify({'error': f'At most {STORAGE_MAX_LOTS} lots per request'}), 400
+        try:
+            horizon = number_field(data, 'horizonDays', DEFAULT_HORIZON_DAYS, integer=True)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid input: {e}'}), 400
+        
+        forecasts = [None] * len(lots)
+        current_prices = [None] * len(lots)
+        to_predict = []
+        for i, lot in enumerate(lots):
+            try:
+                if not isinstance(lot, dict):
+                    raise ValueError('must be an object')
+                current_prices[i] = lot_number(lot, 'currentPrice', 0)
+                if current_prices[i] <= 0:
+                    raise ValueError('currentPrice must be positive')
+                lot_number(lot, 'horizonDays', horizon, integer=True)
+                date_field(lot)
+                forecast = lot.get('forecast')
+                if forecast:
+                    if not isinstance(forecast, list):
+                        raise ValueError('forecast must be a list of daily prices')
+                    # Caller-supplied daily prices for day 1, 2, ...
+                    forecasts[i] = [current_prices[i]] + [as_number(p, 'each forecast price') for p in forecast]
+                else:
+                    to_predict.append(i)
+            except ValueError as e:
+                return jsonify({'error': f'Lot {i}: {e}'}), 400
+        
+        if to_predict:
+            if not models_loaded and not load_models_on_demand():
+                return jsonify({
+                    'error': 'ML models not available. Please try again later.',
+                    'status': 'model_not_loaded'
+                }), 503
+            # One model call for every lot without a forecast
+            with profile_stage('build_feature_vectors'):
+                vectors = [build_feature_vector(dict(lots[i], currentPrice=current_prices[i])) for i in to_predict]
+            with profile_stage('model_predict'):
+                predictions = predict_batch(model, vectors)
+            for i, prediction in zip(to_predict, predictions):
+                current_price = current_prices[i]
+                next_week, next_month = price_horizons(float(prediction), current_price)
+                lot_horizon = lot_number(lots[i], 'horizonDays', horizon, integer=True)
+                forecasts[i] = forecast_from_prediction(current_price, float(prediction), next_week, next_month,
+                                                        max(0, min(lot_horizon, MAX_HORIZON_DAYS)))
+        
+        with profile_stage('optimize'):
+            try:
+                plans = optimize_lots(lots, forecasts, default_horizon=horizon,
+                                      include_curve=bool(data.get('includeCurve')))
+            except ValueError as e:
+                return jsonify({'error': f'Invalid lot: {e}'}), 400
+        
+        return jsonify({
+            'plans': plans,
+            'count': len(plans),
+            'modelForecasts': len(to_predict),
+            'totalExpectedNetGain': round(sum(plan['expectedNetGain'] for plan in plans), 2),
+            'modelVersion': model_metadata.get('version', '2.0_fixed') if to_predict else None
+        })
+        
+    except Exception as e:
+        logger.error(f"Storage optimization error: {e}")
+        return jsonify({'error': f'Storage optimization failed: {str(e)}'}), 500
+
+@app.route('/alerts', methods=['POST'])
+def register_alerts():
+    """Register one alert or a batch ({'alerts': [...]})"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        items = data.get('alerts', [data])
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': "'alerts' must be a non-empty list"}), 400
+        try:
+            alerts = [parse_alert(item) for item in items]
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid alert: {e}'}), 400
+        
+        ids = alert_engine.register(alerts)
+        return jsonify({'ids': ids, 'count': len(ids)})
+    except Exception as e:
+        logger.error(f"Alert registration error: {e}")
+        return jsonify({'error': f'Failed to register alerts: {str(e)}'}), 500
+
+@app.route('/alerts/<alert_id>', methods=['DELETE'])
+def delete_alert(alert_id):
+    """Deactivate one of the caller's alerts (userId query parameter or X-User-Id header)"""
+    try:
+        user_id = request.args.get('userId') or request.headers.get('X-User-Id')
+        if not user_id:
+            return jsonify({'error': 'userId is required'}), 400
+        # Another user's alert looks the same as a missing one
+        removed = alert_engine.remove([alert_id], user_id)
+        if not removed:
+            return jsonify({'error': 'Alert not found'}), 404
+        return jsonify({'id': alert_id, 'status': 'removed'})
+    except Exception as e:
+        logger.error(f"Alert removal error: {e}")
+        return jsonify({'error': f'Failed to remove alert: {str(e)}'}), 500
+
+@app.route('/alerts/evaluate', methods=['POST'])
+def evaluate_alerts():
+    """Match new prices/forecasts against every alert and write the notifications (needs ALERTS_ADMIN_TOKEN)"""
+    forbidden = admin_forbidden('ALERTS_ADMIN_TOKEN')
+    if forbidden:
+        return forbidden
+    
+    try:
+        data = request.get_json(silent=True)
+        events = data.get('events') if isinstance(data, dict) else None
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': "'events' must be a non-empty list"}), 400
+        if len(events) > ALERTS_MAX_EVENTS:
+            return jsonify({'error': f'At most {ALERTS_MAX_EVENTS} events per request'}), 400
+        parsed = []
+        for i, event in enumerate(events):
+            try:
+                parsed.append(parse_event(event))
+                date_field(event)
+            except ValueError as e:
+                return jsonify({'error': f'Event {i}: {e}'}), 400
+        events = parsed
+        
+        # Forecasts are computed once per event, never per alert, in a single model call
+        to_forecast = [event for event in events if data.get('predict') and
+                       event.get('forecast') is None and event.get('price') is not None]
+        if to_forecast:
+            if not models_loaded and not load_models_on_demand():
+                return jsonify({
+                    'error': 'ML models not available. Please try again later.',
+                    'status': 'model_not_loaded'
+                }), 503
+            vectors = [build_feature_vector(dict(event, currentPrice=event['price'])) for event in to_forecast]
+            for event, prediction in zip(to_forecast, predict_batch(model, vectors)):
+                event['forecast'] = float(prediction)
+        
+        stats = alert_engine.evaluate(events)
+        stats['forecasts_computed'] = len(to_forecast)
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Alert evaluation error: {e}")
+        return jsonify({'error': f'Alert evaluation failed: {str(e)}'}), 500
+
+@app.route('/alerts/stats', methods=['GET'])
+def alert_stats():
+    """Index size and evaluation timing/fan-out of this worker's alert engine"""
+    try:
+        return jsonify(alert_engine.stats())
+    except Exception as e:
+        logger.error(f"Alert stats error: {e}")
+        return jsonify({'error': f'Failed to get alert stats: {str(e)}'}), 500
+
+
+@app.route('/prices/current', methods=['GET'])
+def current_price():
+    """Latest mandi price for ?crop=&mandi=[&district=&state=], served from cache when still valid"""
+    crop = request.args.get('crop')
+    mandi = request.args.get('mandi') or request.args.get('market')
+    if not crop or not mandi:
+        return jsonify({'error': "'crop' and 'mandi' are required"}), 400
+    try:
+        return jsonify(price_lookup.lookup(crop, mandi, request.args.get('district'),
+                                           request.args.get('state', 'Punjab')))
+    except PriceNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except PriceLookupError as e:
+        return jsonify({'error': str(e)}), 502
+    except Exception as e:
+        logger.error(f"Price lookup error: {e}")
+        return jsonify({'error': f'Price lookup failed: {str(e)}'}), 500
+
+@app.route('/prices/stats', methods=['GET'])
+def price_lookup_stats():
+    """Cache hit/coalescing counts and upstream latency of this worker's price lookups"""
+    try:
+        return jsonify(price_lookup.stats())
+    except Exception as e:
+        logger.error(f"Price lookup stats error: {e}")
+        return jsonify({'error': f'Failed to get price lookup stats: {str(e)}'}), 500
+
 
 @app.route('/model-info', methods=['GET'])
 def model_info():
@@ -378,6 +941,10 @@ def model_info():
             'accuracy': f"{model_metadata.get('performance_metrics', {}).get('r2', 0.85) * 100:.2f}%",
             'mae': model_metadata.get('performance_metrics', {}).get('mae', 250),
             'rmse': model_metadata.get('performance_metrics', {}).get('rmse', 450),
+            'backtest': {
+                key: model_metadata['backtest_metrics'].get(key)
+                for key in ('mae', 'rmse', 'mape', 'r2', 'series_count', 'fold_days', 'generated_at')
+            } if model_metadata.get('backtest_metrics') else None,
             'status': 'loaded'
         })
     except Exception as e:
@@ -416,6 +983,8 @@ def debug_info():
             'metadata_loaded': len(model_metadata) > 0 if model_metadata else False,
             'current_directory': os.getcwd(),
             'models_directory_exists': os.path.exists('models'),
+            'models_preloaded': models_preloaded,
+            'pid': os.getpid(),
             'python_version': f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
         }
         
@@ -424,6 +993,13 @@ def debug_info():
         else:
              debug_info_dict['models_directory_contents'] = []
 
+        debug_info_dict['startup_report'] = startup_report
+        debug_info_dict['cpu_config'] = cpu_settings
+        debug_info_dict['admission'] = prediction_admission.stats()
+        debug_info_dict['explain_cache'] = contribution_cache.stats()
+        if model is not None:
+            debug_info_dict['effective_xgb_nthread'] = model.get_params().get('n_jobs')
+
         if model_metadata:
             debug_info_dict['metadata_keys'] = list(model_metadata.keys())
             debug_info_dict['performance_metrics'] = model_metadata.get('performance_metrics', {})
@@ -433,6 +1009,83 @@ def debug_info():
         logger.error(f"Debug info error: {e}")
         return jsonify({'error': f'Failed to get debug info: {str(e)}'}), 500
 
+@app.route('/debug/process-memory', methods=['GET'])
+def debug_process_memory():
+    """Report unique (USS) vs shared (PSS) memory of this worker and its siblings"""
+    try:
+        if 'gunicorn' in request.environ.get('SERVER_SOFTWARE', ''):
+            report = worker_memory_report()
+        else:
+            report = {'current_worker': process_memory(), 'workers': []}
+        report['models_preloaded'] = models_preloaded
+        report['gc_frozen_objects'] = gc.get_freeze_count()
+        return jsonify(report)
+    except Exception as e:
+        logger.error(f"Process memory error: {e}")
+        return jsonify({'error': f'Failed to get process memory: {str(e)}'}), 500
+
+@app.route('/debug/admission', methods=['GET'])
+def debug_admission():
+    """Queue depth and rejection counters of the prediction admission control"""
+    return jsonify(prediction_admission.stats())
+
+@app.route('/drift', methods=['GET'])
+def drift_report():
+    """Drift scores of this worker's live traffic against the training profile"""
+    try:
+        top = request.args.get('top_unseen', 10, type=int)
+        return jsonify(drift_monitor.report(top_unseen=top))
+    except Exception as e:
+        logger.error(f"Drift report error: {e}")
+        return jsonify({'error': f'Failed to get drift report: {str(e)}'}), 500
+
+@app.route('/drift/reset', methods=['POST'])
+def drift_reset():
+    """Start a new observation window, keeping the training profile (needs MODEL_ADMIN_TOKEN)"""
+    forbidden = admin_forbidden('MODEL_ADMIN_TOKEN')
+    if forbidden:
+        return forbidden
+    drift_monitor.set_profile(drift_monitor.profile)
+    return jsonify({'status': 'reset', 'timestamp': datetime.now().isoformat()})
+
+@app.route('/models', methods=['GET'])
+def models_status():
+    """Registered model versions, canary routing and per-version latency/difference stats"""
+    try:
+        return jsonify(model_registry.stats())
+    except Exception as e:
+        logger.error(f"Model registry error: {e}")
+        return jsonify({'error': f'Failed to get model registry: {str(e)}'}), 500
+
+@app.route('/models/routing', methods=['POST'])
+def models_routing():
+    """Change the canary fraction/crops for every worker (needs MODEL_ADMIN_TOKEN)"""
+    forbidden = admin_forbidden('MODEL_ADMIN_TOKEN')
+    if forbidden:
+        return forbidden
+    
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        fraction = number_field(data, 'canaryFraction', minimum=0)
+        if fraction is not None and fraction > 1:
+            raise ValueError('canaryFraction must be at most 1')
+        crops = data.get('canaryCrops')
+        if crops is not None and (not isinstance(crops, list) or not all(isinstance(c, str) for c in crops)):
+            raise ValueError('canaryCrops must be a list of crop names')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input: {str(e)}'}), 400
+    
+    try:
+        model_registry.set_routing(fraction=fraction, crops=crops)
+        if data.get('resetStats'):
+            model_registry.reset_stats()
+        return jsonify(model_registry.stats()['routing'])
+    except Exception as e:
+        logger.error(f"Model routing error: {e}")
+        return jsonify({'error': f'Failed to change model routing: {str(e)}'}), 500
+
 
 @app.route('/')
 def root():
@@ -455,15 +1108,9 @@ def ping():
 
 
 if __name__ == '__main__':
-    # Initial model load on startup
-    if load_ml_models():
-        logger.info("Starting ML Market Prediction API...")
-        port = int(os.environ.get('PORT', 5000))
-        debug = os.environ.get('FLASK_ENV') == 'development'
-        app.run(host='0.0.0.0', port=port, debug=debug)
-    else:
-        logger.error("Failed to load model. API cannot start.")
-        # It's better to start the app but in a degraded state
-        port = int(os.environ.get('PORT', 5000))
-        debug = os.environ.get('FLASK_ENV') == 'development'
-        app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    # Serve /ping straight away and load the models in the background
+    warm_models_in_background()
+    logger.info("Starting ML Market Prediction API...")
+    port = int(os.environ.get('PORT', 5000))
+    debug = os.environ.get('FLASK_ENV') == 'development'
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Parallel walk-forward backtesting engine
+Evaluates a model bundle on consecutive forward windows (folds) of the
+history. Features are built once over the whole date-ordered stream (so
+cross-series features such as state_avg_price and crop_avg_price see every
+mandi), then the finished rows are sharded by (crop, mandi) and scored in a
+process pool, one vectorized batch per fold. Two ways to score:
+
+- retrain (default): evaluates the bundle's training recipe. For every fold a
+  model is trained from scratch, with the bundle's encoders, feature columns,
+  booster params and number of trees, on the rows whose label was observed
+  before the fold starts (train_incremental.train_booster with a cutoff).
+- bundle: scores the bundle's own booster, only on folds that start after its
+  training range (train_incremental.trained_until), so the shipped model is
+  what gets measured and its training rows never score it.
+
+Per-series error tables are written to disk and aggregate metrics are stored
+in model_metadata so retrains can be gated on them; --gate-against compares
+the candidate's and the baseline's own models on the folds after both
+training ranges.
+
+Usage:
+    python backtest.py --data history.csv
+    python backtest.py --data history.csv --folds 6 --fold-days 30 --write-metadata
+    python backtest.py --data history.csv --rounds 100      # fewer trees per fold model (faster)
+    python backtest.py --data history.csv --mode bundle     # score the bundle's own model
+    python backtest.py --data history.csv --models-dir models_candidate --gate-against models
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from history_features import HistoryFeatureBuilder, iter_history_chunks
+from train_incremental import MODEL_FILES, load_bundle, train_booster, trained_until, training_params
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Partial sums per (series, fold); metrics are derived from these so aggregation is exact
+SUM_COLUMNS = ['n', 'abs_err', 'sq_err', 'abs_pct_err', 'pct_n', 'err', 'y', 'y_sq']
+
+_feature_columns = None
+_fold_models = None
+
+
+def history_extent(paths, chunksize):
+    """(last date, row count) of the history"""
+    max_date, rows = None, 0
+    for chunk in iter_history_chunks(paths, chunksize):
+        rows += len(chunk)
+        chunk_max = chunk['date'].max()
+        max_date = chunk_max if max_date is None else max(max_date, chunk_max)
+    return max_date, rows
+
+
+def shard_features(paths, chunksize, encoders, feature_columns, start, shards, shard_dir):
+    """Build features over the full date-ordered history in one pass, then split the rows
+    dated from start on into per-shard pickles by (crop, mandi); returns the files per shard"""
+    builder = HistoryFeatureBuilder(encoders, feature_columns)
+    columns = ['crop', 'mandi', 'date', 'target'] + list(feature_columns)
+    files = {}
+    for part, chunk in enumerate(iter_history_chunks(paths, chunksize)):
+        rows = builder.process(chunk)
+        rows = rows.loc[rows['date'] >= start, columns]
+        if len(rows) == 0:
+            continue
+        shard_ids = pd.util.hash_pandas_object(rows[['crop', 'mandi']], index=False).to_numpy() % shards
+        for shard_id, shard_rows in rows.groupby(shard_ids):
+            path = os.path.join(shard_dir, f'shard_{int(shard_id):03d}_{part:05d}.pkl')
+            shard_rows.to_pickle(path)
+            files.setdefault(int(shard_id), []).append(path)
+    return [files[shard_id] for shard_id in sorted(files)]
+
+
+def fold_bounds(end_date, folds, fold_days):
+    """Consecutive forward windows ending at the last history date"""
+    end = pd.Timestamp(end_date).normalize() + timedelta(days=1)
+    starts = [end - timedelta(days=fold_days * (folds - k)) for k in range(folds)]
+    return [(start, start + timedelta(days=fold_days)) for start in starts]
+
+
+def train_fold(paths, chunksize, models_dir, train_end, rounds, nthread, output_path):
+    """Train one fold model on rows labelled before train_end; returns its training row count"""
+    bundle = load_bundle(models_dir)
+    params = training_params(bundle['model'], nthread=nthread)
+    rounds = rounds or bundle['model'].get_booster().num_boosted_rounds()
+    booster, iterator = train_booster(paths, chunksize, bundle['encoders'], bundle['feature_columns'],
+                                      params, rounds, train_end=pd.Timestamp(train_end))
+    booster.save_model(output_path)
+    return iterator.train_rows
+
+
+def train_fold_models(paths, models_dir, bounds, rounds, workers, chunksize, model_dir):
+    """Train every fold's model in parallel; returns {fold: model path} and {fold: training rows}"""
+    import xgboost as xgb
+    nthread = max(1, (os.cpu_count() or 1) // max(1, min(workers, len(bounds))))
+    paths_by_fold, train_rows = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(train_fold, paths, chunksize, models_dir, start, rounds, nthread,
+                        os.path.join(model_dir, f'fold_{fold:03d}.json')): fold
+            for fold, (start, _) in enumerate(bounds)
+        }
+        for future in as_completed(futures):
+            fold = futures[future]
+            try:
+                train_rows[fold] = future.result()
+            except xgb.core.XGBoostError:
+                # XGBoost refuses an empty training matrix: no label precedes this fold
+                print(f"⚠️  Fold {fold} ({bounds[fold][0].date()}) has no labelled rows before it, skipping it")
+                continue
+            paths_by_fold[fold] = os.path.join(model_dir, f'fold_{fold:03d}.json')
+    return paths_by_fold, train_rows
+
+
+def _init_worker(feature_columns, fold_model_paths):
+    """Load the fold models once per pool process"""
+    import xgboost as xgb
+    global _feature_columns, _fold_models
+    _feature_columns = list(feature_columns)
+    loaded, _fold_models = {}, {}
+    for fold, path in fold_model_paths.items():
+        if path not in loaded:
+            loaded[path] = xgb.Booster(model_file=path)
+            loaded[path].set_param({'nthread': 1})
+        _fold_models[fold] = loaded[path]
+
+
+def score_shard(paths, bounds):
+    """Score one shard's finished feature rows, every fold with its own model as one batch"""
+    rows = pd.concat([pd.read_pickle(path) for path in paths], ignore_index=True)
+
+    edges = np.array([b[0] for b in bounds] + [bounds[-1][1]], dtype='datetime64[ns]')
+    fold = np.searchsorted(edges, rows['date'].to_numpy(dtype='datetime64[ns]'), side='right') - 1
+    in_window = np.isin(fold, list(_fold_models))
+    rows = rows[in_window]
+    fold = fold[in_window]
+    if len(rows) == 0:
+        return pd.DataFrame(columns=['crop', 'mandi', 'fold'] + SUM_COLUMNS)
+
+    y = rows['target'].to_numpy(dtype=float)
+    features = rows[_feature_columns].to_numpy(dtype=np.float32)
+    pred = np.empty(len(rows), dtype=float)
+    for k in np.unique(fold):
+        mask = fold == k
+        pred[mask] = _fold_models[int(k)].inplace_predict(features[mask])
+    err = pred - y
+    nonzero = y != 0
+    pct = np.zeros_like(y)
+    pct[nonzero] = np.abs(err[nonzero] / y[nonzero])
+
+    sums = pd.DataFrame({
+        'crop': rows['crop'].to_numpy(),
+        'mandi': rows['mandi'].to_numpy(),
+        'fold': fold,
+        'n': 1,
+        'abs_err': np.abs(err),
+        'sq_err': err ** 2,
+        'abs_pct_err': pct,
+        'pct_n': nonzero.astype(int),
+        'err': err,
+        'y': y,
+        'y_sq': y ** 2
+    })
+    return sums.groupby(['crop', 'mandi', 'fold'], as_index=False)[SUM_COLUMNS].sum()
+
+
+def metrics_from_sums(sums):
+    """MAE/RMSE/MAPE/R2/bias from partial sums (Series or DataFrame rows)"""
+    n = sums['n']
+    ss_tot = sums['y_sq'] - sums['y'] ** 2 / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'n': n,
+            'mae': sums['abs_err'] / n,
+            'rmse': np.sqrt(sums['sq_err'] / n),
+            'mape': np.where(sums['pct_n'] > 0, sums['abs_pct_err'] / np.maximum(sums['pct_n'], 1) * 100, np.nan),
+            'r2': np.where(ss_tot > 0, 1 - sums['sq_err'] / ss_tot, np.nan),
+            'bias': sums['err'] / n
+        }
+
+
+def summarize(table, bounds):
+    """Aggregate partial sums into overall, per-fold and per-crop metrics"""
+    def as_dict(sums):
+        metrics = metrics_from_sums(sums)
+        return {key: (None if pd.isna(value) else float(value)) for key, value in metrics.items()}
+
+    total = table[SUM_COLUMNS].sum()
+    per_fold = table.groupby('fold')[SUM_COLUMNS].sum()
+    per_crop = table.groupby('crop')[SUM_COLUMNS].sum()
+    summary = as_dict(total)
+    summary['folds'] = [
+        {'fold': int(f), 'start': str(bounds[int(f)][0].date()), 'end': str(bounds[int(f)][1].date()),
+         **as_dict(per_fold.loc[f])}
+        for f in per_fold.index
+    ]
+    summary['by_crop'] = {crop: as_dict(per_crop.loc[crop]) for crop in per_crop.index}
+    summary['series_count'] = int(table.groupby(['crop', 'mandi']).ngroups)
+    return summary
+
+
+def bundle_fold_models(bundle, bounds, scored_from, model_dir):
+    """Map every fold starting on or after scored_from to the bundle's own booster"""
+    path = os.path.join(model_dir, 'bundle.json')
+    bundle['model'].get_booster().save_model(path)
+    return {fold: path for fold, (start, _) in enumerate(bounds) if start >= scored_from}
+
+
+def run_backtest(paths, models_dir, folds, fold_days, workers, shards, chunksize, rounds=None,
+                 mode='retrain', scored_from=None):
+    """Score the folds out-of-sample in parallel and return (partial sums table, summary, fold bounds)
+
+    mode 'retrain' trains a model per fold; mode 'bundle' scores the bundle's own booster
+    on the folds starting on or after scored_from (default: the end of its training range).
+    """
+    bundle = load_bundle(models_dir)
+    if bundle is None:
+        raise ValueError(f'No model bundle in {models_dir}')
+    max_date, rows = history_extent(paths, chunksize)
+    if max_date is None:
+        raise ValueError('No history rows found')
+    bounds = fold_bounds(max_date, folds, fold_days)
+
+    with tempfile.TemporaryDirectory(prefix='backtest-') as work_dir:
+        if mode == 'bundle':
+            if scored_from is None:
+                scored_from = trained_until(bundle['metadata'])
+            if scored_from is None:
+                raise ValueError(f'Training range of {models_dir} is unknown; pass scored_from')
+            fold_model_paths = bundle_fold_models(bundle, bounds, pd.Timestamp(scored_from), work_dir)
+            train_rows = {}
+            if not fold_model_paths:
+                raise ValueError(f'No fold starts after the training range of {models_dir} '
+                                 f'({pd.Timestamp(scored_from).date()}); backtest on newer history')
+        else:
+            fold_model_paths, train_rows = train_fold_models(paths, models_dir, bounds, rounds, workers,
+                                                             chunksize, work_dir)
+            if not fold_model_paths:
+                raise ValueError('No fold has training data before it; use fewer or shorter folds')
+
+        first_scored = min(bounds[fold][0] for fold in fold_model_paths)
+        shard_files = shard_features(paths, chunksize, bundle['encoders'], bundle['feature_columns'],
+                                     first_scored, shards, work_dir)
+
+        parts = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(bundle['feature_columns'], fold_model_paths)) as pool:
+            futures = [pool.submit(score_shard, files, bounds) for files in shard_files]
+            for future in as_completed(futures):
+                parts.append(future.result())
+
+    if not parts:
+        raise ValueError('No labelled rows in the scored folds')
+    table = pd.concat(parts, ignore_index=True)
+    summary = summarize(table, bounds)
+    for fold in summary['folds']:
+        fold['train_rows'] = train_rows.get(fold['fold'])
+    if mode == 'bundle':
+        summary['method'] = 'walk-forward, bundle model after its training range'
+        summary['scored_from'] = str(pd.Timestamp(scored_from).date())
+    else:
+        summary['method'] = 'walk-forward, retrained per fold'
+    summary['history_rows'] = rows
+    return table, summary, bounds
+
+
+def series_table(table, bounds):
+    """Per (crop, mandi, fold) error table, plus an 'all' row per series"""
+    per_fold = table.copy()
+    overall = table.groupby(['crop', 'mandi'], as_index=False)[SUM_COLUMNS].sum()
+    overall['fold'] = -1
+    combined = pd.concat([per_fold, overall], ignore_index=True)
+    metrics = metrics_from_sums(combined)
+    result = combined[['crop', 'mandi', 'fold']].copy()
+    result['fold_start'] = [str(bounds[f][0].date()) if f >= 0 else 'all' for f in combined['fold']]
+    for key, values in metrics.items():
+        result[key] = values
+    return result.sort_values(['crop', 'mandi', 'fold']).reset_index(drop=True)
+
+
+def write_metadata(models_dir, summary, replace_performance_metrics):
+    """Store the backtest summary in model_metadata.pkl (atomic replace)"""
+    path = os.path.join(models_dir, MODEL_FILES['metadata'])
+    with open(path, 'rb') as f:
+        metadata = pickle.load(f)
+    metadata['backtest_metrics'] = summary
+    if replace_performance_metrics:
+        metadata['performance_metrics'] = {
+            'mae': summary['mae'],
+            'mse': summary['rmse'] ** 2,
+            'rmse': summary['rmse'],
+            'r2': summary['r2'],
+            'mape': summary['mape']
+        }
+    staging = path + '.tmp'
+    with open(staging, 'wb') as f:
+        pickle.dump(metadata, f)
+    os.replace(staging, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of a model bundle')
+    parser.add_argument('--data', nargs='+', required=True, help='Date-ordered history CSV file(s)')
+    parser.add_argument('--models-dir', default=os.path.join(BACKEND_DIR, 'models'))
+    parser.add_argument('--folds', type=int, default=6, help='Number of forward windows')
+    parser.add_argument('--fold-days', type=int, default=30, help='Days per window')
+    parser.add_argument('--mode', choices=['retrain', 'bundle'], default='retrain',
+                        help="retrain: a model per fold (the training recipe); bundle: the bundle's own model "
+                             "on folds after its training range")
+    parser.add_argument('--rounds', type=int, help='Trees per fold model (default: as many as the bundle has)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Process pool size')
+    parser.add_argument('--shards', type=int, help='Series shards (default: 4 per worker)')
+    parser.add_argument('--chunksize', type=int, default=200000)
+    parser.add_argument('--output-dir', default=os.path.join(BACKEND_DIR, 'backtest_results'))
+    parser.add_argument('--write-metadata', action='store_true',
+                        help='Store aggregate metrics as backtest_metrics in model_metadata.pkl')
+    parser.add_argument('--replace-performance-metrics', action='store_true',
+                        help='Also overwrite performance_metrics (echoed by /predict) with the backtest')
+    parser.add_argument('--gate-against',
+                        help="Baseline models dir; exit 1 if this bundle's model is worse on the folds after "
+                             "both training ranges")
+    parser.add_argument('--max-mape-increase', type=float, default=0.5,
+                        help='Allowed MAPE increase in percentage points for --gate-against')
+    args = parser.parse_args()
+
+    shards = args.shards or args.workers * 4
+    started = time.perf_counter()
+    print(f"⏪ Walk-forward backtest ({args.mode}): {args.folds} folds x {args.fold_days} days, "
+          f"{args.workers} workers")
+
+    table, summary, bounds = run_backtest(args.data, args.models_dir, args.folds, args.fold_days,
+                                          args.workers, shards, args.chunksize, args.rounds, args.mode)
+    summary.update({
+        'generated_at': datetime.now().isoformat(),
+        'fold_days': args.fold_days,
+        'wall_time_s': round(time.perf_counter() - started, 2)
+    })
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    series_table(table, bounds).to_csv(os.path.join(args.output_dir, 'per_series.csv'), index=False)
+    with open(os.path.join(args.output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'fold':>4} {'start':>12} {'train':>9} {'rows':>8} {'MAE':>10} {'RMSE':>10} {'MAPE %':>8}")
+    for fold in summary['folds']:
+        print(f"{fold['fold']:>4} {fold['start']:>12} {fold['train_rows'] if fold['train_rows'] is not None else '-':>9} {int(fold['n']):>8} "
+              f"{fold['mae']:>10.2f} {fold['rmse']:>10.2f} {fold['mape']:>8.2f}")
+    print(f"\n✅ {summary['series_count']} series, {int(summary['n'])} scored rows in {summary['wall_time_s']}s")
+    print("   MAE: Rs.{:.2f}  RMSE: Rs.{:.2f}  MAPE: {:.2f}%  R2: {:.4f}".format(
+        summary['mae'], summary['rmse'], summary['mape'], summary['r2'] or 0))
+    print(f"   Tables written to {args.output_dir}")
+
+    if args.write_metadata:
+        write_metadata(args.models_dir, summary, args.replace_performance_metrics)
+        print(f"   Metrics stored in {os.path.join(args.models_dir, MODEL_FILES['metadata'])}")
+
+    if args.gate_against:
+        # Score each side's own model on the same rows: the folds after both training ranges
+        ranges = []
+        for models_dir in (args.models_dir, args.gate_against):
+            bundle = load_bundle(models_dir)
+            ranges.append(trained_until(bundle['metadata']) if bundle else None)
+        if None in ranges:
+            print("❌ Training range of the candidate or the baseline is unknown, cannot gate")
+            return 1
+        scored_from = max(ranges)
+        try:
+            candidate, baseline = [
+                run_backtest(args.data, models_dir, args.folds, args.fold_days, args.workers, shards,
+                             args.chunksize, mode='bundle', scored_from=scored_from)[1]
+                for models_dir in (args.models_dir, args.gate_against)
+            ]
+        except ValueError as e:
+            print(f"❌ Cannot gate: {e}")
+            return 1
+        delta = candidate['mape'] - baseline['mape']
+        print(f"\n🚦 MAPE {candidate['mape']:.2f}% vs baseline {baseline['mape']:.2f}% ({delta:+.2f} pp) "
+              f"on {int(candidate['n'])} rows from {scored_from.date()}")
+        if delta > args.max_mape_increase:
+            print("❌ Candidate is worse than the baseline beyond the allowed margin")
+            return 1
+        print("✅ Candidate passes the gate")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
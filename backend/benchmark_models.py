@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the prediction hot path
+Times each stage separately over the real artifacts in models/ (best of N
+samples) and fails when a stage regresses beyond the threshold against
+benchmark_baseline.json.
+
+Usage:
+    python benchmark_models.py                      # compare against the baseline
+    python benchmark_models.py --update-baseline    # record a new baseline
+    python benchmark_models.py --sizes 1,32,1000    # quick run on fewer batch sizes
+"""
+import os
+import sys
+import json
+import random
+import timeit
+import platform
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BACKEND_DIR, 'benchmark_baseline.json')
+DEFAULT_SIZES = [1, 32, 1000, 100000]
+STAGES = [
+    'create_features',
+    'encode_categorical_features',
+    'model_predict',
+    'predict_market_price',
+    'endpoint_predict'
+]
+
+# app.py loads models/ relative to the working directory
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+
+def build_inputs(size, combinations, seed=42):
+    """Build realistic prediction requests from the trained crop/mandi combinations"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    inputs = []
+    for _ in range(size):
+        combo = rng.choice(combinations) if combinations else {'crop': 'Wheat', 'mandi': 'Barnala'}
+        inputs.append({
+            'crop': combo['crop'],
+            'mandi': combo['mandi'],
+            'state': 'Punjab',
+            'currentPrice': round(rng.uniform(800, 6000), 2),
+            'currentDate': (start + timedelta(days=rng.randrange(365))).strftime('%Y-%m-%d')
+        })
+    return inputs
+
+
+def make_stage_runners(app_module, inputs):
+    """Prepare the inputs of every stage so only the stage itself is timed"""
+    import numpy as np
+
+    features = [app_module.create_features(row) for row in inputs]
+    encoded = [app_module.encode_categorical_features(f) for f in features]
+    matrix = np.array(
+        [[e.get(col, 0) for col in app_module.feature_columns] for e in encoded],
+        dtype=float
+    )
+    client = app_module.app.test_client()
+
+    def run_create_features():
+        for row in inputs:
+            app_module.create_features(row)
+
+    def run_encode():
+        for f in features:
+            app_module.encode_categorical_features(f)
+
+    def run_model_predict():
+        app_module.model.predict(matrix)
+
+    def run_predict_market_price():
+        for row in inputs:
+            app_module.predict_market_price(row)
+
+    def run_endpoint():
+        for row in inputs:
+            response = client.post('/predict', json=row)
+            if response.status_code != 200:
+                raise RuntimeError(f"/predict returned {response.status_code}")
+
+    return {
+        'create_features': run_create_features,
+        'encode_categorical_features': run_encode,
+        'model_predict': run_model_predict,
+        'predict_market_price': run_predict_market_price,
+        'endpoint_predict': run_endpoint
+    }
+
+
+def loop_count(timer, min_time):
+    """(loops, seconds) of the first 1, 2, 5, 10, 20, ... loop count that runs for at least min_time"""
+    base = 1
+    while True:
+        for multiplier in (1, 2, 5):
+            number = base * multiplier
+            elapsed = timer.timeit(number)
+            if elapsed >= min_time:
+                return number, elapsed
+        base *= 10
+
+
+def time_stage(runner, size, repeats, budget, min_time=0.2):
+    """Best-of-N timing of a stage
+
+    Each sample loops the stage until it has run for at least min_time (scaled the
+    way timeit.Timer.autorange does), and the fastest sample is reported, so
+    scheduler noise on short stages does not show up as a regression.
+    """
+    if size <= 1000:
+        runner()  # warm caches and lazy imports
+
+    timer = timeit.Timer(runner)
+    number, elapsed = loop_count(timer, min_time)
+    samples = [elapsed / number]
+    spent = elapsed
+    while len(samples) < repeats and spent < budget:
+        elapsed = timer.timeit(number)
+        samples.append(elapsed / number)
+        spent += elapsed
+
+    best = min(samples)
+    return {
+        'best_s': best,
+        'median_s': statistics.median(samples),
+        'runs': len(samples),
+        'loops': number,
+        'per_row_us': best / size * 1e6
+    }
+
+
+def run_benchmarks(sizes, stages, repeats, budget, min_time):
+    """Run every stage at every batch size and return the nested results"""
+    import app as app_module
+
+    if not app_module.load_models_on_demand():
+        print("❌ Failed to load models from models/")
+        sys.exit(2)
+
+    combinations = app_module.model_metadata.get('available_combinations', [])
+    results = {stage: {} for stage in stages}
+    for size in sizes:
+        print(f"\n📦 Batch size {size}")
+        runners = make_stage_runners(app_module, build_inputs(size, combinations))
+        for stage in stages:
+            result = time_stage(runners[stage], size, repeats, budget, min_time)
+            results[stage][str(size)] = result
+            print(f"   {stage:<30} {result['best_s'] * 1000:>12.3f} ms  "
+                  f"{result['per_row_us']:>10.2f} us/row  (best of {result['runs']} x {result['loops']} loops)")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of stages that regressed beyond the threshold"""
+    regressions = []
+    print(f"\n📊 Comparison against baseline (threshold +{threshold * 100:.0f}%)")
+    for stage, sizes in results.items():
+        for size, result in sizes.items():
+            base = baseline.get('results', {}).get(stage, {}).get(size)
+            if not base or 'best_s' not in base:
+                print(f"   {stage:<30} {size:>7}  (no baseline)")
+                continue
+            ratio = result['best_s'] / base['best_s'] if base['best_s'] > 0 else 1.0
+            status = '✅'
+            if ratio > 1 + threshold:
+                status = '❌'
+                regressions.append((stage, size, ratio))
+            print(f"   {status} {stage:<28} {size:>7}  {ratio:>6.2f}x baseline")
+    return regressions
+
+
+def machine_info():
+    """Describe the machine the numbers were recorded on"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the prediction hot path')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Comma separated batch sizes')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma separated stages to run')
+    parser.add_argument('--repeats', type=int, default=5, help='Maximum samples per stage and size (best is kept)')
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help='Seconds after which a stage stops sampling (at least one sample is taken)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum seconds per sample; short stages are looped until they reach it')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='Allowed slowdown as a fraction (defaults to the baseline threshold or 0.30)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true', help='Write results as the new baseline')
+    parser.add_argument('--output', help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    print("🚀 Prediction hot path benchmark")
+    results = run_benchmarks(sizes, stages, args.repeats, args.budget, args.min_time)
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'machine': machine_info(),
+        'threshold': args.threshold if args.threshold is not None else 0.30,
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        # Keep baseline entries for stages/sizes that were not part of this run
+        merged = baseline.get('results', {})
+        for stage, per_size in results.items():
+            merged.setdefault(stage, {}).update(per_size)
+        report['results'] = merged
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\n✅ Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n⚠️  No baseline at {args.baseline}, run with --update-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    threshold = args.threshold if args.threshold is not None else baseline.get('threshold', 0.30)
+    if baseline.get('machine', {}).get('platform') != machine_info()['platform']:
+        print("\n⚠️  Baseline was recorded on a different machine, ratios may be misleading")
+
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} stage(s) regressed:")
+        for stage, size, ratio in regressions:
+            print(f"   {stage} @ {size}: {ratio:.2f}x")
+        return 1
+
+    print("\n🎉 No regressions beyond threshold")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+CPU budget calibration for gunicorn workers x XGBoost threads
+Benchmarks combinations of process count and per-predict thread count on this
+machine for single-row and batch workloads, and writes the recommended config
+to cpu_config.json, which app.py and gunicorn.conf.py read at startup.
+
+Usage:
+    python calibrate_cpu.py
+    python calibrate_cpu.py --duration 5 --p99-budget-ms 50
+    python calibrate_cpu.py --processes 1,2,4 --threads 1,2
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import statistics
+import multiprocessing
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from cpu_config import CPU_CONFIG_FILE
+
+
+def default_grid(limit):
+    """Powers of two up to the core count, plus the core count itself"""
+    values = {1, limit}
+    n = 2
+    while n < limit:
+        values.add(n)
+        n *= 2
+    return sorted(values)
+
+
+def _worker(nthread, rows, duration, barrier, results):
+    """Load the model, wait for all siblings, then predict in a closed loop"""
+    import app as backend_app
+
+    backend_app.load_ml_models()
+    model = backend_app.model
+    model.set_params(n_jobs=nthread)
+    model.predict(rows[:1])  # start the thread pool outside the timed window
+
+    barrier.wait()
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        model.predict(rows)
+        latencies.append(time.perf_counter() - start)
+    results.put(latencies)
+
+
+def collect(procs, results, timeout):
+    """Latency lists of every child, or raise RuntimeError if one dies or the timeout passes"""
+    deadline = time.monotonic() + timeout
+    collected = []
+    while len(collected) < len(procs):
+        try:
+            collected.append(results.get(timeout=min(1.0, max(deadline - time.monotonic(), 0.01))))
+            continue
+        except queue.Empty:
+            pass
+        crashed = [p.exitcode for p in procs if p.exitcode not in (None, 0)]
+        if crashed:
+            raise RuntimeError(f"predictor process exited with code {crashed[0]}")
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"no result within {timeout:.0f}s")
+    return collected
+
+
+def measure(processes, nthread, rows, duration, timeout=120.0):
+    """Run `processes` concurrent predictors with `nthread` threads each
+
+    A child that crashes (OOM, XGBoost abort) or hangs marks the configuration
+    as failed after at most `timeout` seconds instead of blocking the calibration.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(processes)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(nthread, rows, duration, barrier, results))
+             for _ in range(processes)]
+    for p in procs:
+        p.start()
+    try:
+        collected = collect(procs, results, duration + timeout)
+    except RuntimeError as e:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+        return {'processes': processes, 'nthread': nthread, 'batch_rows': len(rows), 'calls': 0,
+                'calls_per_s': None, 'rows_per_s': None, 'p50_ms': None, 'p99_ms': None, 'error': str(e)}
+    for p in procs:
+        p.join()
+
+    latencies = [latency for child in collected for latency in child]
+    latencies.sort()
+    calls = len(latencies)
+    p99 = latencies[min(calls - 1, int(calls * 0.99))] if calls else None
+    return {
+        'processes': processes,
+        'nthread': nthread,
+        'batch_rows': len(rows),
+        'calls': calls,
+        'calls_per_s': calls / duration,
+        'rows_per_s': calls * len(rows) / duration,
+        'p50_ms': statistics.median(latencies) * 1000 if calls else None,
+        'p99_ms': p99 * 1000 if p99 is not None else None
+    }
+
+
+def pick_best(measurements, p99_budget_ms, slack):
+    """Highest throughput whose p99 stays within the budget (or slack over the best p99)"""
+    valid = [m for m in measurements if m['p99_ms'] is not None]
+    if not valid:
+        return None
+    budget = p99_budget_ms
+    if budget is None:
+        budget = min(m['p99_ms'] for m in valid) * (1 + slack)
+    within = [m for m in valid if m['p99_ms'] <= budget] or valid
+    return max(within, key=lambda m: m['rows_per_s'])
+
+
+def build_rows(batch_size):
+    """Feature matrix of realistic requests for the calibration workloads"""
+    import numpy as np
+    import app as backend_app
+    from benchmark_models import build_inputs
+
+    backend_app.load_ml_models()
+    combinations = backend_app.model_metadata.get('available_combinations', [])
+    rows = []
+    for row in build_inputs(batch_size, combinations):
+        encoded = backend_app.encode_categorical_features(backend_app.create_features(row))
+        rows.append([encoded.get(col, 0) for col in backend_app.feature_columns])
+    return np.array(rows, dtype=float)
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Calibrate gunicorn workers x XGBoost threads')
+    parser.add_argument('--processes', help='Comma separated process counts (default: powers of two up to 2x cores)')
+    parser.add_argument('--threads', help='Comma separated XGBoost nthread values (default: powers of two up to cores)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per call for the batch workload')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds per measurement')
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help='Seconds beyond --duration after which a configuration counts as failed')
+    parser.add_argument('--p99-budget-ms', type=float, help='Single-row p99 latency budget')
+    parser.add_argument('--slack', type=float, default=0.5,
+                        help='Allowed p99 increase over the best config when no budget is given')
+    parser.add_argument('--gunicorn-threads', type=int, default=1, help='Threads per gunicorn worker to record')
+    parser.add_argument('--output', default=CPU_CONFIG_FILE)
+    args = parser.parse_args()
+
+    processes = [int(p) for p in args.processes.split(',')] if args.processes else default_grid(cpu_count * 2)
+    threads = [int(t) for t in args.threads.split(',')] if args.threads else default_grid(cpu_count)
+
+    print(f"🔧 Calibrating on {cpu_count} cores: processes={processes} nthread={threads}")
+    batch_rows = build_rows(args.batch_size)
+    workloads = {'single': batch_rows[:1], 'batch': batch_rows}
+
+    measurements = {name: [] for name in workloads}
+    for name, rows in workloads.items():
+        print(f"\n📦 {name} workload ({len(rows)} rows per call)")
+        print(f"{'procs':>6} {'nthread':>8} {'rows/s':>12} {'p50 ms':>10} {'p99 ms':>10}")
+        for p in processes:
+            for t in threads:
+                result = measure(p, t, rows, args.duration, args.timeout)
+                measurements[name].append(result)
+                if 'error' in result:
+                    print(f"{p:>6} {t:>8}   ❌ failed: {result['error']}")
+                    continue
+                print(f"{p:>6} {t:>8} {result['rows_per_s']:>12.1f} "
+                      f"{result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f}")
+
+    single = pick_best(measurements['single'], args.p99_budget_ms, args.slack)
+    if single is None:
+        print("\n❌ Every single-row configuration failed, cpu_config.json was not written")
+        return 1
+    # Batch calls run inside the same workers, so only vary nthread at the chosen worker count
+    batch_candidates = [m for m in measurements['batch'] if m['processes'] == single['processes']]
+    batch = pick_best(batch_candidates, None, args.slack) or pick_best(measurements['batch'], None, args.slack)
+    batch_nthread = batch['nthread'] if batch else single['nthread']
+
+    config = {
+        'calibrated_at': datetime.now().isoformat(),
+        'cpu_count': cpu_count,
+        'recommended': {
+            'workers': single['processes'],
+            'threads': args.gunicorn_threads,
+            'xgb_nthread': single['nthread'],
+            'batch_nthread': batch_nthread
+        },
+        'measurements': measurements
+    }
+    with open(args.output, 'w') as f:
+        json.dump(config, f, indent=2)
+
+    print(f"\n✅ Recommended: workers={single['processes']} xgb_nthread={single['nthread']} "
+          f"batch_nthread={batch_nthread}")
+    print(f"   Written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Shared pytest setup for the backend tests
+The app reads its store paths from the environment at import time, so they are
+pointed at a temporary directory here, before any test imports app.
+"""
+import os
+import sys
+import math
+import random
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_STATE_DIR = tempfile.mkdtemp(prefix='krishi-tests-')
+
+for _name, _filename in (('ALERT_DB_PATH', 'alerts.db'), ('ALERT_SINK_PATH', 'alert_notifications.db'),
+                         ('PRICE_STORE_PATH', 'mandi_prices.db'), ('MODEL_ROUTING_PATH', 'model_routing.db')):
+    os.environ[_name] = os.path.join(_STATE_DIR, _filename)
+# Never call the real data.gov.in from tests
+os.environ['MANDI_API_BASE_URL'] = 'http://127.0.0.1:9'
+os.environ['PRICE_LOOKUP_RETRIES'] = '0'
+
+# app.py loads models/ relative to the working directory
+os.chdir(BACKEND_DIR)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+HISTORY_SERIES = [('Wheat', 'Khanna', 2200), ('Wheat', 'Abohar', 2150), ('Onion', 'Abohar', 1500), ('Potato', 'Patti', 900)]
+
+
+@pytest.fixture(scope='session')
+def history_csv(tmp_path_factory):
+    """Six months of daily prices for a few series, date ordered, in data.gov.in column names"""
+    rng = random.Random(7)
+    path = tmp_path_factory.mktemp('history') / 'history.csv'
+    lines = ['Arrival_Date,State,District,Market,Commodity,Variety,Grade,Min_x0020_Price,Max_x0020_Price,Modal_x0020_Price']
+    start = date(2024, 1, 1)
+    for day in range(182):
+        current = start + timedelta(days=day)
+        for crop, mandi, base in HISTORY_SERIES:
+            modal = round(base * (1 + 0.1 * math.sin(day / 20) + day / 1000) + rng.uniform(-20, 20))
+            lines.append(f"{current:%d/%m/%Y},Punjab,{mandi},{mandi},{crop},Local,FAQ,"
+                         f"{round(modal * 0.95)},{round(modal * 1.05)},{modal}")
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
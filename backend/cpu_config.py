@@ -0,0 +1,94 @@
+"""
+CPU budget settings for the ML backend
+Reads the recommendation written by calibrate_cpu.py so gunicorn workers and
+XGBoost threads do not oversubscribe the cores. Environment variables win
+over the calibrated values.
+
+Threads per worker are raised to at least admission concurrency + queue +
+LIGHT_ROUTE_THREADS, so a full /predict queue can be shed with 503s while
+/ping and /health still find a free thread.
+"""
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CPU_CONFIG_FILE = os.environ.get(
+    'CPU_CONFIG_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cpu_config.json')
+)
+
+# Environment overrides for each setting
+_ENV_OVERRIDES = {
+    'workers': 'WEB_CONCURRENCY',
+    'threads': 'GUNICORN_THREADS',
+    'xgb_nthread': 'XGB_NTHREAD',
+    'batch_nthread': 'XGB_BATCH_NTHREAD',
+    'admission_concurrency': 'ADMISSION_MAX_CONCURRENT',
+    'admission_queue': 'ADMISSION_MAX_QUEUE',
+    'light_threads': 'LIGHT_ROUTE_THREADS'
+}
+
+
+def load_cpu_config(path=None):
+    """Return the effective workers/threads/nthread settings and where they came from"""
+    path = path or CPU_CONFIG_FILE
+    cpu_count = os.cpu_count() or 1
+    settings = {
+        'workers': 2,
+        'threads': 1,
+        'xgb_nthread': None,
+        'batch_nthread': None,
+        'admission_concurrency': None,
+        'admission_queue': 8,
+        'light_threads': 1,
+        'cpu_count': cpu_count,
+        'source': 'defaults'
+    }
+
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                calibrated = json.load(f)
+            recommended = calibrated.get('recommended', {})
+            for key in ('workers', 'threads', 'xgb_nthread', 'batch_nthread'):
+                if recommended.get(key) is not None:
+                    settings[key] = int(recommended[key])
+            settings['source'] = 'calibration'
+            settings['calibrated_at'] = calibrated.get('calibrated_at')
+            if calibrated.get('cpu_count') != cpu_count:
+                logger.warning(f"CPU config was calibrated on {calibrated.get('cpu_count')} cores, "
+                               f"this machine has {cpu_count}. Re-run calibrate_cpu.py.")
+                settings['calibration_mismatch'] = True
+        except Exception as e:
+            logger.warning(f"Failed to read CPU config {path}: {e}")
+
+    overridden = []
+    for key, env_name in _ENV_OVERRIDES.items():
+        if os.environ.get(env_name):
+            settings[key] = int(os.environ[env_name])
+            overridden.append(env_name)
+    if overridden:
+        settings['source'] += '+env'
+        settings['env_overrides'] = overridden
+
+    if settings['xgb_nthread'] is None:
+        settings['xgb_nthread'] = max(1, cpu_count // max(settings['workers'], 1))
+    if settings['batch_nthread'] is None:
+        settings['batch_nthread'] = settings['xgb_nthread']
+    if settings['admission_concurrency'] is None:
+        # Predictions that fit on this worker's share of the cores at xgb_nthread each
+        settings['admission_concurrency'] = max(1, cpu_count // (max(settings['workers'], 1) * settings['xgb_nthread']))
+    required = min_threads(settings)
+    if settings['threads'] < required:
+        settings['threads_requested'] = settings['threads']
+        settings['threads'] = required
+    return settings
+
+
+def min_threads(settings):
+    """Worker threads needed for admission control to shed load (1 if it is disabled)"""
+    if settings['admission_concurrency'] <= 0:
+        return 1
+    return settings['admission_concurrency'] + settings['admission_queue'] + settings['light_threads']
@@ -0,0 +1,349 @@
+"""
+Online drift monitoring of /predict inputs and predictions
+Every scored request updates fixed-size sketches in constant time: histogram
+counters over the training profile's bin edges, running moments and a
+reservoir sample per feature, per crop and for the predictions, plus counters
+of categorical values the encoders did not know. /drift compares them with
+the training profile written by export_model.py (PSI per sketch).
+
+The profile builder at the bottom streams history chunks and needs numpy;
+the serving side only uses the standard library.
+"""
+import os
+import math
+import time
+import random
+import threading
+from bisect import bisect_right
+from datetime import datetime
+
+# Features compared against the profile; the simulated lag/rolling features are
+# fixed multiples of modal_price so they carry no extra information
+DRIFT_FEATURES = ['modal_price', 'month', 'day_of_week']
+# Per-crop sketches: the input price and the prediction
+CROP_FEATURES = ['modal_price', 'prediction']
+CATEGORICAL_FEATURES = ['crop', 'mandi', 'state', 'district', 'variety', 'grade', 'season', 'weatherCondition']
+
+PROFILE_BINS = 10
+PROFILE_SAMPLE_SIZE = 20000
+PROFILE_CROP_SAMPLE_SIZE = 2000
+
+# Population stability index bands
+PSI_MODERATE = 0.1
+PSI_DRIFT = 0.25
+# Floor for empty bins so PSI stays finite
+PSI_EPSILON = 1e-4
+
+
+class Reservoir:
+    """Uniform sample of a stream in fixed memory (Algorithm R)"""
+
+    def __init__(self, size):
+        self.size = size
+        self.values = []
+        self.seen = 0
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = random.randrange(self.seen)
+            if slot < self.size:
+                self.values[slot] = value
+
+    def quantiles(self, points=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        if not self.values:
+            return {}
+        ordered = sorted(self.values)
+        last = len(ordered) - 1
+        return {f'p{int(p * 100)}': ordered[int(round(p * last))] for p in points}
+
+
+class FeatureSketch:
+    """Histogram over fixed bin edges plus running moments and a reservoir"""
+
+    def __init__(self, edges, reservoir_size):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.reservoir = Reservoir(reservoir_size)
+
+    def add(self, value):
+        self.counts[bisect_right(self.edges, value)] += 1
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.reservoir.add(value)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 4) if self.count else None,
+            'std': round(math.sqrt(self.m2 / self.count), 4) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'quantiles': self.reservoir.quantiles()
+        }
+
+
+def psi(expected, actual_counts):
+    """Population stability index of live bin counts against expected proportions"""
+    total = sum(actual_counts)
+    if not total:
+        return None
+    score = 0.0
+    for share, count in zip(expected, actual_counts):
+        share = max(share, PSI_EPSILON)
+        observed = max(count / total, PSI_EPSILON)
+        score += (observed - share) * math.log(observed / share)
+    return round(score, 4)
+
+
+def drift_status(score):
+    if score is None:
+        return 'insufficient_data'
+    if score >= PSI_DRIFT:
+        return 'drift'
+    if score >= PSI_MODERATE:
+        return 'moderate'
+    return 'stable'
+
+
+class DriftMonitor:
+    """Per-worker streaming sketches of live traffic, compared against a training profile"""
+
+    def __init__(self, enabled=True, sample_rate=1.0, reservoir_size=256, max_crops=200, min_samples=100):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.reservoir_size = reservoir_size
+        self.max_crops = max_crops
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self.set_profile(None)
+
+    def set_profile(self, profile):
+        """Start fresh sketches binned on the profile's edges (or unbinned without one)"""
+        with self._lock:
+            self.profile = profile or None
+            features = (profile or {}).get('features', {})
+            self.features = {
+                name: FeatureSketch(features.get(name, {}).get('edges', []), self.reservoir_size)
+                for name in DRIFT_FEATURES + ['prediction']
+            }
+            self.crops = {}
+            self.crop_counts = {}
+            self.fallbacks = {column: 0 for column in CATEGORICAL_FEATURES}
+            self.unseen_values = {column: {} for column in CATEGORICAL_FEATURES}
+            self.observed = 0
+            self.skipped = 0
+            self.started_at = datetime.now().isoformat()
+
+    def _crop_sketches(self, crop):
+        sketches = self.crops.get(crop)
+        if sketches is None:
+            if len(self.crops) >= self.max_crops:
+                return None
+            crop_profile = (self.profile or {}).get('crops', {}).get(crop, {})
+            sketches = {
+                name: FeatureSketch(crop_profile.get(name, {}).get('edges', []), self.reservoir_size)
+                for name in CROP_FEATURES
+            }
+            self.crops[crop] = sketches
+        return sketches
+
+    def observe(self, features, crop, prediction, fallbacks=()):
+        """Hot path: fold one scored request into the sketches
+
+        features maps feature names to values, fallbacks lists the
+        (column, value) pairs the encoders did not know.
+        """
+        if not self.enabled:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.skipped += 1
+            return
+        crop = str(crop)
+        with self._lock:
+            self.observed += 1
+            for name in DRIFT_FEATURES:
+                self.features[name].add(float(features.get(name, 0)))
+            self.features['prediction'].add(prediction)
+            self.crop_counts[crop] = self.crop_counts.get(crop, 0) + 1
+            sketches = self._crop_sketches(crop)
+            if sketches is not None:
+                sketches['modal_price'].add(float(features.get('modal_price', 0)))
+                sketches['prediction'].add(prediction)
+            for column, value in fallbacks:
+                if column in self.fallbacks:
+                    self.fallbacks[column] += 1
+                    # Bounded like the crop sketches: only the first distinct values are kept
+                    unseen = self.unseen_values[column]
+                    value = str(value)
+                    if value in unseen or len(unseen) < self.max_crops:
+                        unseen[value] = unseen.get(value, 0) + 1
+
+    def _compare(self, sketch, reference):
+        result = sketch.summary()
+        if reference:
+            result['training'] = {key: reference.get(key) for key in ('mean', 'std', 'quantiles')}
+            score = psi(reference['proportions'], sketch.counts) if sketch.count >= self.min_samples else None
+            result['psi'] = score
+            result['status'] = drift_status(score)
+        return result
+
+    def report(self, top_unseen=10):
+        """Live summaries and drift scores; PSI needs min_samples observations per sketch"""
+        with self._lock:
+            profile = self.profile or {}
+            features = {
+                name: self._compare(sketch, profile.get('features', {}).get(name))
+                for name, sketch in self.features.items()
+            }
+            crops = {}
+            for crop, sketches in self.crops.items():
+                crop_profile = profile.get('crops', {}).get(crop)
+                crops[crop] = {name: self._compare(sketch, (crop_profile or {}).get(name))
+                               for name, sketch in sketches.items()}
+                crops[crop]['in_training_profile'] = crop_profile is not None
+
+            crop_mix = None
+            shares = profile.get('categories', {}).get('crop')
+            if shares and self.observed >= self.min_samples:
+                names = list(shares)
+                live = [self.crop_counts.get(name, 0) for name in names]
+                live.append(self.observed - sum(live))
+                crop_mix = psi([shares[name] for name in names] + [0.0], live)
+
+            encoder_fallbacks = {
+                column: {
+                    'count': count,
+                    'rate': round(count / self.observed, 4) if self.observed else 0.0,
+                    'top_unseen': sorted(self.unseen_values[column].items(), key=lambda item: -item[1])[:top_unseen]
+                }
+                for column, count in self.fallbacks.items()
+            }
+
+            scores = [f['psi'] for f in features.values() if f.get('psi') is not None]
+            if crop_mix is not None:
+                scores.append(crop_mix)
+            worst = max(scores) if scores else None
+            return {
+                'enabled': self.enabled,
+                'pid': os.getpid(),
+                'since': self.started_at,
+                'observed': self.observed,
+                'skipped_by_sampling': self.skipped,
+                'sample_rate': self.sample_rate,
+                'profile_loaded': bool(self.profile),
+                'profile_generated_at': profile.get('generated_at'),
+                'status': drift_status(worst) if self.profile else 'no_profile',
+                'max_psi': worst,
+                'features': features,
+                'crop_mix_psi': crop_mix,
+                'crops': crops,
+                'encoder_fallbacks': encoder_fallbacks
+            }
+
+
+def monitor_from_env():
+    """Build a monitor from DRIFT_* environment variables"""
+    return DriftMonitor(
+        enabled=os.environ.get('DRIFT_MONITORING', '1') != '0',
+        sample_rate=float(os.environ.get('DRIFT_SAMPLE_RATE', '1.0')),
+        reservoir_size=int(os.environ.get('DRIFT_RESERVOIR_SIZE', '256')),
+        max_crops=int(os.environ.get('DRIFT_MAX_CROPS', '200')),
+        min_samples=int(os.environ.get('DRIFT_MIN_SAMPLES', '100'))
+    )
+
+
+class _SampleBuilder:
+    """Uniform sample of a chunked stream: keep the values with the smallest random keys"""
+
+    def __init__(self, size, rng):
+        import numpy as np
+        self.size = size
+        self.rng = rng
+        self.keys = np.empty(0)
+        self.values = np.empty(0)
+        self.count = 0
+
+    def extend(self, values):
+        import numpy as np
+        values = np.asarray(values, dtype=float)
+        self.count += len(values)
+        keys = np.concatenate([self.keys, self.rng.random(len(values))])
+        values = np.concatenate([self.values, values])
+        if len(keys) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            keys, values = keys[keep], values[keep]
+        self.keys, self.values = keys, values
+
+
+def summarize_sample(sample, bins=PROFILE_BINS):
+    """Quantile bin edges, bin proportions and moments of a sampled distribution"""
+    import numpy as np
+    values = sample.values
+    if not len(values):
+        return None
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return {
+        'count': int(sample.count),
+        'edges': [float(edge) for edge in edges],
+        'proportions': [float(c) for c in counts / counts.sum()],
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'quantiles': {f'p{int(p * 100)}': float(np.quantile(values, p)) for p in (0.05, 0.25, 0.5, 0.75, 0.95)}
+    }
+
+
+def build_training_profile(history_paths, model, encoders, feature_columns, chunksize=200000, seed=42):
+    """Stream the training history once and describe the features, crops and predictions"""
+    import numpy as np
+    from history_features import HistoryFeatureBuilder, iter_history_chunks
+
+    rng = np.random.default_rng(seed)
+    builder = HistoryFeatureBuilder(encoders, feature_columns)
+    samples = {name: _SampleBuilder(PROFILE_SAMPLE_SIZE, rng) for name in DRIFT_FEATURES + ['prediction']}
+    crop_samples = {}
+    crop_counts = {}
+    rows = 0
+    started = time.perf_counter()
+
+    for chunk in iter_history_chunks(history_paths, chunksize):
+        frame = builder.process(chunk)
+        if not len(frame):
+            continue
+        rows += len(frame)
+        predictions = model.predict(frame[feature_columns].to_numpy())
+        for name in DRIFT_FEATURES:
+            samples[name].extend(frame[name].to_numpy())
+        samples['prediction'].extend(predictions)
+        for crop, index in frame.groupby('crop').indices.items():
+            crop = str(crop)
+            crop_counts[crop] = crop_counts.get(crop, 0) + len(index)
+            if crop not in crop_samples:
+                crop_samples[crop] = {name: _SampleBuilder(PROFILE_CROP_SAMPLE_SIZE, rng) for name in CROP_FEATURES}
+            crop_samples[crop]['modal_price'].extend(frame['modal_price'].to_numpy()[index])
+            crop_samples[crop]['prediction'].extend(predictions[index])
+
+    if not rows:
+        raise ValueError('No history rows found')
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'rows': rows,
+        'bins': PROFILE_BINS,
+        'build_time_s': round(time.perf_counter() - started, 2),
+        'features': {name: summarize_sample(sample) for name, sample in samples.items()},
+        'crops': {crop: {name: summarize_sample(sample) for name, sample in sketches.items()}
+                  for crop, sketches in crop_samples.items()},
+        'categories': {'crop': {crop: count / rows for crop, count in crop_counts.items()}}
+    }
@@ -0,0 +1,109 @@
+"""
+Per-prediction feature attributions for the ML backend
+Computes per-feature contributions with the booster's native pred_contribs
+output, batched across many inputs in one call and cached per
+(feature vector, model version) since contributions cost far more than a
+prediction.
+"""
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+EXPLAIN_CACHE_SIZE = int(os.environ.get('EXPLAIN_CACHE_SIZE', '10000'))
+
+
+class ContributionCache:
+    """Thread-safe LRU cache of contribution rows keyed by (model version, feature vector)"""
+
+    def __init__(self, max_size=EXPLAIN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_version, feature_vector):
+        # Packed doubles are exact and cheap to hash, unlike repr() of floats
+        return model_version, struct.pack(f'{len(feature_vector)}d', *feature_vector)
+
+    def get(self, key):
+        with self._lock:
+            row = self._entries.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return row
+
+    def put(self, key, row):
+        with self._lock:
+            self._entries[key] = row
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def entries(self):
+        """Cached rows, for memory accounting"""
+        return self._entries
+
+
+def compute_contributions(booster, matrix, feature_columns):
+    """Native SHAP-style contributions for a batch; the last column is the bias"""
+    import numpy as np
+    import xgboost as xgb
+
+    dmatrix = xgb.DMatrix(np.asarray(matrix, dtype=np.float32), feature_names=list(feature_columns))
+    return booster.predict(dmatrix, pred_contribs=True)
+
+
+def explain_batch(booster, model_version, feature_vectors, feature_columns, cache):
+    """Return (rows, cached, computed): one contribution row per input, with the
+    distinct cache misses computed in a single booster call"""
+    keys = [ContributionCache.key(model_version, vector) for vector in feature_vectors]
+    rows = [cache.get(key) for key in keys]
+
+    missing = {}
+    for index, row in enumerate(rows):
+        if row is None:
+            missing.setdefault(keys[index], []).append(index)
+    if missing:
+        first = [indexes[0] for indexes in missing.values()]
+        computed = compute_contributions(booster, [feature_vectors[i] for i in first], feature_columns)
+        for (key, indexes), row in zip(missing.items(), computed):
+            row = row.tolist()
+            cache.put(key, row)
+            for index in indexes:
+                rows[index] = row
+    cached = len(feature_vectors) - sum(len(indexes) for indexes in missing.values())
+    return rows, cached, len(missing)
+
+
+def format_explanation(row, feature_columns, feature_vector, top=None):
+    """Map a contribution row back to feature names, largest absolute effect first"""
+    bias = row[-1]
+    contributions = sorted(
+        ({'feature': name, 'value': feature_vector[i], 'contribution': round(row[i], 4)}
+         for i, name in enumerate(feature_columns) if row[i] != 0),
+        key=lambda item: -abs(item['contribution'])
+    )
+    shown = contributions[:top] if top else contributions
+    result = {
+        'prediction': round(sum(row), 2),
+        'baseValue': round(bias, 4),
+        'contributions': shown
+    }
+    if top and len(contributions) > top:
+        result['otherContribution'] = round(sum(c['contribution'] for c in contributions[top:]), 4)
+    return result
@@ -1,17 +1,26 @@
 """
 Script to export your trained XGBoost model and encoders
 Run this after training your model to prepare it for the backend API
+
+Usage:
+    python export_model.py
+    python export_model.py --history history.csv                  # also save the drift profile
+    python export_model.py --history history.csv --profile-only   # profile for the existing models/
+    python export_model.py --history history.csv --compact        # smaller variants + trade-off report
 """
 
 import pickle
 import os
+import json
+import shutil
+import argparse
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
 import xgboost as xgb
 import joblib
 
-def export_model():
+def export_model(history=None):
     """Export the trained model and encoders"""
     
     # Create models directory
@@ -74,6 +83,9 @@ def export_model():
         'available_combinations': available_combinations.to_dict('records') if hasattr(available_combinations, 'to_dict') else available_combinations
     }
     
+    if history:
+        metadata['training_profile'] = build_profile(history, model, encoders, feature_columns)
+    
     with open('models/model_metadata.pkl', 'wb') as f:
         pickle.dump(metadata, f)
     
@@ -111,6 +123,90 @@ def export_model():
     
     return True
 
+def build_profile(history, model, encoders, feature_columns):
+    """Describe the training distribution for drift monitoring (/drift)"""
+    from drift import build_training_profile
+    
+    print("Building training profile from {}...".format(', '.join(history)))
+    profile = build_training_profile(history, model, encoders, feature_columns)
+    print("   Rows: {}  Crops: {}  Time: {}s".format(profile['rows'], len(profile['crops']), profile['build_time_s']))
+    return profile
+
+def update_profile(history, models_dir='models'):
+    """Add a training profile to an already exported model bundle"""
+    from model_registry import MODEL_FILES, load_bundle
+    
+    bundle = load_bundle(models_dir)
+    if bundle is None:
+        print("No model bundle found in '{}'".format(models_dir))
+        return False
+    metadata = bundle['metadata']
+    metadata['training_profile'] = build_profile(history, bundle['model'], bundle['encoders'], bundle['feature_columns'])
+    
+    path = os.path.join(models_dir, MODEL_FILES['metadata'])
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(metadata, f)
+    os.replace(path + '.tmp', path)
+    print("Training profile saved to {}".format(path))
+    return True
+
+def compact_model(history, models_dir='models', output_dir='models_compact', tree_caps=(), prune_quantiles=(),
+                  precisions=('float32',), holdout_days=30, holdout_rows=50000, max_mape_increase=0.5,
+                  optimize_for='single_row_p50_ms'):
+    """Measure reduced variants of the bundle's model and export the cheapest within the accuracy budget"""
+    from model_registry import MODEL_FILES, load_bundle
+    from model_compaction import compare_variants, load_holdout, pick_cheapest, variant_grid
+    from cpu_config import load_cpu_config
+    
+    bundle = load_bundle(models_dir)
+    if bundle is None:
+        print("No model bundle found in '{}'".format(models_dir))
+        return False
+    
+    print("Loading holdout (last {} days) from {}...".format(holdout_days, ', '.join(history)))
+    features, target = load_holdout(history, bundle['encoders'], bundle['feature_columns'], holdout_days, holdout_rows)
+    print("   Holdout rows: {}".format(len(target)))
+    
+    specs = variant_grid(tree_caps, prune_quantiles, precisions)
+    print("Measuring {} variants...".format(len(specs)))
+    rows, variants = compare_variants(bundle['model'], features, target, specs, load_cpu_config()['xgb_nthread'])
+    
+    print("\n{:<24} {:>6} {:>7} {:>9} {:>8} {:>10} {:>10} {:>9} {:>9}".format(
+        'variant', 'trees', 'leaves', 'size KB', 'load ms', '1-row ms', '1000 ms', 'MAE', 'dMAPE pp'))
+    for row in rows:
+        print("{:<24} {:>6} {:>7} {:>9} {:>8} {:>10} {:>10} {:>9.2f} {:>+9.3f}".format(
+            row['variant'], row['trees'], row['leaves'], row['size_kb'], row['load_ms'],
+            row['single_row_p50_ms'], row['batch_1000_ms'], row['mae'], row['mape_delta'] or 0))
+    
+    best = pick_cheapest(rows, max_mape_increase, optimize_for)
+    print("\nCheapest variant within +{} pp MAPE: {}".format(max_mape_increase, best['variant']))
+    
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ('encoders', 'feature_columns'):
+        shutil.copyfile(os.path.join(models_dir, MODEL_FILES[name]), os.path.join(output_dir, MODEL_FILES[name]))
+    with open(os.path.join(output_dir, MODEL_FILES['model']), 'wb') as f:
+        pickle.dump(variants[best['variant']], f)
+    metadata = dict(bundle['metadata'])
+    metadata['version'] = "{}+{}".format(metadata.get('version', 'unknown'), best['variant'])
+    metadata['compaction'] = {key: value for key, value in best.items() if key != 'spec'}
+    metadata['compaction']['spec'] = best['spec']
+    with open(os.path.join(output_dir, MODEL_FILES['metadata']), 'wb') as f:
+        pickle.dump(metadata, f)
+    
+    report = {
+        'source': models_dir,
+        'holdout_days': holdout_days,
+        'holdout_rows': len(target),
+        'max_mape_increase': max_mape_increase,
+        'optimize_for': optimize_for,
+        'selected': best['variant'],
+        'variants': rows
+    }
+    with open(os.path.join(output_dir, 'compaction_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Bundle written to {} (report: compaction_report.json)".format(output_dir))
+    return True
+
 def create_test_features(input_data, encoders, feature_columns):
     """Create test features for model testing"""
     features = [0] * len(feature_columns)  # Initialize with zeros
@@ -135,7 +231,46 @@ def create_test_features(input_data, encoders, feature_columns):
     return features
 
 if __name__ == '__main__':
-    success = export_model()
+    parser = argparse.ArgumentParser(description='Export the trained model for the backend API')
+    parser.add_argument('--history', nargs='+', help='Training history CSV file(s) for the drift profile')
+    parser.add_argument('--profile-only', action='store_true',
+                        help='Only add the training profile to the bundle in --models-dir')
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--compact', action='store_true',
+                        help='Compare reduced variants of the bundle in --models-dir on a --history holdout')
+    parser.add_argument('--tree-caps', default='50,100,150', help='Comma-separated tree counts to try')
+    parser.add_argument('--prune-quantiles', default='0.1,0.25,0.5',
+                        help='Prune splits whose gain is below these quantiles of all split gains')
+    parser.add_argument('--precisions', default='float32,float16', help='Threshold/leaf precisions to try')
+    parser.add_argument('--holdout-days', type=int, default=30)
+    parser.add_argument('--holdout-rows', type=int, default=50000, help='Sample the holdout down to this many rows')
+    parser.add_argument('--max-mape-increase', type=float, default=0.5,
+                        help='Accuracy budget in MAPE percentage points over the full model')
+    parser.add_argument('--optimize-for', default='single_row_p50_ms',
+                        choices=['single_row_p50_ms', 'batch_1000_ms', 'size_kb', 'load_ms'])
+    parser.add_argument('--compact-output', default='models_compact')
+    args = parser.parse_args()
+    
+    if args.compact:
+        if not args.history:
+            parser.error('--compact needs --history for the holdout')
+        raise SystemExit(0 if compact_model(
+            args.history, args.models_dir, args.compact_output,
+            tree_caps=[int(x) for x in args.tree_caps.split(',') if x],
+            prune_quantiles=[float(x) for x in args.prune_quantiles.split(',') if x],
+            precisions=[x for x in args.precisions.split(',') if x],
+            holdout_days=args.holdout_days,
+            holdout_rows=args.holdout_rows,
+            max_mape_increase=args.max_mape_increase,
+            optimize_for=args.optimize_for
+        ) else 1)
+    
+    if args.profile_only:
+        if not args.history:
+            parser.error('--profile-only needs --history')
+        raise SystemExit(0 if update_profile(args.history, args.models_dir) else 1)
+    
+    success = export_model(args.history)
     if success:
         print("\nModel export completed successfully!")
         print("Your real ML model is ready for the backend API!")
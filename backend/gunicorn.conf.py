@@ -0,0 +1,56 @@
+"""
+Gunicorn configuration for the ML backend
+Loads the model bundle once in the master before forking so every worker
+shares the same read-only pages (copy-on-write) instead of loading its own copy.
+
+Start command:
+    gunicorn -c gunicorn.conf.py app:app
+
+Workers, threads and XGBoost nthread come from cpu_config.json (written by
+calibrate_cpu.py) and can be overridden by the environment.
+
+Environment:
+    PORT              port to bind (default 5000)
+    WEB_CONCURRENCY   number of workers (default 2)
+    GUNICORN_THREADS  threads per worker (default 1, raised to admission
+                      concurrency + queue + LIGHT_ROUTE_THREADS, see cpu_config.py)
+    PRELOAD_MODELS    set to 0 to fall back to per-worker on-demand loading
+    XGB_NTHREAD       XGBoost threads per prediction (default: cores / workers)
+"""
+import os
+import sys
+
+# The config file is imported before gunicorn puts the app directory on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from cpu_config import load_cpu_config, min_threads
+
+cpu_settings = load_cpu_config()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = cpu_settings['workers']
+# Always more threads than admission concurrency + queue, so excess /predict load is
+# shed with 503s and /ping and /health never wait behind it
+threads = max(cpu_settings['threads'], min_threads(cpu_settings))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+# Connections beyond the backlog are refused by the kernel instead of queueing unbounded
+backlog = int(os.environ.get('GUNICORN_BACKLOG', '2048'))
+preload_app = os.environ.get('PRELOAD_MODELS', '1') != '0'
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported and before workers are forked"""
+    if cpu_settings.get('threads_requested') is not None:
+        server.log.info(f"Threads per worker raised from {cpu_settings['threads_requested']} to {threads} "
+                        f"for admission control (concurrency {cpu_settings['admission_concurrency']}, "
+                        f"queue {cpu_settings['admission_queue']})")
+    if not preload_app:
+        return
+    import app as backend_app
+    if not backend_app.preload_models():
+        server.log.warning("Model preload failed, workers will load models on demand")
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after fork"""
+    import app as backend_app
+    backend_app.post_fork_setup(nthread=cpu_settings['xgb_nthread'])
@@ -0,0 +1,239 @@
+"""
+Feature engineering over historical mandi price records
+Turns chunks of daily (crop, mandi) price history into the model's feature
+columns plus a next-day target, carrying per-series state between chunks so
+arbitrarily large histories can be streamed without loading them into RAM.
+
+Expected columns (data.gov.in names are accepted too):
+    date, crop, mandi, state, modal_price, min_price, max_price
+Optional columns:
+    district, variety, grade, arrivals, volume, temperature, rainfall, humidity,
+    inflationRate, fuelPrice, laborCost, fertilizerPrice, demandSupplyRatio,
+    seasonalFactor, weatherCondition
+"""
+import numpy as np
+import pandas as pd
+
+# data.gov.in / alternative column names -> names used here
+COLUMN_ALIASES = {
+    'arrival_date': 'date',
+    'commodity': 'crop',
+    'market': 'mandi',
+    'min_x0020_price': 'min_price',
+    'max_x0020_price': 'max_price',
+    'modal_x0020_price': 'modal_price',
+    'arrivalquantity': 'arrivals',
+    'arrival_quantity': 'arrivals',
+}
+
+SERIES_KEYS = ['crop', 'mandi']
+CATEGORICAL_COLUMNS = ['crop', 'variety', 'grade', 'mandi', 'district', 'state', 'season', 'weatherCondition']
+# Defaults use the vocabulary of the shipped encoders
+CATEGORICAL_DEFAULTS = {'variety': 'Local', 'grade': 'FAQ', 'state': 'Punjab', 'weatherCondition': 'Unknown'}
+
+# Exogenous numeric columns copied as-is when present, 0 otherwise (as at serving time)
+PASSTHROUGH_COLUMNS = {
+    'arrivalQuantity': 'arrivals',
+    'volume': 'volume',
+    'temperature': 'temperature',
+    'rainfall': 'rainfall',
+    'humidity': 'humidity',
+    'inflationRate': 'inflationRate',
+    'fuelPrice': 'fuelPrice',
+    'laborCost': 'laborCost',
+    'fertilizerPrice': 'fertilizerPrice',
+    'demandSupplyRatio': 'demandSupplyRatio',
+    'seasonalFactor': 'seasonalFactor',
+}
+
+LAGS = [1, 3, 7, 14, 30]
+WINDOWS = [7, 14, 30]
+ARRIVAL_LAGS = [1, 7, 14]
+
+# Rows of history kept per series between chunks (longest lag/window + 1)
+HISTORY_ROWS = max(LAGS + WINDOWS) + 1
+
+
+def default_feature_columns():
+    """Feature column order used when training from scratch (matches the shipped model)"""
+    return (['modal_price', 'min_price', 'max_price'] + list(PASSTHROUGH_COLUMNS)
+            + ['day_of_year', 'month', 'day_of_week', 'quarter', 'is_weekend']
+            + [f'price_lag_{lag}' for lag in LAGS]
+            + [f'price_{stat}_{w}d' for w in WINDOWS for stat in ('mean', 'std', 'min', 'max')]
+            + [f'price_volatility_{w}d' for w in WINDOWS]
+            + [f'arrivals_lag_{lag}' for lag in ARRIVAL_LAGS]
+            + ['state_avg_price', 'crop_avg_price', 'price_momentum_7d', 'price_momentum_30d',
+               'month_sin', 'month_cos', 'day_sin', 'day_cos', 'year_progress',
+               'temp_rainfall_interaction', 'humidity_temp_interaction',
+               'fuel_labor_ratio', 'fertilizer_inflation_ratio']
+            + [f'{c}_encoded' for c in CATEGORICAL_COLUMNS])
+
+
+def normalize_columns(df):
+    """Rename known aliases, parse dates and fill optional columns"""
+    renamed = {}
+    for col in df.columns:
+        key = col.strip()
+        alias = COLUMN_ALIASES.get(key.lower())
+        if alias:
+            renamed[col] = alias
+        elif key.lower() in ('date', 'crop', 'mandi', 'state', 'district', 'variety', 'grade',
+                             'modal_price', 'min_price', 'max_price', 'arrivals'):
+            renamed[col] = key.lower()
+    df = df.rename(columns=renamed)
+
+    missing = {'date', 'crop', 'mandi', 'modal_price'} - set(df.columns)
+    if missing:
+        raise ValueError(f"History data is missing required columns: {', '.join(sorted(missing))}")
+
+    if not pd.api.types.is_datetime64_any_dtype(df['date']):
+        # data.gov.in uses dd/mm/yyyy, everything else is expected to be ISO
+        dayfirst = df['date'].astype(str).str.contains('/').any()
+        df['date'] = pd.to_datetime(df['date'], format='%d/%m/%Y' if dayfirst else None)
+    df['modal_price'] = pd.to_numeric(df['modal_price'], errors='coerce')
+    for col in ('min_price', 'max_price'):
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(df['modal_price'])
+        else:
+            df[col] = df['modal_price']
+    for col, default in CATEGORICAL_DEFAULTS.items():
+        if col not in df:
+            df[col] = default
+    if 'district' not in df:
+        df['district'] = df['mandi']
+    return df.dropna(subset=['modal_price'])
+
+
+def iter_history_chunks(paths, chunksize=200000):
+    """Stream normalized history chunks from one or more CSV files (date ordered)"""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            chunk = normalize_columns(chunk)
+            if len(chunk):
+                yield chunk
+
+
+def encoder_lookup(encoder):
+    """Map each known class to its code; unseen values use classes_[0] like serving does"""
+    classes = list(encoder.classes_)
+    return {value: code for code, value in enumerate(classes)}, 0
+
+
+def encode_series(values, encoder):
+    """Vectorized LabelEncoder.transform with the serving fallback for unseen values"""
+    mapping, fallback = encoder_lookup(encoder)
+    return values.map(mapping).fillna(fallback).astype(np.int32)
+
+
+def season_for_months(months):
+    """Rabi for Oct-Mar, Kharif otherwise (same months as create_features, lowercase like the encoder)"""
+    return np.where(np.isin(months, [10, 11, 12, 1, 2, 3]), 'rabi', 'kharif')
+
+
+def compute_features(df, encoders, feature_columns):
+    """Vectorized feature computation over rows sorted by series then date"""
+    out = pd.DataFrame(index=df.index)
+    price = df['modal_price'].astype(float)
+    grouped = df.groupby(SERIES_KEYS, sort=False)['modal_price']
+
+    out['modal_price'] = price
+    out['min_price'] = df['min_price'].astype(float)
+    out['max_price'] = df['max_price'].astype(float)
+    for feature, column in PASSTHROUGH_COLUMNS.items():
+        out[feature] = pd.to_numeric(df[column], errors='coerce').fillna(0) if column in df else 0.0
+
+    dates = df['date']
+    out['day_of_year'] = dates.dt.dayofyear
+    out['month'] = dates.dt.month
+    out['day_of_week'] = dates.dt.dayofweek
+    out['quarter'] = dates.dt.quarter
+    out['is_weekend'] = (dates.dt.dayofweek >= 5).astype(int)
+
+    for lag in LAGS:
+        out[f'price_lag_{lag}'] = grouped.shift(lag).fillna(price)
+    for window in WINDOWS:
+        rolling = grouped.rolling(window, min_periods=1)
+        mean = rolling.mean().reset_index(level=[0, 1], drop=True)
+        std = rolling.std().reset_index(level=[0, 1], drop=True).fillna(0)
+        out[f'price_mean_{window}d'] = mean
+        out[f'price_std_{window}d'] = std
+        out[f'price_min_{window}d'] = rolling.min().reset_index(level=[0, 1], drop=True)
+        out[f'price_max_{window}d'] = rolling.max().reset_index(level=[0, 1], drop=True)
+        out[f'price_volatility_{window}d'] = (std / mean.replace(0, np.nan)).fillna(0)
+
+    arrivals = pd.to_numeric(df['arrivals'], errors='coerce').fillna(0) if 'arrivals' in df else pd.Series(0.0, index=df.index)
+    arrivals_grouped = arrivals.groupby([df[k] for k in SERIES_KEYS], sort=False)
+    for lag in ARRIVAL_LAGS:
+        out[f'arrivals_lag_{lag}'] = arrivals_grouped.shift(lag).fillna(arrivals)
+
+    out['state_avg_price'] = price.groupby([df['state'], dates]).transform('mean')
+    out['crop_avg_price'] = price.groupby([df['crop'], dates]).transform('mean')
+    out['price_momentum_7d'] = (price / out['price_lag_7'].replace(0, np.nan) - 1).fillna(0)
+    out['price_momentum_30d'] = (price / out['price_lag_30'].replace(0, np.nan) - 1).fillna(0)
+
+    month = out['month'].astype(float)
+    day = dates.dt.day.astype(float)
+    out['month_sin'] = np.sin(2 * np.pi * month / 12)
+    out['month_cos'] = np.cos(2 * np.pi * month / 12)
+    out['day_sin'] = np.sin(2 * np.pi * day / 31)
+    out['day_cos'] = np.cos(2 * np.pi * day / 31)
+    out['year_progress'] = out['day_of_year'] / 365
+
+    out['temp_rainfall_interaction'] = out['temperature'] * out['rainfall']
+    out['humidity_temp_interaction'] = out['humidity'] * out['temperature']
+    out['fuel_labor_ratio'] = (out['fuelPrice'] / out['laborCost'].replace(0, np.nan)).fillna(0)
+    out['fertilizer_inflation_ratio'] = (out['fertilizerPrice'] / out['inflationRate'].replace(0, np.nan)).fillna(0)
+
+    categorical = df.copy()
+    categorical['season'] = season_for_months(dates.dt.month.to_numpy())
+    for column in CATEGORICAL_COLUMNS:
+        if column in encoders:
+            out[f'{column}_encoded'] = encode_series(categorical[column].astype(str), encoders[column])
+        else:
+            out[f'{column}_encoded'] = 0
+
+    return out.reindex(columns=feature_columns, fill_value=0).astype(np.float32)
+
+
+class HistoryFeatureBuilder:
+    """Streams history chunks into (features, target) rows, carrying per-series state"""
+
+    def __init__(self, encoders, feature_columns):
+        self.encoders = encoders
+        self.feature_columns = list(feature_columns)
+        self.carry = None
+        self.rows_seen = 0
+
+    def process(self, chunk):
+        """Return a DataFrame of feature rows whose next-day target is now known
+
+        The result holds the feature columns plus 'target', 'target_date' (the date the
+        label was observed), 'date', 'crop' and 'mandi'.
+        The last row of each series waits in the carry until the next chunk supplies its label.
+        """
+        self.rows_seen += len(chunk)
+        chunk = chunk.assign(_emitted=False)
+        frame = chunk if self.carry is None else pd.concat([self.carry, chunk], ignore_index=True)
+        frame = frame.sort_values(SERIES_KEYS + ['date'], kind='mergesort').reset_index(drop=True)
+
+        series = frame.groupby(SERIES_KEYS, sort=False)
+        target = series['modal_price'].shift(-1)
+        target_date = series['date'].shift(-1)
+        ready = (~frame['_emitted'].astype(bool)) & target.notna()
+
+        features = compute_features(frame, self.encoders, self.feature_columns)
+        result = features[ready].copy()
+        result['target'] = target[ready].astype(np.float32)
+        result['target_date'] = target_date[ready]
+        for column in ('date', 'crop', 'mandi'):
+            result[column] = frame.loc[ready, column]
+
+        frame.loc[ready, '_emitted'] = True
+        self.carry = frame.groupby(SERIES_KEYS, sort=False).tail(HISTORY_ROWS)
+        return result.reset_index(drop=True)
+
+    def reset(self):
+        self.carry = None
+        self.rows_seen = 0
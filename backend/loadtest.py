@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Local load-testing harness for the ML backend
+Starts the backend with a given worker/thread configuration, replays a realistic
+crop/mandi/price mix drawn from available_combinations and reports latency
+percentiles, throughput and error rate at increasing concurrency.
+
+Usage:
+    python loadtest.py --workers 2 --threads 4 --concurrency 1,4,16,64
+    python loadtest.py --mode flask --duration 10
+    python loadtest.py --mix predict=0.8,explain=0.1,storage=0.1 --batch-size 64
+    python loadtest.py --url http://localhost:5000   # target an already running server
+    MANDI_API_BASE_URL=http://127.0.0.1:8081 python loadtest.py --mix predict-live=1.0   # with mandi_stub.py
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from urllib.parse import urlsplit, quote
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Route weights of the replayed traffic, payload builders are below
+DEFAULT_MIX = 'predict=1.0'
+# Inputs/lots per request of the batch routes (explain, storage)
+DEFAULT_BATCH_SIZE = 32
+
+
+class HTTPConnection:
+    """Minimal keep-alive HTTP/1.1 client connection on top of asyncio streams"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Send a request and return (status, body bytes)"""
+        if self.writer is None:
+            await self.connect()
+
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Connection: keep-alive",
+            f"Content-Length: {len(payload)}"
+        ]
+        if body is not None:
+            headers.append("Content-Type: application/json")
+        self.writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        status = int(status_line.split()[1])
+
+        length = None
+        chunked = False
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding' and 'chunked' in value.lower():
+                chunked = True
+            elif name == 'connection' and value.lower() == 'close':
+                keep_alive = False
+
+        if chunked:
+            data = b''
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                data += await self.reader.readexactly(size)
+                await self.reader.readline()
+        elif length is not None:
+            data = await self.reader.readexactly(length)
+        else:
+            data = await self.reader.read()
+            keep_alive = False
+
+        if not keep_alive:
+            await self.close()
+        return status, data
+
+
+def free_port():
+    """Ask the OS for an unused local port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, workers, threads=None, extra_env=None):
+    """Start the backend locally and return the process
+
+    threads=None leaves the thread count to gunicorn.conf.py, which keeps
+    headroom above admission control for /ping and /health.
+    """
+    env = dict(os.environ, PORT=str(port), PYTHONUNBUFFERED='1')
+    env.update(extra_env or {})
+    if mode == 'gunicorn':
+        cmd = [
+            sys.executable, '-m', 'gunicorn', 'app:app',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers),
+            '--log-level', 'warning'
+        ]
+        if threads:
+            cmd += ['--threads', str(threads)]
+    else:
+        cmd = [sys.executable, 'start.py']
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_ready(host, port, timeout=60):
+    """Poll /ping until the server answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = HTTPConnection(host, port)
+        try:
+            status, _ = await conn.request('GET', '/ping')
+            if status == 200:
+                return True
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await conn.close()
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def fetch_combinations(host, port):
+    """Get the crop/mandi mix the model was trained on"""
+    conn = HTTPConnection(host, port)
+    try:
+        status, data = await conn.request('GET', '/available-combinations')
+        if status == 200:
+            return json.loads(data).get('combinations', [])
+    finally:
+        await conn.close()
+    return []
+
+
+class TrafficMix:
+    """Draws weighted routes and realistic payloads for the replay"""
+
+    def __init__(self, combinations, mix, seed=42, batch_size=DEFAULT_BATCH_SIZE):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.combinations = combinations or [{'crop': 'Wheat', 'mandi': 'Barnala', 'count': 1}]
+        self.weights = [max(c.get('count', 1), 1) for c in self.combinations]
+        # Stable per-crop base price so repeated crops get a plausible price band
+        self.base_prices = {}
+        self.routes = []
+        self.route_weights = []
+        for part in mix.split(','):
+            name, _, weight = part.partition('=')
+            self.routes.append(name.strip())
+            self.route_weights.append(float(weight or 1))
+
+    def _row(self):
+        combo = self.rng.choices(self.combinations, weights=self.weights)[0]
+        crop = combo['crop']
+        base = self.base_prices.setdefault(crop, random.Random(crop).uniform(900, 6000))
+        day = datetime(2025, 1, 1) + timedelta(days=self.rng.randrange(365))
+        return {
+            'crop': crop,
+            'mandi': combo['mandi'],
+            'state': combo.get('state', 'Punjab'),
+            'currentPrice': round(base * self.rng.uniform(0.85, 1.15), 2),
+            'currentDate': day.strftime('%Y-%m-%d')
+        }
+
+    def next_request(self):
+        """Return (route name, method, path, body)"""
+        route = self.rng.choices(self.routes, weights=self.route_weights)[0]
+        if route == 'predict':
+            return route, 'POST', '/predict', self._row()
+        if route == 'predict-live':
+            # currentPrice is looked up by the backend (see price_lookup.py / mandi_stub.py)
+            row = self._row()
+            del row['currentPrice']
+            return route, 'POST', '/predict', dict(row, livePrice=True)
+        if route == 'prices':
+            row = self._row()
+            return route, 'GET', f"/prices/current?crop={quote(row['crop'])}&mandi={quote(row['mandi'])}", None
+        if route == 'explain':
+            return route, 'POST', '/explain?top=5', {'inputs': [self._row() for _ in range(self.batch_size)]}
+        if route == 'storage':
+            lots = [dict(self._row(), lotId=i, quantity=round(self.rng.uniform(10, 500), 1),
+                         storageCostPerTonMonth=self.rng.choice([100, 150, 200]))
+                    for i in range(self.batch_size)]
+            return route, 'POST', '/storage/optimize', {'lots': lots}
+        if route == 'health':
+            return route, 'GET', '/health', None
+        if route == 'ping':
+            return route, 'GET', '/ping', None
+        if route == 'model-info':
+            return route, 'GET', '/model-info', None
+        raise ValueError(f"Unknown route in mix: {route}")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def run_level(host, port, mix, concurrency, duration, timeout):
+    """Run a closed-loop load step at one concurrency level"""
+    latencies = []
+    per_route = {}
+    statuses = {}
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def user():
+        nonlocal errors
+        conn = HTTPConnection(host, port)
+        try:
+            while time.monotonic() < deadline:
+                route, method, path, body = mix.next_request()
+                start = time.perf_counter()
+                try:
+                    status, _ = await asyncio.wait_for(conn.request(method, path, body), timeout)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                    errors += 1
+                    statuses['error'] = statuses.get('error', 0) + 1
+                    await conn.close()
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status >= 400:
+                    errors += 1
+                    continue
+                latencies.append(elapsed)
+                per_route.setdefault(route, []).append(elapsed)
+        finally:
+            await conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies) + errors
+    return {
+        'concurrency': concurrency,
+        'duration_s': round(wall, 3),
+        'requests': total,
+        'successes': len(latencies),
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None
+        },
+        'per_route_p50_ms': {route: percentile(sorted(v), 50) for route, v in per_route.items()},
+        'status_counts': statuses
+    }
+
+
+def server_threads(args):
+    """Threads per worker of the server under test"""
+    if args.threads:
+        return args.threads
+    if args.url or args.mode == 'flask':
+        return 1
+    # What gunicorn.conf.py picks for the same environment
+    from cpu_config import load_cpu_config
+    return load_cpu_config()['threads']
+
+
+def warmup_concurrency(args):
+    """Enough parallel users to reach every worker of the server that is actually running"""
+    if not args.url and args.mode == 'flask':
+        # start.py runs a single Flask process
+        return 1
+    return max(args.workers * server_threads(args), 1)
+
+
+async def run(args):
+    process = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        print(f"🚀 Starting backend ({args.mode}, workers={args.workers}, threads={server_threads(args)}) on port {port}")
+        process = start_server(args.mode, port, args.workers, args.threads)
+
+    try:
+        if not await wait_until_ready(host, port, args.startup_timeout):
+            print("❌ Backend did not become ready")
+            return 2
+
+        combinations = await fetch_combinations(host, port)
+        print(f"📦 Replaying {len(combinations)} crop/mandi combinations")
+        mix = TrafficMix(combinations, args.mix, seed=args.seed, batch_size=args.batch_size)
+
+        # Warm every worker so model loading does not land in the first step
+        await run_level(host, port, mix, warmup_concurrency(args), args.warmup, args.timeout)
+
+        levels = []
+        print(f"\n{'conc':>6} {'rps':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(',') if c]:
+            result = await run_level(host, port, mix, concurrency, args.duration, args.timeout)
+            levels.append(result)
+            lat = result['latency_ms']
+            fmt = lambda v: f"{v:>10.2f}" if v is not None else f"{'-':>10}"
+            print(f"{concurrency:>6} {result['throughput_rps']:>10.2f} {fmt(lat['p50'])} "
+                  f"{fmt(lat['p95'])} {fmt(lat['p99'])} {result['error_rate'] * 100:>7.2f}%")
+
+        report = {
+            'generated_at': datetime.now().isoformat(),
+            'config': {
+                'mode': 'external' if args.url else args.mode,
+                'url': args.url,
+                'workers': args.workers,
+                'threads': server_threads(args),
+                'mix': args.mix,
+                'batch_size': args.batch_size,
+                'duration_s': args.duration,
+                'cpu_count': os.cpu_count(),
+                'platform': platform.platform()
+            },
+            'levels': levels
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+        return 0
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the ML backend locally')
+    parser.add_argument('--mode', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Threads per gunicorn worker (default: gunicorn.conf.py, sized for admission control)')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32,64', help='Comma separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Warmup seconds before the first level')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Route weights, e.g. predict=0.9,health=0.05,model-info=0.05 '
+                             '(also: predict-live, prices, explain, storage, ping)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Inputs per /explain request and lots per /storage/optimize request')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='loadtest_results.json', help='Machine-readable results file')
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
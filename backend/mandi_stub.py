@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the data.gov.in mandi price API
+Answers /<resource>?filters[commodity]=..&filters[market]=.. like the daily price
+resource, with a deterministic price per crop and market and a configurable
+delay, so the backend's price lookups can be measured without the real upstream.
+GET /stats returns how many upstream requests the stub has served.
+
+Usage:
+    python mandi_stub.py --port 8081 --delay-ms 400
+    MANDI_API_BASE_URL=http://127.0.0.1:8081 python app.py
+    curl 'http://localhost:5000/prices/current?crop=Wheat&mandi=Ludhiana'
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.0
+    fail_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            return self._send(200, {'requests': StubHandler.requests_served})
+        with StubHandler.lock:
+            StubHandler.requests_served += 1
+        time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            return self._send(503, {'error': 'stub failure'})
+
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        crop = query.get('filters[commodity]', 'Wheat')
+        market = query.get('filters[market]', 'Ludhiana')
+        rng = random.Random(f'{crop}|{market}')
+        modal = round(rng.uniform(900, 6000))
+        record = {
+            'state': query.get('filters[state.keyword]', 'Punjab'),
+            'district': query.get('filters[district]', market),
+            'market': market,
+            'commodity': crop,
+            'variety': 'Other',
+            'grade': 'FAQ',
+            'arrival_date': datetime.now().strftime('%d/%m/%Y'),
+            'min_price': str(round(modal * 0.95)),
+            'max_price': str(round(modal * 1.05)),
+            'modal_price': str(modal)
+        }
+        self._send(200, {'status': 'ok', 'count': 1, 'records': [record]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--delay-ms', type=float, default=400.0, help='Added latency per request')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay_ms / 1000
+    StubHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"🌾 Mandi price stub on http://{args.host}:{args.port} (delay {args.delay_ms:.0f} ms, fail rate {args.fail_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Stub stopped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Process memory statistics for the ML backend
+Reports unique (USS), proportional (PSS) and shared memory per worker from
+/proc so copy-on-write sharing of a preloaded model can be verified.
+"""
+import os
+import resource
+
+# smaps_rollup fields, all reported in kB
+_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+    'Swap': 'swap'
+}
+
+
+def _read_smaps(pid):
+    """Sum the smaps fields of a process, preferring the cheap rollup file"""
+    totals = {key: 0 for key in _FIELDS.values()}
+    for name in ('smaps_rollup', 'smaps'):
+        path = f"/proc/{pid}/{name}"
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                field, _, rest = line.partition(':')
+                key = _FIELDS.get(field)
+                if key and rest.strip().endswith('kB'):
+                    totals[key] += int(rest.split()[0])
+        return totals
+    return None
+
+
+def process_memory(pid=None):
+    """Return USS/PSS/RSS in bytes for a process (the current one by default)"""
+    pid = pid or os.getpid()
+    totals = _read_smaps(pid)
+    if totals is None:
+        # Not on Linux, only the peak RSS is available
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'pid': pid, 'available': False, 'peak_rss_bytes': peak * 1024}
+
+    kb = 1024
+    return {
+        'pid': pid,
+        'available': True,
+        'rss_bytes': totals['rss'] * kb,
+        'pss_bytes': totals['pss'] * kb,
+        'uss_bytes': (totals['private_clean'] + totals['private_dirty']) * kb,
+        'shared_bytes': (totals['shared_clean'] + totals['shared_dirty']) * kb,
+        'swap_bytes': totals['swap'] * kb
+    }
+
+
+def child_pids(pid):
+    """List the direct children of a process"""
+    children = []
+    task_dir = f"/proc/{pid}/task"
+    if not os.path.isdir(task_dir):
+        return children
+    for tid in os.listdir(task_dir):
+        try:
+            with open(f"{task_dir}/{tid}/children") as f:
+                children.extend(int(c) for c in f.read().split())
+        except OSError:
+            continue
+    return sorted(set(children))
+
+
+def worker_memory_report():
+    """Memory of this worker, the master and every sibling worker"""
+    master = os.getppid()
+    workers = []
+    for pid in child_pids(master):
+        try:
+            workers.append(process_memory(pid))
+        except (OSError, PermissionError):
+            continue
+    report = {
+        'current_worker': process_memory(),
+        'master': process_memory(master) if os.path.exists(f"/proc/{master}") else None,
+        'workers': workers
+    }
+    if workers and all(w.get('available') for w in workers):
+        report['totals'] = {
+            'workers': len(workers),
+            'uss_bytes': sum(w['uss_bytes'] for w in workers),
+            'pss_bytes': sum(w['pss_bytes'] for w in workers),
+            'rss_bytes': sum(w['rss_bytes'] for w in workers)
+        }
+    return report
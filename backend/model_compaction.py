@@ -0,0 +1,248 @@
+"""
+Compact variants of the XGBoost model and their cost/accuracy trade-off
+Builds reduced versions of the served model by capping the number of trees,
+pruning low-gain splits and rounding thresholds/leaf values to float16, then
+measures each variant on a holdout window of the price history: pickle size,
+load time, single-row and batch latency, and MAE/MAPE against the full model.
+Used by export_model.py --compact.
+"""
+import io
+import json
+import time
+import pickle
+import statistics
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from history_features import HistoryFeatureBuilder, iter_history_chunks
+
+FLOAT16_MAX = float(np.finfo(np.float16).max)
+SINGLE_ROW_REPEATS = 200
+BATCH_SIZE = 1000
+BATCH_REPEATS = 5
+
+
+def booster_json(booster):
+    return json.loads(booster.save_raw('json'))
+
+
+def count_leaves(model_json):
+    trees = model_json['learner']['gradient_booster']['model']['trees']
+    return sum(sum(1 for child in tree['left_children'] if child == -1) for tree in trees)
+
+
+def split_gains(model_json):
+    """loss_change of every split node in the ensemble"""
+    gains = []
+    for tree in model_json['learner']['gradient_booster']['model']['trees']:
+        gains.extend(g for g, child in zip(tree['loss_changes'], tree['left_children']) if child != -1)
+    return np.array(gains)
+
+
+def prune_tree(tree, min_gain):
+    """Collapse splits whose children are leaves and whose gain is below min_gain, bottom-up
+
+    A collapsed node predicts the hessian-weighted mean of its two leaves, so the
+    tree's average output over the training data is unchanged.
+    """
+    if tree['categories']:
+        return tree
+    left, right = tree['left_children'], tree['right_children']
+    value = list(tree['split_conditions'])
+    is_leaf = [child == -1 for child in left]
+
+    # Reversed pre-order visits children before their parent
+    preorder, stack = [], [0]
+    while stack:
+        node = stack.pop()
+        preorder.append(node)
+        if not is_leaf[node]:
+            stack.extend([left[node], right[node]])
+    for node in reversed(preorder):
+        if is_leaf[node]:
+            continue
+        l, r = left[node], right[node]
+        if is_leaf[l] and is_leaf[r] and tree['loss_changes'][node] < min_gain:
+            hl, hr = tree['sum_hessian'][l], tree['sum_hessian'][r]
+            total = hl + hr
+            value[node] = (hl * value[l] + hr * value[r]) / total if total > 0 else (value[l] + value[r]) / 2
+            is_leaf[node] = True
+
+    # Renumber the reachable nodes breadth-first
+    order = [0]
+    for node in order:
+        if not is_leaf[node]:
+            order.extend([left[node], right[node]])
+    new_id = {node: i for i, node in enumerate(order)}
+
+    pruned = dict(tree)
+    pruned['left_children'] = [-1 if is_leaf[n] else new_id[left[n]] for n in order]
+    pruned['right_children'] = [-1 if is_leaf[n] else new_id[right[n]] for n in order]
+    pruned['parents'] = [2147483647] * len(order)
+    for n in order:
+        if not is_leaf[n]:
+            pruned['parents'][new_id[left[n]]] = new_id[n]
+            pruned['parents'][new_id[right[n]]] = new_id[n]
+    pruned['split_conditions'] = [value[n] for n in order]
+    pruned['split_indices'] = [0 if is_leaf[n] else tree['split_indices'][n] for n in order]
+    pruned['loss_changes'] = [0.0 if is_leaf[n] else tree['loss_changes'][n] for n in order]
+    pruned['default_left'] = [0 if is_leaf[n] else tree['default_left'][n] for n in order]
+    pruned['split_type'] = [0 if is_leaf[n] else tree['split_type'][n] for n in order]
+    pruned['base_weights'] = [value[n] if is_leaf[n] else tree['base_weights'][n] for n in order]
+    pruned['sum_hessian'] = [tree['sum_hessian'][n] for n in order]
+    pruned['tree_param'] = dict(tree['tree_param'], num_nodes=str(len(order)), num_deleted='0')
+    return pruned
+
+
+def to_float16(values):
+    """Round to the nearest float16 value; magnitudes float16 cannot hold stay as they are"""
+    array = np.asarray(values, dtype=np.float64)
+    with np.errstate(over='ignore'):
+        rounded = array.astype(np.float16).astype(np.float64)
+    return np.where(np.abs(array) <= FLOAT16_MAX, rounded, array).tolist()
+
+
+def build_variant(model, max_trees=None, min_gain=None, precision='float32'):
+    """Return an XGBRegressor with the reductions applied (XGBoost itself stores float32)"""
+    booster = model.get_booster()
+    if max_trees and max_trees < booster.num_boosted_rounds():
+        booster = booster[:max_trees]
+    model_json = booster_json(booster)
+    trees = model_json['learner']['gradient_booster']['model']['trees']
+    if min_gain:
+        trees[:] = [prune_tree(tree, min_gain) for tree in trees]
+    if precision == 'float16':
+        for tree in trees:
+            tree['split_conditions'] = to_float16(tree['split_conditions'])
+            tree['base_weights'] = to_float16(tree['base_weights'])
+
+    variant = xgb.XGBRegressor(**model.get_params())
+    variant.load_model(bytearray(json.dumps(model_json).encode('utf-8')))
+    return variant, model_json
+
+
+def load_holdout(paths, encoders, feature_columns, holdout_days, max_rows, chunksize=200000, seed=42):
+    """Feature rows and next-day targets of the last holdout_days of the history"""
+    end = None
+    for chunk in iter_history_chunks(paths, chunksize):
+        chunk_max = chunk['date'].max()
+        end = chunk_max if end is None else max(end, chunk_max)
+    if end is None:
+        raise ValueError('No history rows found')
+    cutoff = end - pd.Timedelta(days=holdout_days)
+
+    builder = HistoryFeatureBuilder(encoders, feature_columns)
+    parts = []
+    for chunk in iter_history_chunks(paths, chunksize):
+        rows = builder.process(chunk)
+        rows = rows[rows['date'] > cutoff]
+        if len(rows):
+            parts.append(rows)
+    if not parts:
+        raise ValueError(f'No rows in the last {holdout_days} days of history')
+    holdout = pd.concat(parts, ignore_index=True)
+    if len(holdout) > max_rows:
+        holdout = holdout.sample(max_rows, random_state=seed)
+    return holdout[feature_columns].to_numpy(dtype=np.float32), holdout['target'].to_numpy(dtype=float)
+
+
+def accuracy(predictions, target):
+    err = np.abs(predictions - target)
+    nonzero = target != 0
+    return {
+        'mae': float(err.mean()),
+        'mape': float((err[nonzero] / target[nonzero]).mean() * 100) if nonzero.any() else None
+    }
+
+
+def measure(variant, features, target, nthread):
+    """Size, load time, latency and accuracy of one model"""
+    blob = pickle.dumps(variant)
+    start = time.perf_counter()
+    loaded = pickle.load(io.BytesIO(blob))
+    load_ms = (time.perf_counter() - start) * 1000
+    loaded.set_params(n_jobs=nthread)
+
+    # Single rows as /predict sends them (a Python list), batches as the backtest does
+    row = [features[0].tolist()]
+    loaded.predict(row)
+    single = []
+    for i in range(SINGLE_ROW_REPEATS):
+        start = time.perf_counter()
+        loaded.predict(row)
+        single.append((time.perf_counter() - start) * 1000)
+    batch_rows = features[np.arange(BATCH_SIZE) % len(features)]
+    batch = []
+    for i in range(BATCH_REPEATS):
+        start = time.perf_counter()
+        loaded.predict(batch_rows)
+        batch.append((time.perf_counter() - start) * 1000)
+
+    predictions = loaded.predict(features)
+    return predictions, dict(
+        size_kb=round(len(blob) / 1024, 1),
+        load_ms=round(load_ms, 2),
+        single_row_p50_ms=round(statistics.median(single), 4),
+        batch_1000_ms=round(statistics.median(batch), 3),
+        **accuracy(predictions, target)
+    )
+
+
+def variant_grid(tree_caps, prune_quantiles, precisions):
+    specs = [{'max_trees': None, 'prune_quantile': None, 'precision': 'float32'}]
+    for cap in [None] + list(tree_caps):
+        for quantile in [None] + list(prune_quantiles):
+            for precision in precisions:
+                spec = {'max_trees': cap, 'prune_quantile': quantile, 'precision': precision}
+                if spec not in specs:
+                    specs.append(spec)
+    return specs
+
+
+def variant_name(spec):
+    parts = []
+    if spec['max_trees']:
+        parts.append(f"trees{spec['max_trees']}")
+    if spec['prune_quantile']:
+        parts.append(f"prune{int(spec['prune_quantile'] * 100)}")
+    if spec['precision'] != 'float32':
+        parts.append(spec['precision'])
+    return '+'.join(parts) or 'full'
+
+
+def compare_variants(model, features, target, specs, nthread=1):
+    """Measure every variant against the full model; returns (rows, variants by name)"""
+    gains = split_gains(booster_json(model.get_booster()))
+    full_predictions = None
+    full = None
+    rows = []
+    variants = {}
+    for spec in specs:
+        min_gain = float(np.quantile(gains, spec['prune_quantile'])) if spec['prune_quantile'] else None
+        variant, model_json = build_variant(model, spec['max_trees'], min_gain, spec['precision'])
+        predictions, stats = measure(variant, features, target, nthread)
+        name = variant_name(spec)
+        if full is None:
+            full, full_predictions = stats, predictions
+        row = dict(
+            variant=name,
+            trees=len(model_json['learner']['gradient_booster']['model']['trees']),
+            leaves=count_leaves(model_json),
+            min_gain=min_gain,
+            **stats,
+            mae_delta=round(stats['mae'] - full['mae'], 4),
+            mape_delta=round(stats['mape'] - full['mape'], 4) if stats['mape'] is not None else None,
+            mean_abs_diff_vs_full=float(np.abs(predictions - full_predictions).mean()),
+            spec=spec
+        )
+        rows.append(row)
+        variants[name] = variant
+    return rows, variants
+
+
+def pick_cheapest(rows, max_mape_increase, optimize_for='single_row_p50_ms'):
+    """Cheapest variant whose MAPE is within the budget (the full model always qualifies)"""
+    eligible = [row for row in rows if row['mape_delta'] is None or row['mape_delta'] <= max_mape_increase]
+    return min(eligible, key=lambda row: (row[optimize_for], row['size_kb']))
@@ -0,0 +1,280 @@
+"""
+In-process registry of model bundles with canary routing and shadow scoring
+The primary bundle (models/) serves by default. An optional candidate bundle
+takes a fraction of traffic and/or specific crops, and an optional shadow
+bundle scores the same inputs on a background thread so it never adds to
+request latency. Served and shadow latency plus prediction differences
+between versions are kept in fixed-size sketches.
+
+Routing changes made through the API are kept in a small SQLite store so every
+gunicorn worker follows the same canary split; each worker re-reads it when
+another process has changed it.
+"""
+import os
+import json
+import time
+import queue
+import pickle
+import zlib
+import sqlite3
+import threading
+from datetime import datetime
+
+from drift import FeatureSketch
+
+MODEL_FILES = {
+    'model': 'market_price_model.pkl',
+    'encoders': 'encoders.pkl',
+    'feature_columns': 'feature_columns.pkl',
+    'metadata': 'model_metadata.pkl'
+}
+
+ROLES = ['primary', 'candidate', 'shadow']
+
+
+def load_bundle(models_dir):
+    """Load the serving artifacts of a models directory, or None if there are none"""
+    # Resolve a symlinked directory once, so a swap by train_incremental.py mid-load cannot mix bundles
+    models_dir = os.path.realpath(models_dir)
+    bundle = {}
+    for name, filename in MODEL_FILES.items():
+        path = os.path.join(models_dir, filename)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            bundle[name] = pickle.load(f)
+    return bundle
+
+
+def bundle_version(bundle):
+    metadata = bundle['metadata']
+    return f"{metadata.get('version', 'unknown')}@{metadata.get('training_date', '')}"
+
+
+class SQLiteRoutingStore:
+    """Canary routing shared by all worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self):
+        # Opened on first use in each process; SQLite connections must not cross a fork
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''create table if not exists model_routing (
+                id integer primary key check (id = 1), canary_fraction real not null,
+                canary_crops text not null, updated_at text not null)''')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def data_version(self):
+        """Changes when another connection commits (SQLite PRAGMA data_version)"""
+        return self.conn.execute('pragma data_version').fetchone()[0]
+
+    def get(self):
+        """(fraction, crops) last saved, or None if routing was never changed"""
+        row = self.conn.execute('select canary_fraction, canary_crops from model_routing where id = 1').fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put(self, fraction, crops):
+        self.conn.execute('insert or replace into model_routing (id, canary_fraction, canary_crops, updated_at) '
+                          'values (1, ?, ?, ?)', (fraction, json.dumps(sorted(crops)), datetime.now().isoformat()))
+        self.conn.commit()
+
+
+class ModelRegistry:
+    """Model bundles by role, canary routing and off-path shadow comparisons"""
+
+    def __init__(self, canary_fraction=0.0, canary_crops=(), shadow_sample_rate=1.0,
+                 shadow_queue_size=1000, reservoir_size=256, routing_store=None):
+        self.bundles = {}
+        self.canary_fraction = canary_fraction
+        self.canary_crops = set(canary_crops)
+        self.shadow_sample_rate = shadow_sample_rate
+        self.reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=shadow_queue_size)
+        self._worker = None
+        self._worker_pid = None
+        self.routing_store = routing_store
+        self._routing_version = None
+        # Set by the app: scorer(bundle, input_data) -> prediction
+        self.scorer = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.served = {role: 0 for role in ROLES}
+            self.latency = {}
+            self.diffs = {}
+            self.shadow_dropped = 0
+            self.shadow_errors = 0
+            self.stats_since = datetime.now().isoformat()
+
+    def register(self, role, bundle, path=None):
+        bundle = dict(bundle, path=path, version=bundle_version(bundle),
+                      loaded_at=datetime.now().isoformat())
+        with self._lock:
+            self.bundles[role] = bundle
+        return bundle
+
+    def load(self, role, models_dir, nthread=None):
+        """Load a bundle from disk into a role; returns the bundle or None"""
+        bundle = load_bundle(models_dir)
+        if bundle is None:
+            return None
+        if nthread:
+            bundle['model'].set_params(n_jobs=int(nthread))
+        return self.register(role, bundle, models_dir)
+
+    def get(self, role):
+        return self.bundles.get(role)
+
+    def set_routing(self, fraction=None, crops=None):
+        """Change canary routing; with a routing store every worker picks it up"""
+        self.refresh_routing()
+        with self._lock:
+            if fraction is not None:
+                self.canary_fraction = min(max(float(fraction), 0.0), 1.0)
+            if crops is not None:
+                self.canary_crops = set(crops)
+            if self.routing_store is not None:
+                self.routing_store.put(self.canary_fraction, self.canary_crops)
+                self._routing_version = (os.getpid(), self.routing_store.data_version())
+
+    def refresh_routing(self):
+        """Apply routing saved by another worker; a no-op while the store is unchanged"""
+        if self.routing_store is None:
+            return
+        # data_version is per connection, and each process has its own
+        version = (os.getpid(), self.routing_store.data_version())
+        if version == self._routing_version:
+            return
+        saved = self.routing_store.get()
+        with self._lock:
+            if saved is not None:
+                self.canary_fraction, crops = saved
+                self.canary_crops = set(crops)
+            self._routing_version = version
+
+    def route(self, input_data):
+        """Pick the role serving this input; a (crop, mandi) series always gets the same one"""
+        if 'candidate' not in self.bundles:
+            return 'primary'
+        self.refresh_routing()
+        crop = str(input_data.get('crop', ''))
+        if crop in self.canary_crops:
+            return 'candidate'
+        if self.canary_fraction > 0:
+            key = f"{crop}|{input_data.get('mandi', '')}".encode('utf-8')
+            if zlib.crc32(key) % 10000 < self.canary_fraction * 10000:
+                return 'candidate'
+        return 'primary'
+
+    def _sketch(self, table, key):
+        sketch = table.get(key)
+        if sketch is None:
+            sketch = table[key] = FeatureSketch([], self.reservoir_size)
+        return sketch
+
+    def record_served(self, role, latency_ms):
+        with self._lock:
+            self.served[role] += 1
+            self._sketch(self.latency, f'{role}:served').add(latency_ms)
+
+    def submit(self, input_data, served_role, served_prediction):
+        """Queue off-path comparisons for a served prediction; never blocks"""
+        compare = []
+        if 'shadow' in self.bundles and (self.shadow_sample_rate >= 1.0 or
+                                         zlib.crc32(repr(input_data).encode('utf-8')) % 10000
+                                         < self.shadow_sample_rate * 10000):
+            compare.append('shadow')
+        if served_role == 'candidate':
+            # Score the primary too, so the canary's difference is measured without a second on-path predict
+            compare.append('primary')
+        if not compare:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((input_data, served_role, served_prediction, compare))
+        except queue.Full:
+            with self._lock:
+                self.shadow_dropped += 1
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so every gunicorn worker starts its own
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run_shadow, name='shadow-scoring', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run_shadow(self):
+        while True:
+            input_data, served_role, served_prediction, compare = self._queue.get()
+            for role in compare:
+                bundle = self.bundles.get(role)
+                if bundle is None:
+                    continue
+                try:
+                    start = time.perf_counter()
+                    prediction = self.scorer(bundle, input_data)
+                    latency_ms = (time.perf_counter() - start) * 1000
+                except Exception:
+                    with self._lock:
+                        self.shadow_errors += 1
+                    continue
+                diff = prediction - served_prediction
+                with self._lock:
+                    self._sketch(self.latency, f'{role}:shadow').add(latency_ms)
+                    self._sketch(self.diffs, f'{role}_vs_{served_role}:abs').add(abs(diff))
+                    if served_prediction:
+                        self._sketch(self.diffs, f'{role}_vs_{served_role}:pct').add(diff / served_prediction * 100)
+
+    def stats(self):
+        self.refresh_routing()
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'since': self.stats_since,
+                'versions': {
+                    role: {key: bundle[key] for key in ('version', 'path', 'loaded_at')}
+                    for role, bundle in self.bundles.items()
+                },
+                'routing': {
+                    'canary_fraction': self.canary_fraction,
+                    'canary_crops': sorted(self.canary_crops),
+                    'shadow_sample_rate': self.shadow_sample_rate
+                },
+                'served': dict(self.served),
+                'latency_ms': {key: sketch.summary() for key, sketch in self.latency.items()},
+                'prediction_diff': {key: sketch.summary() for key, sketch in self.diffs.items()},
+                'shadow_queue_depth': self._queue.qsize(),
+                'shadow_dropped': self.shadow_dropped,
+                'shadow_errors': self.shadow_errors
+            }
+
+
+def registry_from_env():
+    """Build a registry from CANARY_* / SHADOW_* environment variables
+
+    CANARY_FRACTION / CANARY_CROPS are the starting split; routing saved through
+    the API (MODEL_ROUTING_PATH) takes precedence once it exists.
+    """
+    crops = [c.strip() for c in os.environ.get('CANARY_CROPS', '').split(',') if c.strip()]
+    return ModelRegistry(
+        canary_fraction=float(os.environ.get('CANARY_FRACTION', '0')),
+        canary_crops=crops,
+        shadow_sample_rate=float(os.environ.get('SHADOW_SAMPLE_RATE', '1.0')),
+        shadow_queue_size=int(os.environ.get('SHADOW_QUEUE_SIZE', '1000')),
+        routing_store=SQLiteRoutingStore(os.environ.get('MODEL_ROUTING_PATH', 'model_routing.db'))
+    )
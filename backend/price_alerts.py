@@ -0,0 +1,428 @@
+"""
+Server-side price alert engine
+Alert thresholds are kept in sorted lists per (field, crop, mandi), one for
+'above' and one for 'below' alerts, so every alert triggered by a new price is
+a contiguous slice found with two binary searches. A batch of price/forecast
+events is evaluated in one pass without touching untriggered alerts, and the
+resulting notifications are written to a pluggable sink in a single bulk call.
+
+Alerts live in a SQLite store so every gunicorn worker sees the same set; a
+worker rebuilds its index when another process has changed the store.
+"""
+import os
+import abc
+import math
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('price', 'forecast')
+CONDITIONS = ('above', 'below')
+ANY_MANDI = '*'
+
+
+def normalize(value):
+    return str(value or '').strip().lower()
+
+
+def alert_key(field, crop, mandi):
+    return field, normalize(crop), normalize(mandi) or ANY_MANDI
+
+
+def parse_number(value, name):
+    """value as a finite float; raises ValueError naming the field"""
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be a finite number')
+    return number
+
+
+def parse_alert(data):
+    """Validate a registration payload into an alert row; raises ValueError
+
+    The id is always generated here, so a client cannot overwrite another user's alert.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('each alert must be an object')
+    user_id = data.get('userId')
+    if not isinstance(user_id, str) or not user_id.strip():
+        raise ValueError('userId is required')
+    crop = normalize(data.get('crop'))
+    if not crop:
+        raise ValueError('crop is required')
+    condition = data.get('condition', 'above')
+    if condition not in CONDITIONS:
+        raise ValueError("condition must be 'above' or 'below'")
+    field = data.get('field', 'price')
+    if field not in FIELDS:
+        raise ValueError("field must be 'price' or 'forecast'")
+    target = parse_number(data.get('targetPrice', 0), 'targetPrice')
+    if target <= 0:
+        raise ValueError('targetPrice must be positive')
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id.strip(),
+        'crop': crop,
+        'mandi': normalize(data.get('mandi')) or ANY_MANDI,
+        'field': field,
+        'condition': condition,
+        'target_price': target,
+        'one_shot': 0 if data.get('repeat') else 1,
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def parse_event(data):
+    """Validate an evaluation event {crop, mandi?, price?, forecast?} with numeric prices; raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('each event must be an object')
+    if not normalize(data.get('crop')):
+        raise ValueError('crop is required')
+    event = dict(data)
+    for field in FIELDS:
+        if event.get(field) is not None:
+            event[field] = parse_number(event[field], field)
+    if event.get('price') is None and event.get('forecast') is None:
+        raise ValueError('price or forecast is required')
+    return event
+
+
+class ThresholdIndex:
+    """Sorted (threshold, alert id) lists for one (field, crop, mandi)"""
+
+    def __init__(self):
+        self.above = ([], [])
+        self.below = ([], [])
+
+    def __len__(self):
+        return len(self.above[0]) + len(self.below[0])
+
+    def add(self, condition, threshold, alert_id):
+        thresholds, ids = self.above if condition == 'above' else self.below
+        position = bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        ids.insert(position, alert_id)
+
+    def remove(self, condition, threshold, alert_id):
+        thresholds, ids = self.above if condition == 'above' else self.below
+        position = bisect_left(thresholds, threshold)
+        while position < len(thresholds) and thresholds[position] == threshold:
+            if ids[position] == alert_id:
+                del thresholds[position]
+                del ids[position]
+                return True
+            position += 1
+        return False
+
+    def discard(self, alert_ids):
+        """Drop many alerts in one pass over each list"""
+        for thresholds, ids in (self.above, self.below):
+            if any(alert_id in alert_ids for alert_id in ids):
+                kept = [(t, i) for t, i in zip(thresholds, ids) if i not in alert_ids]
+                thresholds[:] = [t for t, i in kept]
+                ids[:] = [i for t, i in kept]
+
+    def triggered(self, price):
+        """Ids of 'above' alerts with threshold <= price and 'below' alerts with threshold >= price"""
+        above = self.above[1][:bisect_right(self.above[0], price)]
+        below = self.below[1][bisect_left(self.below[0], price):]
+        return above, below
+
+
+class NotificationSink(abc.ABC):
+    """Where triggered alerts go; write_many receives every notification of one evaluation"""
+
+    @abc.abstractmethod
+    def write_many(self, notifications):
+        pass
+
+
+class LogNotificationSink(NotificationSink):
+    def write_many(self, notifications):
+        for notification in notifications:
+            logger.info(f"🔔 {notification['message']}")
+
+
+class SQLiteNotificationSink(NotificationSink):
+    """Local stand-in for the notifications table: one transaction per batch"""
+
+    def __init__(self, path):
+        self.path = path
+        self._created = False
+
+    def write_many(self, notifications):
+        rows = [(n['id'], n['alertId'], n['userId'], n['crop'], n['mandi'], n['field'], n['condition'],
+                 n['targetPrice'], n['observedPrice'], n['message'], n['createdAt']) for n in notifications]
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                if not self._created:
+                    conn.execute('''create table if not exists alert_notifications (
+                        id text primary key, alert_id text not null, user_id text, crop text not null,
+                        mandi text not null, field text not null, condition text not null,
+                        target_price real not null, observed_price real not null, message text not null,
+                        created_at text not null)''')
+                    self._created = True
+                conn.executemany('insert into alert_notifications values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        finally:
+            conn.close()
+
+
+class SQLiteAlertStore:
+    """Registered alerts shared by all worker processes"""
+
+    COLUMNS = ('id', 'user_id', 'crop', 'mandi', 'field', 'condition', 'target_price', 'one_shot', 'created_at')
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self):
+        # Opened on first use in each process; SQLite connections must not cross a fork
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''create table if not exists price_alerts (
+                id text primary key, user_id text, crop text not null, mandi text not null,
+                field text not null, condition text not null, target_price real not null,
+                one_shot integer not null, created_at text not null, active integer not null default 1)''')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def data_version(self):
+        """Changes when another connection commits (SQLite PRAGMA data_version)"""
+        return self.conn.execute('pragma data_version').fetchone()[0]
+
+    def add_many(self, alerts):
+        self.conn.executemany(
+            f"insert into price_alerts ({', '.join(self.COLUMNS)}) values ({', '.join('?' * len(self.COLUMNS))})",
+            [tuple(alert[c] for c in self.COLUMNS) for alert in alerts])
+        self.conn.commit()
+
+    def deactivate_many(self, alert_ids, user_id=None):
+        """Deactivate alerts by id; with user_id, only that user's alerts"""
+        if user_id is None:
+            self.conn.executemany('update price_alerts set active = 0 where id = ?', [(i,) for i in alert_ids])
+        else:
+            self.conn.executemany('update price_alerts set active = 0 where id = ? and user_id = ?',
+                                  [(i, user_id) for i in alert_ids])
+        self.conn.commit()
+
+    def active(self):
+        cursor = self.conn.execute(f"select {', '.join(self.COLUMNS)} from price_alerts where active = 1")
+        return [dict(zip(self.COLUMNS, row)) for row in cursor]
+
+
+class AlertEngine:
+    """Sorted threshold indexes over the store's active alerts plus evaluation stats"""
+
+    def __init__(self, store, sink):
+        self.store = store
+        self.sink = sink
+        self._lock = threading.Lock()
+        self.indexes = {}
+        self.alerts = {}
+        self._version = None
+        self.totals = {'evaluations': 0, 'events': 0, 'notifications': 0, 'eval_ms': 0.0, 'write_ms': 0.0}
+        self.last_evaluation = None
+
+    def _refresh(self):
+        # data_version is per connection, and each process has its own
+        version = (os.getpid(), self.store.data_version())
+        if version == self._version:
+            return
+        start = time.perf_counter()
+        alerts = self.store.active()
+        grouped = {}
+        for alert in alerts:
+            grouped.setdefault(alert_key(alert['field'], alert['crop'], alert['mandi']), []).append(alert)
+        indexes = {}
+        for key, rows in grouped.items():
+            index = ThresholdIndex()
+            for condition in CONDITIONS:
+                ordered = sorted((r for r in rows if r['condition'] == condition), key=lambda r: r['target_price'])
+                thresholds, ids = index.above if condition == 'above' else index.below
+                thresholds.extend(r['target_price'] for r in ordered)
+                ids.extend(r['id'] for r in ordered)
+            indexes[key] = index
+        self.indexes = indexes
+        self.alerts = {alert['id']: alert for alert in alerts}
+        self._version = version
+        logger.info(f"🔔 Alert index rebuilt: {len(alerts)} alerts in {len(indexes)} keys "
+                    f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+    def _index_add(self, alert):
+        key = alert_key(alert['field'], alert['crop'], alert['mandi'])
+        self.indexes.setdefault(key, ThresholdIndex()).add(alert['condition'], alert['target_price'], alert['id'])
+        self.alerts[alert['id']] = alert
+
+    def _index_remove(self, alert_id):
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return False
+        key = alert_key(alert['field'], alert['crop'], alert['mandi'])
+        index = self.indexes.get(key)
+        if index is not None:
+            index.remove(alert['condition'], alert['target_price'], alert_id)
+            if not len(index):
+                del self.indexes[key]
+        return True
+
+    def _index_discard(self, alert_ids):
+        by_key = {}
+        for alert_id in alert_ids:
+            alert = self.alerts.pop(alert_id)
+            by_key.setdefault(alert_key(alert['field'], alert['crop'], alert['mandi']), set()).add(alert_id)
+        for key, ids in by_key.items():
+            index = self.indexes[key]
+            index.discard(ids)
+            if not len(index):
+                del self.indexes[key]
+
+    def register(self, alerts):
+        with self._lock:
+            self._refresh()
+            self.store.add_many(alerts)
+            for alert in alerts:
+                self._index_add(alert)
+        return [alert['id'] for alert in alerts]
+
+    def remove(self, alert_ids, user_id):
+        """Deactivate the given alerts that belong to user_id; returns the removed ids"""
+        with self._lock:
+            self._refresh()
+            owned = [alert_id for alert_id in alert_ids
+                     if alert_id in self.alerts and self.alerts[alert_id]['user_id'] == user_id]
+            removed = [alert_id for alert_id in owned if self._index_remove(alert_id)]
+            if removed:
+                self.store.deactivate_many(removed, user_id)
+        return removed
+
+    def evaluate(self, events):
+        """Match a batch of {crop, mandi, price?, forecast?} events and bulk-write the notifications"""
+        with self._lock:
+            self._refresh()
+            start = time.perf_counter()
+            matches = []
+            fan_out = []
+            fired = set()
+            for position, event in enumerate(events):
+                before = len(matches)
+                for field in FIELDS:
+                    price = event.get(field)
+                    if price is None:
+                        continue
+                    price = float(price)
+                    for key in {alert_key(field, event.get('crop'), event.get('mandi')),
+                                alert_key(field, event.get('crop'), ANY_MANDI)}:
+                        index = self.indexes.get(key)
+                        if index is None:
+                            continue
+                        for alert_ids in index.triggered(price):
+                            for alert_id in alert_ids:
+                                if alert_id not in fired:
+                                    fired.add(alert_id)
+                                    matches.append((alert_id, position, price))
+                fan_out.append(len(matches) - before)
+            match_ms = (time.perf_counter() - start) * 1000
+
+            now = datetime.now().isoformat()
+            notifications = self._notifications(matches, events, now)
+            # One-shot alerts fire once, like the client-side alerts did
+            spent = [alert_id for alert_id, _, _ in matches if self.alerts[alert_id]['one_shot']]
+            eval_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            if notifications:
+                self.sink.write_many(notifications)
+            if spent:
+                # Our own commits change data_version for the other workers only
+                self.store.deactivate_many(spent)
+            write_ms = (time.perf_counter() - start) * 1000
+            # Only once both writes succeeded; if either raises, the alerts stay indexed and fire again
+            self._index_discard(spent)
+
+            stats = {
+                'events': len(events),
+                'notifications': len(notifications),
+                'deactivated': len(spent),
+                'events_with_alerts': sum(1 for c in fan_out if c),
+                'max_fan_out': max(fan_out) if fan_out else 0,
+                'mean_fan_out': round(sum(fan_out) / len(fan_out), 3) if fan_out else 0.0,
+                'match_ms': round(match_ms, 3),
+                'eval_ms': round(eval_ms, 3),
+                'write_ms': round(write_ms, 3),
+                'active_alerts': len(self.alerts),
+                'evaluated_at': now
+            }
+            self.last_evaluation = stats
+            self.totals['evaluations'] += 1
+            self.totals['events'] += len(events)
+            self.totals['notifications'] += len(notifications)
+            self.totals['eval_ms'] += eval_ms
+            self.totals['write_ms'] += write_ms
+            return stats
+
+    def _notifications(self, matches, events, now):
+        """Notification rows for the matched (alert id, event position, price) triples"""
+        # Ids share a per-batch prefix; one uuid4 per row costs more than the matching
+        batch = uuid.uuid4().hex
+        places = [(str(event.get('crop')), normalize(event.get('mandi')), str(event.get('mandi'))) for event in events]
+        notifications = []
+        for number, (alert_id, position, price) in enumerate(matches):
+            alert = self.alerts[alert_id]
+            crop, mandi, mandi_label = places[position]
+            where = '' if alert['mandi'] == ANY_MANDI else f" at {mandi_label}"
+            notifications.append({
+                'id': f'{batch}-{number}',
+                'alertId': alert_id,
+                'userId': alert['user_id'],
+                'crop': alert['crop'],
+                'mandi': mandi,
+                'field': alert['field'],
+                'condition': alert['condition'],
+                'targetPrice': alert['target_price'],
+                'observedPrice': round(price, 2),
+                'message': (f"{crop}{where}: {alert['field']} Rs.{price:.2f}/quintal is "
+                            f"{alert['condition']} your target Rs.{alert['target_price']:.2f}"),
+                'createdAt': now
+            })
+        return notifications
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            sizes = [len(index) for index in self.indexes.values()]
+            return {
+                'pid': os.getpid(),
+                'active_alerts': len(self.alerts),
+                'index_keys': len(self.indexes),
+                'largest_key': max(sizes) if sizes else 0,
+                'last_evaluation': self.last_evaluation,
+                'totals': dict(self.totals, eval_ms=round(self.totals['eval_ms'], 3),
+                               write_ms=round(self.totals['write_ms'], 3))
+            }
+
+
+def engine_from_env():
+    """Build an engine from ALERT_* environment variables"""
+    sink_name = os.environ.get('ALERT_SINK', 'sqlite')
+    if sink_name == 'log':
+        sink = LogNotificationSink()
+    else:
+        # A separate file, so sink writes do not look like alert changes to the store's data_version
+        sink = SQLiteNotificationSink(os.environ.get('ALERT_SINK_PATH', 'alert_notifications.db'))
+    return AlertEngine(SQLiteAlertStore(os.environ.get('ALERT_DB_PATH', 'alerts.db')), sink)
@@ -0,0 +1,408 @@
+"""
+Current mandi price lookups against data.gov.in, pooled, coalesced and cached
+The frontend used to query the daily mandi price resource on every prediction,
+opening a new connection each time and repeating the same query for the same
+crop and market. Here a lookup is answered, in order, from:
+
+1. a small per-worker LRU of recent results
+2. a SQLite price store shared by all workers (and kept across restarts)
+3. the upstream API, through one keep-alive requests.Session per worker
+
+Concurrent identical lookups in a worker wait for a single upstream call.
+Results expire with the daily update: a price for arrival date D is kept until
+PRICE_REFRESH_HOUR (IST) on D + 1, after which the store is re-checked every
+PRICE_PENDING_TTL seconds until the next day's price is published. If the
+upstream fails, a stored price up to PRICE_STALE_MAX_AGE old is served as stale;
+with nothing stored, the failure is remembered for a minute so repeated
+lookups of that key fail fast instead of each waiting on the upstream.
+
+MANDI_API_BASE_URL can point at a local stub (see mandi_stub.py).
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://api.data.gov.in/resource'
+DEFAULT_RESOURCE = '9ef84268-d588-465a-a308-a864a43d0070'
+IST = timezone(timedelta(hours=5, minutes=30))
+STALE_RETRY_SECONDS = 60
+
+
+class PriceLookupError(Exception):
+    """No price could be obtained from the store or the upstream"""
+
+
+class PriceNotFound(PriceLookupError):
+    """The upstream has no price for the query"""
+
+
+def normalize(value):
+    return str(value or '').strip().lower()
+
+
+def lookup_key(crop, state, district, market):
+    return '|'.join(normalize(v) for v in (crop, state, district, market))
+
+
+def parse_arrival_date(value):
+    """data.gov.in arrival dates are dd/mm/yyyy"""
+    try:
+        return datetime.strptime(str(value), '%d/%m/%Y').date()
+    except ValueError:
+        return None
+
+
+def parse_price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+def latest_record(records, crop, district, market):
+    """Newest matching record as a price dict (substring matching as in lib/api.ts), or None
+
+    Unlike lib/api.ts, an empty crop, district or market matches nothing
+    rather than every record.
+    """
+    crop, district, market = normalize(crop), normalize(district), normalize(market)
+    if not crop or not district or not market:
+        return None
+    best = None
+    for record in records:
+        if (crop not in normalize(record.get('commodity')) or district not in normalize(record.get('district'))
+                or market not in normalize(record.get('market'))):
+            continue
+        arrival = parse_arrival_date(record.get('arrival_date'))
+        price = (parse_price(record.get('modal_price')) or parse_price(record.get('max_price'))
+                 or parse_price(record.get('min_price')))
+        if arrival is None or price is None:
+            continue
+        if best is None or arrival > best[0]:
+            best = arrival, price, record
+    if best is None:
+        return None
+    arrival, price, record = best
+    return {
+        'price': price,
+        'minPrice': parse_price(record.get('min_price')),
+        'maxPrice': parse_price(record.get('max_price')),
+        'date': record.get('arrival_date'),
+        'arrivalDate': arrival.isoformat(),
+        'market': record.get('market'),
+        'commodity': record.get('commodity'),
+        'variety': record.get('variety'),
+        'grade': record.get('grade'),
+        'state': record.get('state'),
+        'district': record.get('district')
+    }
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another caller did the work"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class SQLitePriceStore:
+    """Latest looked-up price per query, shared by all worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        # Opened on first use in each process; SQLite connections must not cross a fork
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute('''create table if not exists mandi_prices (
+                key text primary key, record text, fetched_at real not null, expires_at real not null)''')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """(record or None, fetched_at, expires_at), or None if the query was never stored"""
+        with self._lock:
+            row = self.conn.execute('select record, fetched_at, expires_at from mandi_prices where key = ?',
+                                    (key,)).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] else None), row[1], row[2]
+
+    def put(self, key, record, fetched_at, expires_at):
+        with self._lock:
+            self.conn.execute('insert or replace into mandi_prices values (?, ?, ?, ?)',
+                              (key, json.dumps(record) if record else None, fetched_at, expires_at))
+            self.conn.commit()
+
+    def size(self):
+        with self._lock:
+            return self.conn.execute('select count(*) from mandi_prices').fetchone()[0]
+
+
+class PriceLookup:
+    """Cached, coalesced current-price lookups; lookup() is safe to call from many threads"""
+
+    def __init__(self, store, base_url=DEFAULT_BASE_URL, resource=DEFAULT_RESOURCE, api_key=None,
+                 timeout=10.0, pool_size=8, retries=2, refresh_hour=10, pending_ttl=1800,
+                 stale_max_age=3 * 86400, cache_size=2048):
+        self.store = store
+        self.url = f"{base_url.rstrip('/')}/{resource}"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self.refresh_hour = refresh_hour
+        self.pending_ttl = pending_ttl
+        self.stale_max_age = stale_max_age
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # key -> (error message, retry after) for keys whose upstream failed with nothing stored
+        self._failures = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._session = None
+        self._session_pid = None
+        self._stats_lock = threading.Lock()
+        self.counts = dict(lookups=0, memory_hits=0, store_hits=0, upstream_calls=0, coalesced=0,
+                           stale_served=0, not_found=0, errors=0, failed_fast=0)
+        self.upstream_ms = []
+
+    @property
+    def session(self):
+        # One pooled keep-alive session per worker process; sockets must not cross a fork
+        if self._session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            session = requests.Session()
+            # pool_block caps concurrent upstream connections at pool_size instead of opening extras
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True,
+                                  max_retries=Retry(total=self.retries, backoff_factor=0.3,
+                                                    status_forcelist=(429, 500, 502, 503, 504),
+                                                    allowed_methods=('GET',)))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept': 'application/json', 'User-Agent': 'AgriTech-ML-Predictor/1.0'})
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    def _count(self, name, upstream_ms=None):
+        with self._stats_lock:
+            self.counts[name] += 1
+            if upstream_ms is not None:
+                self.upstream_ms.append(upstream_ms)
+                if len(self.upstream_ms) > 1000:
+                    del self.upstream_ms[:500]
+
+    def expires_at(self, record, now):
+        """End of validity of a lookup result, aligned with the daily mandi update"""
+        if record is not None:
+            arrival = datetime.fromisoformat(record['arrivalDate']).date() + timedelta(days=1)
+            next_update = datetime(arrival.year, arrival.month, arrival.day, self.refresh_hour, tzinfo=IST)
+            if next_update.timestamp() > now:
+                return next_update.timestamp()
+        return now + self.pending_ttl
+
+    def _cache_get(self, key, now):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[2] <= now:
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key, record, fetched_at, expires_at):
+        with self._cache_lock:
+            self._cache[key] = (record, fetched_at, expires_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _failure_get(self, key, now):
+        with self._cache_lock:
+            failure = self._failures.get(key)
+            if failure is None or failure[1] <= now:
+                return None
+            return failure[0]
+
+    def _failure_put(self, key, message, retry_after):
+        with self._cache_lock:
+            self._failures[key] = (message, retry_after)
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.cache_size:
+                self._failures.popitem(last=False)
+
+    def fetch_upstream(self, crop, state, district, market):
+        """Latest matching record from the API (None if there is none); raises on transport errors"""
+        params = {
+            'format': 'json',
+            'limit': '100',
+            'filters[commodity]': crop,
+            'filters[state.keyword]': state,
+            'filters[district]': district,
+            'filters[market]': market
+        }
+        if self.api_key:
+            params['api-key'] = self.api_key
+        start = time.perf_counter()
+        response = self.session.get(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        records = response.json().get('records') or []
+        self._count('upstream_calls', (time.perf_counter() - start) * 1000)
+        return latest_record(records, crop, district, market)
+
+    def _refresh(self, key, crop, state, district, market):
+        """Store check plus upstream call for one key, run once per key at a time"""
+        now = time.time()
+        stored = self.store.get(key)
+        if stored is not None and stored[2] > now:
+            # Another worker refreshed it
+            self._cache_put(key, *stored)
+            return stored, 'store'
+        try:
+            record = self.fetch_upstream(crop, state, district, market)
+        except Exception as e:
+            self._count('errors')
+            if stored is not None and stored[0] is not None and now - stored[1] <= self.stale_max_age:
+                logger.warning(f"⚠️ Price upstream failed ({e}), serving stored price for {key}")
+                # Retry the upstream at most once a minute per key while it is down
+                self._cache_put(key, stored[0], stored[1], now + STALE_RETRY_SECONDS)
+                return stored, 'stale'
+            # Nothing to serve: fail fast for this key too instead of calling the upstream on every request
+            message = f'Price upstream failed: {e}'
+            self._failure_put(key, message, now + STALE_RETRY_SECONDS)
+            raise PriceLookupError(message)
+        entry = (record, now, self.expires_at(record, now))
+        self.store.put(key, *entry)
+        self._cache_put(key, *entry)
+        return entry, 'upstream'
+
+    def lookup(self, crop, market, district=None, state='Punjab'):
+        """Current price dict for a crop at a market, with 'source' and 'cache' describing where it came from
+
+        Raises PriceLookupError if there is no price for the query or the upstream
+        failed with nothing usable stored.
+        """
+        district = district or market
+        state = state or 'Punjab'
+        key = lookup_key(crop, state, district, market)
+        start = time.perf_counter()
+        self._count('lookups')
+
+        now = time.time()
+        entry = self._cache_get(key, now)
+        if entry is not None:
+            source = 'memory'
+            self._count('memory_hits')
+        else:
+            failure = self._failure_get(key, now)
+            if failure is not None:
+                self._count('failed_fast')
+                raise PriceLookupError(failure)
+            (entry, source), shared = self._flight.do(key, lambda: self._refresh(key, crop, state, district, market))
+            if shared:
+                self._count('coalesced')
+            elif source == 'store':
+                self._count('store_hits')
+            elif source == 'stale':
+                self._count('stale_served')
+            if shared:
+                source = 'coalesced'
+
+        record, fetched_at, expires_at = entry
+        if record is None:
+            self._count('not_found')
+            raise PriceNotFound(f'No market price found for {crop} at {market}, {district}, {state}')
+        return dict(
+            record,
+            source='Primary API (Data.gov.in)',
+            cache=source,
+            stale=source == 'stale',
+            fetchedAt=datetime.fromtimestamp(fetched_at).isoformat(),
+            expiresAt=datetime.fromtimestamp(expires_at).isoformat(),
+            lookupMs=round((time.perf_counter() - start) * 1000, 3),
+            timestamp=datetime.now().isoformat()
+        )
+
+    def stats(self):
+        with self._stats_lock:
+            counts = dict(self.counts)
+            latencies = sorted(self.upstream_ms)
+        now = time.time()
+        with self._cache_lock:
+            cached = len(self._cache)
+            failing = sum(1 for _, retry_after in self._failures.values() if retry_after > now)
+        answered = counts['lookups'] - counts['errors'] - counts['failed_fast']
+        return dict(
+            counts,
+            upstream_avoided_pct=round((1 - counts['upstream_calls'] / answered) * 100, 2) if answered > 0 else None,
+            upstream_p50_ms=round(latencies[len(latencies) // 2], 2) if latencies else None,
+            upstream_max_ms=round(latencies[-1], 2) if latencies else None,
+            memory_cache_size=cached,
+            failing_keys=failing,
+            store_size=self.store.size(),
+            upstream_url=self.url,
+            pool_size=self.pool_size
+        )
+
+
+def lookup_from_env():
+    """Build a lookup service from MANDI_API_* / PRICE_* environment variables"""
+    return PriceLookup(
+        SQLitePriceStore(os.environ.get('PRICE_STORE_PATH', 'mandi_prices.db')),
+        base_url=os.environ.get('MANDI_API_BASE_URL', DEFAULT_BASE_URL),
+        resource=os.environ.get('MANDI_API_RESOURCE', DEFAULT_RESOURCE),
+        api_key=os.environ.get('DATA_GOV_API_KEY') or os.environ.get('NEXT_PUBLIC_DATA_GOV_API_KEY'),
+        timeout=float(os.environ.get('PRICE_LOOKUP_TIMEOUT', '10')),
+        pool_size=int(os.environ.get('PRICE_LOOKUP_POOL_SIZE', '8')),
+        retries=int(os.environ.get('PRICE_LOOKUP_RETRIES', '2')),
+        refresh_hour=int(os.environ.get('PRICE_REFRESH_HOUR', '10')),
+        pending_ttl=float(os.environ.get('PRICE_PENDING_TTL', '1800')),
+        stale_max_age=float(os.environ.get('PRICE_STALE_MAX_AGE', str(3 * 86400))),
+        cache_size=int(os.environ.get('PRICE_CACHE_SIZE', '2048'))
+    )
@@ -0,0 +1,345 @@
+"""
+On-demand profiling for the ML backend
+Profiles single requests, samples traffic into rolling profile dumps and
+diffs tracemalloc snapshots so hot spots can be diagnosed on a live worker.
+
+Everything here is opt-in:
+  - PROFILING_TOKEN: admin token required in the X-Profile-Token header
+  - ENABLE_PROFILING=1: allow profiling without a token (local use only)
+  - PROFILE_SAMPLE_RATE: fraction of requests dumped to PROFILE_DUMP_DIR
+"""
+import os
+import io
+import sys
+import time
+import json
+import random
+import logging
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from flask import request, jsonify, g
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOKEN_HEADER = 'X-Profile-Token'
+
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_ENABLED = os.environ.get('ENABLE_PROFILING', '').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0') or 0)
+PROFILE_DUMP_DIR = os.environ.get('PROFILE_DUMP_DIR', 'profiles')
+PROFILE_DUMP_KEEP = int(os.environ.get('PROFILE_DUMP_KEEP', '20'))
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '25'))
+
+# Only one cProfile profiler can be active per interpreter on Python 3.12+
+_profiler_lock = threading.Lock()
+_stage_state = threading.local()
+
+# Named objects whose retained size is reported by /debug/memory
+_memory_targets = {}
+
+_snapshot_lock = threading.Lock()
+_last_snapshot = None
+
+
+def profiling_available():
+    """Return True if any profiling surface has been enabled"""
+    return bool(PROFILING_TOKEN) or PROFILING_ENABLED
+
+
+def is_authorized():
+    """Check the admin token (or the env override) for the current request"""
+    if PROFILING_TOKEN:
+        token = request.headers.get(PROFILE_TOKEN_HEADER, '')
+        if not token:
+            auth = request.headers.get('Authorization', '')
+            if auth.startswith('Bearer '):
+                token = auth[len('Bearer '):]
+        return token == PROFILING_TOKEN
+    return PROFILING_ENABLED
+
+
+@contextmanager
+def profile_stage(name):
+    """Record the wall time of a named stage when the request is being profiled"""
+    stages = getattr(_stage_state, 'stages', None)
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def register_memory_target(name, getter):
+    """Register a callable returning an object whose size /debug/memory should report"""
+    _memory_targets[name] = getter
+
+
+def approximate_size(obj, _seen=None):
+    """Approximate retained size of an object graph in bytes"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    # XGBoost models keep their trees in native memory, measure the raw booster instead
+    if hasattr(obj, 'get_booster'):
+        try:
+            return len(obj.get_booster().save_raw())
+        except Exception:
+            pass
+    if hasattr(obj, 'nbytes') and not isinstance(obj, (bytes, bytearray)):
+        return int(obj.nbytes)
+
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approximate_size(key, _seen) + approximate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += approximate_size(item, _seen)
+    elif hasattr(obj, '__dict__'):
+        size += approximate_size(vars(obj), _seen)
+    return size
+
+
+def _format_stats(profiler, top_n, sort_by='cumulative'):
+    """Convert profiler output into a JSON-friendly top-N list"""
+    stats = profiler if isinstance(profiler, pstats.Stats) else pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats(sort_by)
+    rows = []
+    for func in stats.fcn_list[:top_n]:
+        cc, nc, tt, ct, _ = stats.stats[func]
+        filename, lineno, funcname = func
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{lineno}({funcname})",
+            'calls': nc,
+            'primitive_calls': cc,
+            'total_time_ms': round(tt * 1000, 3),
+            'cumulative_time_ms': round(ct * 1000, 3)
+        })
+    return rows
+
+
+def _dump_profile(profiler, endpoint, duration_ms):
+    """Write a sampled profile to the rolling dump directory"""
+    try:
+        os.makedirs(PROFILE_DUMP_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        name = f"{stamp}_{os.getpid()}_{endpoint or 'unknown'}_{int(duration_ms)}ms.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DUMP_DIR, name))
+
+        dumps = sorted(f for f in os.listdir(PROFILE_DUMP_DIR) if f.endswith('.prof'))
+        for old in dumps[:-PROFILE_DUMP_KEEP] if PROFILE_DUMP_KEEP > 0 else []:
+            os.remove(os.path.join(PROFILE_DUMP_DIR, old))
+    except Exception as e:
+        logger.warning(f"Failed to write profile dump: {e}")
+
+
+def _start_profiling():
+    """Decide whether to profile this request and start the profiler"""
+    mode = None
+    if request.headers.get(PROFILE_HEADER) and profiling_available() and is_authorized():
+        mode = request.headers.get(PROFILE_HEADER).lower()
+        if mode not in ('stages', 'cprofile'):
+            mode = 'cprofile'
+    sampled = mode is None and PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if mode is None and not sampled:
+        return
+
+    g.profile_mode = mode
+    g.profile_sampled = sampled
+    g.profile_start = time.perf_counter()
+    g.profiler = None
+    _stage_state.stages = {}
+
+    if (mode == 'cprofile' or sampled) and _profiler_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:
+            # Another profiling tool is active in this interpreter
+            _profiler_lock.release()
+
+
+def _stop_profiler():
+    """Disable the request profiler and release the interpreter-wide lock"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+    return profiler
+
+
+def _finish_profiling(response):
+    """Attach profile results to the response or dump sampled profiles"""
+    if 'profile_start' not in g:
+        return response
+
+    profiler = _stop_profiler()
+    duration_ms = (time.perf_counter() - g.pop('profile_start')) * 1000
+    stages = getattr(_stage_state, 'stages', None) or {}
+    _stage_state.stages = None
+    response.headers['X-Profile-Duration-Ms'] = f"{duration_ms:.3f}"
+
+    if g.get('profile_sampled'):
+        if profiler is not None:
+            _dump_profile(profiler, request.endpoint, duration_ms)
+        return response
+
+    report = {
+        'duration_ms': round(duration_ms, 3),
+        'stages_ms': {name: round(ms, 3) for name, ms in stages.items()},
+        'pid': os.getpid()
+    }
+    if g.get('profile_mode') == 'cprofile':
+        if profiler is not None:
+            top_n = request.args.get('profile_top', PROFILE_TOP_N, type=int)
+            report['top_functions'] = _format_stats(profiler, top_n)
+        else:
+            report['top_functions'] = []
+            report['note'] = 'Profiler busy with another request, only stage timings recorded'
+
+    if response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body['profile'] = report
+            response.set_data(json.dumps(body))
+            return response
+    response.headers['X-Profile-Stages'] = json.dumps(report['stages_ms'])
+    return response
+
+
+def _cleanup_profiling(exc):
+    """Make sure the profiler never outlives its request"""
+    if 'profiler' in g:
+        _stop_profiler()
+    _stage_state.stages = None
+
+
+def _require_admin():
+    """Return an error response if the profiling endpoints are not allowed"""
+    if not profiling_available():
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not is_authorized():
+        return jsonify({'error': 'Invalid or missing profiling token'}), 403
+    return None
+
+
+def memory_snapshot_diff(top_n=PROFILE_TOP_N, group_by='lineno'):
+    """Diff a new tracemalloc snapshot against the previous one"""
+    global _last_snapshot
+
+    with _snapshot_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.environ.get('TRACEMALLOC_FRAMES', '1')))
+            _last_snapshot = tracemalloc.take_snapshot()
+            return {'status': 'started', 'message': 'tracemalloc started, request again to get a diff'}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            'status': 'tracing',
+            'traced_current_bytes': current,
+            'traced_peak_bytes': peak,
+            'top_allocations': [
+                {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics(group_by)[:top_n]
+            ]
+        }
+        if _last_snapshot is not None:
+            result['diff'] = [
+                {
+                    'location': str(stat.traceback),
+                    'size_bytes': stat.size,
+                    'size_diff_bytes': stat.size_diff,
+                    'count_diff': stat.count_diff
+                }
+                for stat in snapshot.compare_to(_last_snapshot, group_by)[:top_n]
+            ]
+        _last_snapshot = snapshot
+        return result
+
+
+def init_profiling(app):
+    """Register the profiling hooks and admin endpoints on the Flask app"""
+    app.before_request(_start_profiling)
+    app.after_request(_finish_profiling)
+    app.teardown_request(_cleanup_profiling)
+
+    @app.route('/debug/memory', methods=['GET'])
+    def debug_memory():
+        """Report retained size of registered globals/caches and a tracemalloc diff"""
+        denied = _require_admin()
+        if denied:
+            return denied
+        try:
+            targets = {}
+            for name, getter in _memory_targets.items():
+                try:
+                    targets[name] = approximate_size(getter())
+                except Exception as e:
+                    targets[name] = f"error: {e}"
+            result = {'targets_bytes': targets, 'pid': os.getpid()}
+            if request.args.get('snapshot', '1') != '0':
+                result['tracemalloc'] = memory_snapshot_diff(
+                    top_n=request.args.get('top', PROFILE_TOP_N, type=int),
+                    group_by=request.args.get('group_by', 'lineno')
+                )
+            return jsonify(result)
+        except Exception as e:
+            logger.error(f"Memory debug error: {e}")
+            return jsonify({'error': f'Failed to get memory info: {str(e)}'}), 500
+
+    @app.route('/debug/memory/stop', methods=['POST'])
+    def debug_memory_stop():
+        """Stop tracemalloc and drop the stored snapshot"""
+        global _last_snapshot
+        denied = _require_admin()
+        if denied:
+            return denied
+        with _snapshot_lock:
+            tracemalloc.stop()
+            _last_snapshot = None
+        return jsonify({'status': 'stopped'})
+
+    @app.route('/debug/profiles', methods=['GET'])
+    def debug_profiles():
+        """List sampled profile dumps and aggregate their top-N functions"""
+        denied = _require_admin()
+        if denied:
+            return denied
+        try:
+            dumps = []
+            if os.path.exists(PROFILE_DUMP_DIR):
+                dumps = sorted(f for f in os.listdir(PROFILE_DUMP_DIR) if f.endswith('.prof'))
+            result = {
+                'sample_rate': PROFILE_SAMPLE_RATE,
+                'dump_dir': PROFILE_DUMP_DIR,
+                'dumps': dumps
+            }
+            if dumps:
+                stats = pstats.Stats(*[os.path.join(PROFILE_DUMP_DIR, f) for f in dumps], stream=io.StringIO())
+                result['aggregate_top_functions'] = _format_stats(
+                    stats, request.args.get('top', PROFILE_TOP_N, type=int),
+                    request.args.get('sort', 'cumulative')
+                )
+            return jsonify(result)
+        except Exception as e:
+            logger.error(f"Profile listing error: {e}")
+            return jsonify({'error': f'Failed to list profiles: {str(e)}'}), 500
+
+    if profiling_available() or PROFILE_SAMPLE_RATE > 0:
+        logger.info(f"🔬 Profiling enabled (sample rate: {PROFILE_SAMPLE_RATE})")
@@ -4,7 +4,7 @@ Alternative start script for the Flask app
 Can be used if gunicorn has issues on Render
 """
 import os
-from app import app
+from app import app, warm_models_in_background
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -14,4 +14,6 @@ if __name__ == '__main__':
     print(f"🔧 Debug mode: {debug}")
     print(f"🌐 Access at: http://localhost:{port}")
     
+    # Answer /ping immediately, the models load in the background
+    warm_models_in_background()
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,147 @@
+"""
+Hold-vs-sell storage optimizer for many lots at once
+Each lot is an optimal stopping problem over a forecast price path: selling
+on day t earns the (spoiled) quantity times that day's price, and every day
+in storage costs rent on the remaining quantity. Backward induction
+    V[t] = max(sell[t], V[t+1] - cost[t])
+is solved for all lots together as a (lots x days) array: with cumulative
+costs CC, V[t] = CC[t] + max_{k>=t}(sell[k] - CC[k]), i.e. a reversed running
+maximum, so no Python loop runs over lots or days.
+
+Prices are per quintal, quantities in quintals, costs per quintal per day.
+"""
+from datetime import datetime, timedelta
+
+DEFAULT_HORIZON_DAYS = 30
+MAX_HORIZON_DAYS = 365
+DEFAULT_SPOILAGE_RATE = 0.001
+QUINTALS_PER_TON = 10
+DAYS_PER_MONTH = 30
+
+
+def forecast_from_prediction(current_price, next_day, next_week, next_month, horizon):
+    """Piecewise-linear daily path through today's price and the /predict horizons (flat after 30 days)"""
+    import numpy as np
+    days = np.arange(horizon + 1)
+    return np.interp(days, [0, 1, 7, 30], [current_price, next_day, next_week, next_month])
+
+
+def as_number(value, name, integer=False):
+    """value as a finite number; raises ValueError naming the field"""
+    import math
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+        if not math.isfinite(number) or (integer and not number.is_integer()):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be {'an integer' if integer else 'a number'}")
+    return int(number) if integer else number
+
+
+def lot_number(lot, key, default, integer=False):
+    """lot[key] as a finite number, default when absent"""
+    return as_number(lot.get(key, default), key, integer)
+
+
+def lot_parameters(lot, default_horizon):
+    """Normalize one lot's cost inputs; raises ValueError with a message for the caller"""
+    quantity = lot_number(lot, 'quantity', 0)
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+    if 'storageCostPerDay' in lot:
+        storage_cost = lot_number(lot, 'storageCostPerDay', 0)
+    else:
+        # StorageOptimizer.tsx quotes warehouses in Rs/ton/month
+        storage_cost = lot_number(lot, 'storageCostPerTonMonth', 0) / QUINTALS_PER_TON / DAYS_PER_MONTH
+    spoilage = lot_number(lot, 'spoilageRatePerDay', DEFAULT_SPOILAGE_RATE)
+    if not 0 <= spoilage < 1:
+        raise ValueError('spoilageRatePerDay must be in [0, 1)')
+    horizon = lot_number(lot, 'horizonDays', default_horizon, integer=True)
+    if 'shelfLifeDays' in lot:
+        horizon = min(horizon, lot_number(lot, 'shelfLifeDays', None, integer=True))
+    horizon = max(0, min(horizon, MAX_HORIZON_DAYS))
+    return {
+        'quantity': quantity,
+        'storage_cost': storage_cost,
+        'spoilage': spoilage,
+        'daily_discount': lot_number(lot, 'interestRatePerYear', 0) / 365,
+        'handling_cost': lot_number(lot, 'handlingCostPerDay', 0),
+        'horizon': horizon
+    }
+
+
+def solve(prices, valid, quantity, storage_cost, spoilage, daily_discount, handling_cost):
+    """Optimal sell day and value for every lot
+
+    prices and valid are (lots x days+1) arrays, valid marking the days a lot may
+    still be sold on; the other arguments are per-lot vectors.
+    Returns (best_day, best_value, net) where net[i, t] is the present value
+    of selling lot i on day t minus the storage paid until then.
+    """
+    import numpy as np
+    days = np.arange(prices.shape[1])
+    remaining = quantity[:, None] * (1 - spoilage[:, None]) ** days
+    discount = (1 + daily_discount[:, None]) ** -days
+
+    sell = remaining * prices * discount
+    # Rent and handling for day t -> t+1 are paid on what is still in storage
+    cost = (remaining * storage_cost[:, None] + handling_cost[:, None]) * discount
+    paid = np.concatenate([np.zeros((len(prices), 1)), np.cumsum(cost[:, :-1], axis=1)], axis=1)
+
+    net = np.where(valid, sell - paid, -np.inf)
+    # V[t] + paid[t] = max over k >= t of net[k]; day 0 is the decision we report
+    future_best = np.maximum.accumulate(net[:, ::-1], axis=1)[:, ::-1]
+    best_day = np.argmax(net == future_best[:, :1], axis=1)
+    return best_day, future_best[:, 0], net
+
+
+def optimize_lots(lots, forecasts, default_horizon=DEFAULT_HORIZON_DAYS, start_date=None, include_curve=False):
+    """Optimal hold/sell plan per lot; forecasts[i] is lot i's daily price path starting today"""
+    import numpy as np
+    params = [lot_parameters(lot, default_horizon) for lot in lots]
+    width = max(p['horizon'] for p in params) + 1
+
+    prices = np.zeros((len(lots), width))
+    valid = np.zeros((len(lots), width), dtype=bool)
+    for i, (p, path) in enumerate(zip(params, forecasts)):
+        path = np.asarray(path, dtype=float)[:p['horizon'] + 1]
+        prices[i, :len(path)] = path
+        valid[i, :len(path)] = True
+
+    def column(key):
+        return np.array([p[key] for p in params])
+
+    quantity = column('quantity')
+    storage_cost = column('storage_cost')
+    spoilage = column('spoilage')
+    best_day, best_value, net = solve(prices, valid, quantity, storage_cost, spoilage,
+                                      column('daily_discount'), column('handling_cost'))
+
+    start = start_date or datetime.now().date()
+    results = []
+    for i, lot in enumerate(lots):
+        day = int(best_day[i])
+        remaining = quantity[i] * (1 - spoilage[i]) ** day
+        # Undiscounted rent paid over the stored days (geometric sum of the shrinking quantity)
+        rent = quantity[i] * storage_cost[i] * ((1 - (1 - spoilage[i]) ** day) / spoilage[i] if spoilage[i] else day)
+        sell_now = float(net[i, 0])
+        result = {
+            'lotId': lot.get('lotId', i),
+            'action': 'sell_now' if day == 0 else 'hold',
+            'optimalSellDay': day,
+            'sellDate': (start + timedelta(days=day)).isoformat(),
+            'expectedPrice': round(float(prices[i, day]), 2),
+            'expectedQuantity': round(float(remaining), 3),
+            'spoilageLoss': round(float((quantity[i] - remaining) * prices[i, day]), 2),
+            'storageCost': round(float(rent + params[i]['handling_cost'] * day), 2),
+            'netValue': round(float(best_value[i]), 2),
+            'sellNowValue': round(sell_now, 2),
+            'expectedNetGain': round(float(best_value[i]) - sell_now, 2),
+            'horizonDays': int(valid[i].sum()) - 1
+        }
+        if include_curve:
+            result['valueBySellDay'] = [round(float(v), 2) for v in net[i, valid[i]]]
+        results.append(result)
+    return results
@@ -0,0 +1,96 @@
+"""
+Tests for admission control and load shedding
+"""
+import time
+import threading
+
+from flask import Flask, jsonify
+
+from admission import AdmissionController, admission_controlled, controller_from_env
+
+
+def controller(max_concurrent=1, max_queue=1, queue_timeout=5.0):
+    return AdmissionController('test', max_concurrent, max_queue, queue_timeout, retry_after=3)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def test_excess_is_shed_when_the_queue_is_full():
+    gate = controller(max_concurrent=1, max_queue=1)
+    assert gate.acquire()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(gate.acquire()))
+    waiter.start()
+    wait_for(lambda: gate.waiting == 1)
+
+    assert not gate.acquire()
+    gate.release()
+    waiter.join()
+    assert admitted == [True]
+    stats = gate.stats()
+    assert (stats['admitted'], stats['queued'], stats['rejected_queue_full']) == (2, 1, 1)
+
+
+def test_queued_request_times_out():
+    gate = controller(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+    assert gate.acquire()
+    assert not gate.acquire()
+    assert gate.stats()['rejected_timeout'] == 1
+    assert gate.stats()['queue_depth'] == 0
+
+
+def test_decorator_answers_503_with_retry_after():
+    gate = controller(max_concurrent=1, max_queue=0)
+    app = Flask(__name__)
+
+    @app.route('/work')
+    @admission_controlled(gate)
+    def work():
+        return jsonify({'active': gate.active})
+
+    client = app.test_client()
+    assert client.get('/work').get_json() == {'active': 1}
+    assert gate.active == 0
+
+    gate.acquire()
+    response = client.get('/work')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.get_json()['status'] == 'overloaded'
+
+
+def test_zero_concurrency_disables_the_gate(monkeypatch):
+    monkeypatch.setenv('ADMISSION_MAX_CONCURRENT', '0')
+    gate = controller_from_env('predict', default_concurrency=2)
+    assert not gate.enabled
+    assert not gate.stats()['enabled']
+
+
+def test_live_price_lookups_hold_a_prediction_slot(client, app_module, monkeypatch):
+    gate = app_module.prediction_admission
+    active_during_lookup = []
+
+    def fetch(*args):
+        active_during_lookup.append(gate.active)
+
+    monkeypatch.setattr(app_module.price_lookup, 'fetch_upstream', fetch)
+    body = {'crop': 'Barley', 'mandi': 'Rampura', 'livePrice': True}
+    assert client.post('/predict', json=body).status_code == 404
+    assert active_during_lookup == [1]
+
+    # With every slot taken the lookup is shed before it reaches the upstream
+    monkeypatch.setattr(gate, 'max_queue', 0)
+    held = 0
+    try:
+        while gate.acquire():
+            held += 1
+        assert client.post('/predict', json=dict(body, mandi='Maur')).status_code == 503
+    finally:
+        for _ in range(held):
+            gate.release()
+    assert active_during_lookup == [1]
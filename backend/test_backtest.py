@@ -0,0 +1,84 @@
+"""
+Tests for the walk-forward backtesting engine
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import SUM_COLUMNS, fold_bounds, metrics_from_sums, run_backtest
+from history_features import HistoryFeatureBuilder, iter_history_chunks
+from model_registry import load_bundle
+from train_incremental import regression_metrics, trained_until
+
+
+def test_fold_bounds_are_consecutive_and_end_after_the_last_day():
+    bounds = fold_bounds('2024-06-30', folds=3, fold_days=10)
+    assert bounds[-1][1] == pd.Timestamp('2024-07-01')
+    assert bounds[0][0] == pd.Timestamp('2024-06-01')
+    assert all(end == next_start for (_, end), (next_start, _) in zip(bounds, bounds[1:]))
+
+
+def test_metrics_from_partial_sums_match_the_raw_errors():
+    rng = np.random.default_rng(3)
+    y = rng.uniform(500, 3000, 200)
+    pred = y + rng.normal(0, 50, 200)
+    err = pred - y
+    halves = [slice(0, 80), slice(80, 200)]
+    parts = pd.DataFrame([{
+        'n': len(y[h]), 'abs_err': np.abs(err[h]).sum(), 'sq_err': (err[h] ** 2).sum(),
+        'abs_pct_err': np.abs(err[h] / y[h]).sum(), 'pct_n': len(y[h]), 'err': err[h].sum(),
+        'y': y[h].sum(), 'y_sq': (y[h] ** 2).sum()
+    } for h in halves])
+    metrics = metrics_from_sums(parts[SUM_COLUMNS].sum())
+    expected = regression_metrics(y, pred)
+    for key in ('mae', 'rmse', 'mape', 'r2'):
+        assert float(metrics[key]) == pytest.approx(expected[key])
+    assert float(metrics['bias']) == pytest.approx(err.mean())
+
+
+def test_each_fold_is_scored_by_a_model_trained_before_it(history_csv):
+    _, summary, bounds = run_backtest(history_csv, 'models', folds=2, fold_days=30, workers=1, shards=2,
+                                      chunksize=300, rounds=3)
+    assert summary['method'] == 'walk-forward, retrained per fold'
+
+    bundle = load_bundle('models')
+    builder = HistoryFeatureBuilder(bundle['encoders'], bundle['feature_columns'])
+    rows = pd.concat([builder.process(chunk) for chunk in iter_history_chunks(history_csv, 10 ** 6)])
+    for fold in summary['folds']:
+        start, end = bounds[fold['fold']]
+        # Trained only on labels observed before the fold, scored only on its own window
+        assert fold['train_rows'] == int((rows['target_date'] < start).sum())
+        assert fold['n'] == int(((rows['date'] >= start) & (rows['date'] < end)).sum())
+    assert summary['folds'][0]['train_rows'] < summary['folds'][1]['train_rows']
+
+
+def test_bundle_mode_scores_the_bundles_own_model_on_features_from_the_full_stream(history_csv):
+    # The shipped bundle was trained after this history ends, so no fold is out-of-sample
+    with pytest.raises(ValueError, match='training range'):
+        run_backtest(history_csv, 'models', folds=2, fold_days=30, workers=1, shards=2, chunksize=300,
+                     mode='bundle')
+
+    _, summary, bounds = run_backtest(history_csv, 'models', folds=2, fold_days=30, workers=1, shards=2,
+                                      chunksize=300, mode='bundle', scored_from='2024-06-01')
+    assert [fold['fold'] for fold in summary['folds']] == [1]
+    assert summary['folds'][0]['train_rows'] is None
+
+    # Same rows and predictions as one unsharded pass, so state and crop averages see every mandi
+    bundle = load_bundle('models')
+    builder = HistoryFeatureBuilder(bundle['encoders'], bundle['feature_columns'])
+    rows = pd.concat([builder.process(chunk) for chunk in iter_history_chunks(history_csv, 10 ** 6)])
+    start, end = bounds[1]
+    rows = rows[(rows['date'] >= start) & (rows['date'] < end)]
+    pred = bundle['model'].get_booster().inplace_predict(rows[bundle['feature_columns']].to_numpy(np.float32))
+    expected = regression_metrics(rows['target'].to_numpy(float), pred)
+    assert summary['n'] == len(rows)
+    assert summary['mae'] == pytest.approx(expected['mae'], rel=1e-5)
+    assert summary['rmse'] == pytest.approx(expected['rmse'], rel=1e-5)
+
+
+def test_trained_until_comes_from_the_training_report():
+    report = {'holdout_start': '2024-06-01', 'history_range': ['2024-01-01', '2024-06-30']}
+    assert trained_until({'training_report': report}) == pd.Timestamp('2024-06-01')
+    assert trained_until({'training_report': dict(report, trained_until='2024-07-01')}) == pd.Timestamp('2024-07-01')
+    assert trained_until({'training_date': '2025-08-15T13:49:36'}) == pd.Timestamp('2025-08-16')
+    assert trained_until({}) is None
@@ -0,0 +1,45 @@
+"""
+Tests for the hot-path benchmark helpers and regression gate
+"""
+import benchmark_models
+from benchmark_models import build_inputs, compare, time_stage
+
+
+def test_build_inputs_is_deterministic_and_uses_the_combinations():
+    combinations = [{'crop': 'Wheat', 'mandi': 'Khanna'}, {'crop': 'Onion', 'mandi': 'Abohar'}]
+    inputs = build_inputs(50, combinations, seed=7)
+    assert inputs == build_inputs(50, combinations, seed=7)
+    assert {(row['crop'], row['mandi']) for row in inputs} <= {('Wheat', 'Khanna'), ('Onion', 'Abohar')}
+    assert all(800 <= row['currentPrice'] <= 6000 for row in inputs)
+
+
+def test_time_stage_stops_at_the_repeat_count():
+    calls = []
+    result = time_stage(lambda: calls.append(1), size=10, repeats=3, budget=60, min_time=0)
+    # One warm-up call plus one loop per sample
+    assert (result['runs'], result['loops']) == (3, 1)
+    assert len(calls) == 4
+    assert result['best_s'] <= result['median_s']
+
+
+def test_short_stages_are_looped_up_to_the_minimum_sample_time():
+    result = time_stage(lambda: sum(range(100)), size=1, repeats=2, budget=60, min_time=0.01)
+    assert result['loops'] > 1
+    assert result['loops'] in {n * 10 ** k for n in (1, 2, 5) for k in range(8)}
+    assert result['best_s'] * result['loops'] >= 0.005
+
+
+def test_compare_flags_only_stages_over_the_threshold():
+    baseline = {'results': {'model_predict': {'1': {'best_s': 1.0}, '32': {'best_s': 1.0},
+                                              '100': {'median_s': 1.0}}}}
+    results = {'model_predict': {'1': {'best_s': 1.05}, '32': {'best_s': 1.5}, '100': {'best_s': 9.0},
+                                 '1000': {'best_s': 9.0}}}
+    # Sizes without a best-of-N baseline are reported but never gate
+    assert compare(results, baseline, threshold=0.1) == [('model_predict', '32', 1.5)]
+
+
+def test_stage_runners_cover_every_stage(app_module):
+    assert app_module.load_models_on_demand()
+    runners = benchmark_models.make_stage_runners(app_module, build_inputs(2, []))
+    assert set(runners) == set(benchmark_models.STAGES)
+    runners['endpoint_predict']()
@@ -0,0 +1,118 @@
+"""
+Tests for CPU budget calibration and the batch thread count
+"""
+import json
+import queue
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import cpu_config
+from calibrate_cpu import collect, default_grid, pick_best
+from cpu_config import load_cpu_config, min_threads
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for env_name in cpu_config._ENV_OVERRIDES.values():
+        monkeypatch.delenv(env_name, raising=False)
+
+
+def write_calibration(tmp_path, recommended, cpu_count):
+    path = tmp_path / 'cpu_config.json'
+    path.write_text(json.dumps({'recommended': recommended, 'cpu_count': cpu_count,
+                                'calibrated_at': '2025-01-01T00:00:00'}))
+    return str(path)
+
+
+def test_defaults_split_the_cores_between_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(cpu_config.os, 'cpu_count', lambda: 8)
+    settings = load_cpu_config(str(tmp_path / 'missing.json'))
+    assert settings['source'] == 'defaults'
+    assert settings['xgb_nthread'] == 4
+    assert settings['batch_nthread'] == 4
+    assert settings['admission_concurrency'] == 1
+
+
+def test_calibration_is_read_and_env_wins(tmp_path, monkeypatch):
+    monkeypatch.setattr(cpu_config.os, 'cpu_count', lambda: 8)
+    path = write_calibration(tmp_path, {'workers': 4, 'threads': 12, 'xgb_nthread': 2, 'batch_nthread': 8}, 8)
+    monkeypatch.setenv('XGB_NTHREAD', '1')
+    settings = load_cpu_config(path)
+    assert (settings['workers'], settings['xgb_nthread'], settings['batch_nthread']) == (4, 1, 8)
+    assert settings['source'] == 'calibration+env'
+    assert settings['env_overrides'] == ['XGB_NTHREAD']
+    assert 'calibration_mismatch' not in settings
+
+
+def test_calibration_from_another_machine_is_flagged(tmp_path, monkeypatch):
+    monkeypatch.setattr(cpu_config.os, 'cpu_count', lambda: 2)
+    settings = load_cpu_config(write_calibration(tmp_path, {'workers': 8}, 16))
+    assert settings['calibration_mismatch']
+
+
+def test_threads_are_raised_so_admission_can_shed(tmp_path, monkeypatch):
+    monkeypatch.setenv('GUNICORN_THREADS', '2')
+    monkeypatch.setenv('ADMISSION_MAX_CONCURRENT', '2')
+    monkeypatch.setenv('ADMISSION_MAX_QUEUE', '4')
+    settings = load_cpu_config(str(tmp_path / 'missing.json'))
+    assert min_threads(settings) == 2 + 4 + 1
+    assert settings['threads'] == 7
+    assert settings['threads_requested'] == 2
+
+
+def test_disabled_admission_needs_one_thread():
+    assert min_threads({'admission_concurrency': 0, 'admission_queue': 8, 'light_threads': 1}) == 1
+
+
+def test_pick_best_prefers_throughput_within_the_latency_budget():
+    measurements = [
+        {'rows_per_s': 100, 'p99_ms': 10},
+        {'rows_per_s': 180, 'p99_ms': 11},
+        {'rows_per_s': 300, 'p99_ms': 40}
+    ]
+    assert pick_best(measurements, None, slack=0.2)['rows_per_s'] == 180
+    assert pick_best(measurements, 50, slack=0.2)['rows_per_s'] == 300
+    assert default_grid(6) == [1, 2, 4, 6]
+    # Failed configurations never win
+    assert pick_best([{'rows_per_s': None, 'p99_ms': None, 'error': 'timeout'}], None, slack=0.2) is None
+
+
+def test_collect_fails_a_configuration_instead_of_hanging():
+    results = queue.Queue()
+    results.put([0.1, 0.2])
+    running, crashed = SimpleNamespace(exitcode=None), SimpleNamespace(exitcode=-9)
+    with pytest.raises(RuntimeError, match='-9'):
+        collect([running, crashed], results, timeout=60)
+
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match='no result'):
+        collect([running], results, timeout=0.2)
+    assert time.monotonic() - start < 5
+
+    results.put([0.3])
+    assert collect([running], results, timeout=60) == [[0.3]]
+
+
+def booster_nthread(booster):
+    return int(json.loads(booster.save_config())['learner']['generic_param']['nthread'])
+
+
+def test_batch_routes_use_a_private_booster_copy(app_module, monkeypatch):
+    assert app_module.load_models_on_demand()
+    model = app_module.model
+    monkeypatch.setitem(app_module.cpu_settings, 'batch_nthread', model.get_params()['n_jobs'] or 1)
+    monkeypatch.setattr(model, 'n_jobs', app_module.cpu_settings['batch_nthread'])
+    assert app_module.batch_booster(model) is model.get_booster()
+
+    monkeypatch.setitem(app_module.cpu_settings, 'batch_nthread', 2)
+    monkeypatch.setattr(model, 'n_jobs', 1)
+    booster = app_module.batch_booster(model)
+    assert booster is not model.get_booster()
+    assert booster_nthread(booster) == 2
+    assert app_module.batch_booster(model) is booster
+
+    vectors = [app_module.build_feature_vector({'crop': 'Wheat', 'mandi': 'Khanna', 'currentPrice': 2200})] * 3
+    np.testing.assert_allclose(app_module.predict_batch(model, vectors), model.predict(np.asarray(vectors)), rtol=1e-5)
@@ -0,0 +1,107 @@
+"""
+Tests for online drift monitoring
+"""
+import random
+
+import numpy as np
+import pytest
+
+from drift import (
+    DriftMonitor, FeatureSketch, Reservoir, _SampleBuilder, build_training_profile, drift_status, psi,
+    summarize_sample
+)
+from model_registry import load_bundle
+
+
+def test_psi_is_zero_for_matching_shares_and_grows_with_shift():
+    expected = [0.25, 0.25, 0.25, 0.25]
+    assert psi(expected, [25, 25, 25, 25]) == 0
+    small = psi(expected, [30, 25, 25, 20])
+    large = psi(expected, [70, 10, 10, 10])
+    assert 0 < small < large
+    assert psi(expected, [0, 0, 0, 0]) is None
+
+
+def test_drift_status_thresholds():
+    assert drift_status(None) == 'insufficient_data'
+    assert drift_status(0.05) == 'stable'
+    assert drift_status(0.1) == 'moderate'
+    assert drift_status(0.3) == 'drift'
+
+
+def test_sketch_moments_and_bins():
+    sketch = FeatureSketch([10, 20], reservoir_size=4)
+    values = [5, 15, 15, 25, 30]
+    for value in values:
+        sketch.add(value)
+    assert sketch.counts == [1, 2, 2]
+    summary = sketch.summary()
+    assert summary['mean'] == pytest.approx(np.mean(values))
+    assert summary['std'] == pytest.approx(np.std(values), abs=1e-4)
+    assert (summary['min'], summary['max']) == (5, 30)
+    assert len(sketch.reservoir.values) == 4
+
+
+def test_reservoir_stays_bounded_and_uniform():
+    random.seed(1)
+    reservoir = Reservoir(500)
+    for value in range(20000):
+        reservoir.add(value)
+    assert len(reservoir.values) == 500
+    assert reservoir.seen == 20000
+    assert 8000 < reservoir.quantiles()['p50'] < 12000
+
+
+def test_sample_summary_has_even_bins():
+    sample = _SampleBuilder(1000, np.random.default_rng(0))
+    for _ in range(5):
+        sample.extend(np.random.default_rng(1).normal(100, 10, 2000))
+    summary = summarize_sample(sample, bins=4)
+    assert summary['count'] == 10000
+    assert len(summary['edges']) == 3
+    assert summary['proportions'] == pytest.approx([0.25] * 4, abs=0.01)
+
+
+def monitor_with_profile():
+    rng = np.random.default_rng(0)
+    sample = _SampleBuilder(5000, rng)
+    sample.extend(rng.normal(2000, 200, 5000))
+    profile = {'features': {'modal_price': summarize_sample(sample)}, 'categories': {'crop': {'Wheat': 1.0}}}
+    monitor = DriftMonitor(min_samples=200)
+    monitor.set_profile(profile)
+    return monitor, rng
+
+
+def test_monitor_flags_a_shifted_price_distribution():
+    monitor, rng = monitor_with_profile()
+    for price in rng.normal(2000, 200, 500):
+        monitor.observe({'modal_price': price}, 'Wheat', price)
+    assert monitor.report()['features']['modal_price']['status'] == 'stable'
+
+    monitor.set_profile(monitor.profile)
+    for price in rng.normal(2600, 200, 500):
+        monitor.observe({'modal_price': price}, 'Onion', price, fallbacks=[('crop', 'Onion')])
+    report = monitor.report()
+    assert report['features']['modal_price']['status'] == 'drift'
+    assert report['status'] == 'drift'
+    assert report['encoder_fallbacks']['crop']['top_unseen'] == [('Onion', 500)]
+
+
+def test_training_profile_covers_features_crops_and_mix(history_csv):
+    bundle = load_bundle('models')
+    profile = build_training_profile(history_csv, bundle['model'], bundle['encoders'], bundle['feature_columns'],
+                                     chunksize=300)
+    assert set(profile['features']) == {'modal_price', 'month', 'day_of_week', 'prediction'}
+    assert set(profile['crops']) == {'Wheat', 'Onion', 'Potato'}
+    assert sum(profile['categories']['crop'].values()) == pytest.approx(1.0)
+    assert profile['categories']['crop']['Wheat'] == pytest.approx(0.5, abs=0.01)
+
+
+def test_drift_reset_needs_the_admin_token(client, monkeypatch):
+    monkeypatch.setenv('MODEL_ADMIN_TOKEN', 'secret')
+    assert client.post('/drift/reset').status_code == 403
+    assert client.post('/drift/reset', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.post('/drift/reset', headers={'X-Admin-Token': 'secret'}).status_code == 200
+
+    monkeypatch.delenv('MODEL_ADMIN_TOKEN')
+    assert client.post('/drift/reset', headers={'X-Admin-Token': ''}).status_code == 403
@@ -0,0 +1,97 @@
+"""
+Tests for batched, cached feature attributions and the /explain endpoint
+"""
+import numpy as np
+import pytest
+
+from explanations import ContributionCache, explain_batch, format_explanation
+
+WHEAT = {'crop': 'Wheat', 'mandi': 'Khanna', 'currentPrice': 2200, 'currentDate': '2025-01-15'}
+ONION = {'crop': 'Onion', 'mandi': 'Abohar', 'currentPrice': 1500, 'currentDate': '2025-01-15'}
+
+
+class CountingBooster:
+    """Wraps a booster and records how many rows each contributions call received"""
+
+    def __init__(self, booster):
+        self.booster = booster
+        self.calls = []
+
+    def predict(self, dmatrix, **kwargs):
+        self.calls.append(dmatrix.num_row())
+        return self.booster.predict(dmatrix, **kwargs)
+
+
+def test_cache_is_an_lru():
+    cache = ContributionCache(max_size=2)
+    for name in ('a', 'b'):
+        cache.put(name, [1.0])
+    cache.get('a')
+    cache.put('c', [2.0])
+    assert cache.get('b') is None
+    assert cache.get('a') == [1.0]
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 2, 'misses': 1}
+
+
+def test_cache_key_separates_model_versions():
+    assert ContributionCache.key('v1', [1.0, 2.0]) != ContributionCache.key('v2', [1.0, 2.0])
+    assert ContributionCache.key('v1', [1.0, 2.0]) == ContributionCache.key('v1', [1.0, 2.0])
+
+
+def test_batch_computes_each_distinct_input_once(app_module):
+    assert app_module.load_models_on_demand()
+    booster = CountingBooster(app_module.model.get_booster())
+    vectors = [app_module.build_feature_vector(row) for row in (WHEAT, ONION, WHEAT)]
+    cache = ContributionCache()
+
+    rows, cached, computed = explain_batch(booster, 'test', vectors, app_module.feature_columns, cache)
+    assert (cached, computed) == (0, 2)
+    assert booster.calls == [2]
+    assert rows[0] == rows[2]
+
+    _, cached, computed = explain_batch(booster, 'test', vectors, app_module.feature_columns, cache)
+    assert (cached, computed) == (3, 0)
+    assert booster.calls == [2]
+
+    # Contributions plus the bias add up to the model's own prediction
+    expected = app_module.model.predict(np.asarray(vectors))
+    np.testing.assert_allclose([sum(row) for row in rows], expected, rtol=1e-4)
+
+
+def test_format_explanation_orders_by_effect_and_folds_the_rest():
+    result = format_explanation([0.5, -3.0, 1.0, 0.0, 100.0], ['a', 'b', 'c', 'd'], [1, 2, 3, 4], top=2)
+    assert [c['feature'] for c in result['contributions']] == ['b', 'c']
+    assert result['otherContribution'] == 0.5
+    assert result['prediction'] == 98.5
+
+
+def test_explain_endpoint(client):
+    body = client.post('/explain?top=3', json={'inputs': [WHEAT, ONION, WHEAT]}).get_json()
+    assert body['count'] == 3
+    assert all(len(e['contributions']) == 3 for e in body['explanations'])
+    assert body['explanations'][0]['servedBy'] == 'primary'
+    assert body['modelVersion'] == body['explanations'][0]['modelVersion']
+
+    # top in the body works too, and more than the feature count shows every contribution
+    everything = client.post('/explain', json=dict(WHEAT, top=10 ** 6)).get_json()['explanations'][0]
+    assert 3 < len(everything['contributions']) and 'otherContribution' not in everything
+    assert len(client.post('/explain', json=dict(WHEAT, top=2)).get_json()['explanations'][0]['contributions']) == 2
+
+
+@pytest.mark.parametrize('payload', [
+    {'inputs': [dict(WHEAT, currentPrice='abc')]},
+    {'inputs': [dict(WHEAT, currentPrice=True)]},
+    {'inputs': [dict(WHEAT, currentDate='2025-02-30')]},
+    {'inputs': [WHEAT], 'top': 'x'},
+    {'inputs': [WHEAT], 'top': 0},
+    {'inputs': [WHEAT], 'top': -3},
+    {'inputs': [WHEAT], 'top': 1.5},
+    {'inputs': ['Wheat']},
+    {'inputs': []},
+])
+def test_explain_rejects_bad_inputs(client, payload):
+    assert client.post('/explain', json=payload).status_code == 400
+
+
+def test_explain_rejects_a_bad_top_query(client):
+    assert client.post('/explain?top=many', json=WHEAT).status_code == 400
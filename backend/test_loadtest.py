@@ -0,0 +1,82 @@
+"""
+Tests for the load-testing traffic mix and report helpers
+"""
+from argparse import Namespace
+
+import pytest
+
+import loadtest
+from loadtest import TrafficMix, percentile, server_threads, start_server, warmup_concurrency
+
+COMBINATIONS = [{'crop': 'Wheat', 'mandi': 'Khanna', 'count': 3}, {'crop': 'Onion', 'mandi': 'Abohar', 'count': 1}]
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) is None
+
+
+def test_mix_follows_the_route_weights():
+    mix = TrafficMix(COMBINATIONS, 'predict=3,ping=1', seed=1)
+    routes = [mix.next_request()[0] for _ in range(2000)]
+    assert 0.7 < routes.count('predict') / len(routes) < 0.8
+
+
+def test_live_price_requests_leave_out_the_current_price():
+    _, method, path, body = TrafficMix(COMBINATIONS, 'predict-live=1').next_request()
+    assert (method, path) == ('POST', '/predict')
+    assert body['livePrice'] is True
+    assert 'currentPrice' not in body
+
+
+def test_batch_routes_use_the_batch_size():
+    mix = TrafficMix(COMBINATIONS, 'explain=1,storage=1', batch_size=5)
+    seen = {}
+    while len(seen) < 2:
+        route, _, path, body = mix.next_request()
+        seen[route] = (path, body)
+    assert len(seen['explain'][1]['inputs']) == 5
+    lots = seen['storage'][1]['lots']
+    assert len(lots) == 5
+    assert all(lot['quantity'] > 0 and lot['currentPrice'] > 0 for lot in lots)
+
+
+def test_batch_payloads_are_accepted_by_the_app(client):
+    mix = TrafficMix(COMBINATIONS, 'explain=1,storage=1', batch_size=3)
+    for _ in range(6):
+        _, method, path, body = mix.next_request()
+        assert client.open(path, method=method, json=body).status_code == 200
+
+
+def test_unknown_route_is_rejected():
+    with pytest.raises(ValueError):
+        TrafficMix(COMBINATIONS, 'nope=1').next_request()
+
+
+def test_warmup_matches_the_running_server():
+    assert warmup_concurrency(Namespace(url=None, mode='flask', workers=4, threads=2)) == 1
+    assert warmup_concurrency(Namespace(url=None, mode='gunicorn', workers=4, threads=2)) == 8
+    assert warmup_concurrency(Namespace(url='http://host:5000', mode='flask', workers=2, threads=3)) == 6
+
+
+def test_default_threads_come_from_the_gunicorn_config(monkeypatch):
+    monkeypatch.setenv('ADMISSION_MAX_CONCURRENT', '2')
+    monkeypatch.setenv('ADMISSION_MAX_QUEUE', '5')
+    monkeypatch.setenv('LIGHT_ROUTE_THREADS', '1')
+    monkeypatch.setenv('GUNICORN_THREADS', '1')
+    args = Namespace(url=None, mode='gunicorn', workers=2, threads=None)
+    assert server_threads(args) == 8
+    assert warmup_concurrency(args) == 16
+    assert server_threads(Namespace(url='http://host:5000', mode='gunicorn', workers=2, threads=None)) == 1
+
+
+def test_threads_are_passed_to_gunicorn_only_when_set(monkeypatch):
+    commands = []
+    monkeypatch.setattr(loadtest.subprocess, 'Popen', lambda cmd, **kwargs: commands.append(cmd))
+    start_server('gunicorn', 5001, workers=2)
+    start_server('gunicorn', 5001, workers=2, threads=4)
+    assert '--threads' not in commands[0]
+    assert commands[1][commands[1].index('--threads') + 1] == '4'
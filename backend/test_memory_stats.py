@@ -0,0 +1,60 @@
+"""
+Tests for per-process memory reporting and the preload/post-fork hooks
+"""
+import gc
+import os
+import subprocess
+import sys
+
+import pytest
+
+from memory_stats import child_pids, process_memory
+
+linux_only = pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'), reason='needs /proc smaps')
+
+
+@linux_only
+def test_process_memory_splits_unique_and_shared():
+    memory = process_memory()
+    assert memory['available']
+    assert memory['pid'] == os.getpid()
+    assert 0 < memory['uss_bytes'] <= memory['pss_bytes'] <= memory['rss_bytes']
+
+
+@linux_only
+def test_child_pids_lists_direct_children():
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)'])
+    try:
+        assert child.pid in child_pids(os.getpid())
+    finally:
+        child.kill()
+        child.wait()
+
+
+def test_preload_freezes_shared_objects(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'models_preloaded', False)
+    try:
+        assert app_module.preload_models()
+        assert app_module.models_preloaded
+        assert gc.get_freeze_count() > 0
+        encoder = next(e for e in app_module.encoders.values() if hasattr(e, 'classes_'))
+        assert not encoder.classes_.flags.writeable
+    finally:
+        gc.unfreeze()
+
+
+def test_post_fork_setup_sizes_the_model_threads(app_module, monkeypatch):
+    assert app_module.load_models_on_demand()
+    monkeypatch.setattr(app_module, 'models_preloaded', True)
+    original = app_module.model.get_params()['n_jobs']
+    try:
+        app_module.post_fork_setup(nthread=3)
+        assert app_module.model.get_params()['n_jobs'] == 3
+    finally:
+        app_module.model.set_params(n_jobs=original)
+
+
+def test_process_memory_endpoint(client):
+    report = client.get('/debug/process-memory').get_json()
+    assert report['current_worker']['pid'] == os.getpid()
+    assert 'models_preloaded' in report
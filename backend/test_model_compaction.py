@@ -0,0 +1,75 @@
+"""
+Tests for compact model variants: tree caps, pruning and float16 rounding
+"""
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from model_compaction import (
+    FLOAT16_MAX, booster_json, build_variant, count_leaves, pick_cheapest, to_float16, variant_grid, variant_name
+)
+
+
+@pytest.fixture(scope='module')
+def training_data():
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 10, (2000, 4)).astype(np.float32)
+    target = 3 * features[:, 0] + np.sin(features[:, 1]) * 5 + rng.normal(0, 0.5, 2000)
+    model = xgb.XGBRegressor(n_estimators=20, max_depth=4, learning_rate=0.3, n_jobs=1, base_score=0.0)
+    model.fit(features, target)
+    return model, features
+
+
+def test_unpruned_float32_variant_predicts_like_the_model(training_data):
+    model, features = training_data
+    variant, _ = build_variant(model)
+    np.testing.assert_allclose(variant.predict(features), model.predict(features), rtol=1e-6)
+
+
+def test_tree_cap_keeps_the_first_rounds(training_data):
+    model, features = training_data
+    variant, model_json = build_variant(model, max_trees=5)
+    assert len(model_json['learner']['gradient_booster']['model']['trees']) == 5
+    expected = model.get_booster().predict(xgb.DMatrix(features), iteration_range=(0, 5))
+    np.testing.assert_allclose(variant.predict(features), expected, rtol=1e-5)
+
+
+def test_pruning_drops_leaves_and_keeps_the_mean_prediction(training_data):
+    model, features = training_data
+    full_leaves = count_leaves(booster_json(model.get_booster()))
+    variant, model_json = build_variant(model, min_gain=float('inf'))
+    # Every split collapses, bottom-up, into a single leaf per tree
+    assert count_leaves(model_json) == model.get_booster().num_boosted_rounds() < full_leaves
+    predictions = variant.predict(features)
+    assert np.ptp(predictions) == pytest.approx(0, abs=1e-3)
+    # Collapsed nodes use the hessian-weighted mean of their leaves
+    assert predictions.mean() == pytest.approx(model.predict(features).mean(), rel=1e-4)
+
+
+def test_partial_pruning_stays_close(training_data):
+    model, features = training_data
+    gains = []
+    for tree in booster_json(model.get_booster())['learner']['gradient_booster']['model']['trees']:
+        gains.extend(g for g, child in zip(tree['loss_changes'], tree['left_children']) if child != -1)
+    variant, model_json = build_variant(model, min_gain=float(np.quantile(gains, 0.2)))
+    assert count_leaves(model_json) < count_leaves(booster_json(model.get_booster()))
+    assert np.abs(variant.predict(features) - model.predict(features)).mean() < 0.5
+
+
+def test_to_float16_rounds_only_what_it_can_hold():
+    assert to_float16([1.0, 0.1]) == [1.0, float(np.float16(0.1))]
+    big = FLOAT16_MAX * 2
+    assert to_float16([big, -big]) == [big, -big]
+
+
+def test_grid_names_and_cheapest_pick():
+    specs = variant_grid([50], [0.2], ['float32'])
+    assert [variant_name(spec) for spec in specs] == ['full', 'prune20', 'trees50', 'trees50+prune20']
+
+    rows = [
+        {'variant': 'full', 'mape_delta': 0.0, 'single_row_p50_ms': 1.0, 'size_kb': 900},
+        {'variant': 'trees50', 'mape_delta': 0.2, 'single_row_p50_ms': 0.4, 'size_kb': 300},
+        {'variant': 'trees20', 'mape_delta': 1.5, 'single_row_p50_ms': 0.2, 'size_kb': 120},
+    ]
+    assert pick_cheapest(rows, max_mape_increase=0.5)['variant'] == 'trees50'
+    assert pick_cheapest(rows, max_mape_increase=0.0)['variant'] == 'full'
@@ -0,0 +1,101 @@
+"""
+Tests for canary routing, shared routing state and shadow scoring
+"""
+import time
+
+import pytest
+
+from model_registry import ModelRegistry, SQLiteRoutingStore
+
+PRIMARY = {'model': None, 'metadata': {'version': '1.0', 'training_date': '2025-01-01'}}
+CANDIDATE = {'model': None, 'metadata': {'version': '2.0', 'training_date': '2025-02-01'}}
+
+
+def registry(routing_store=None, **kwargs):
+    reg = ModelRegistry(routing_store=routing_store, **kwargs)
+    reg.register('primary', PRIMARY)
+    reg.register('candidate', CANDIDATE)
+    return reg
+
+
+def series(count):
+    return [{'crop': f'Crop{i % 7}', 'mandi': f'Mandi{i}'} for i in range(count)]
+
+
+def test_every_input_goes_to_primary_without_a_candidate():
+    reg = ModelRegistry(canary_fraction=1.0, canary_crops=['Onion'])
+    reg.register('primary', PRIMARY)
+    assert reg.route({'crop': 'Onion', 'mandi': 'Abohar'}) == 'primary'
+
+
+def test_a_series_always_gets_the_same_version():
+    reg = registry(canary_fraction=0.3)
+    inputs = series(2000)
+    first = [reg.route(item) for item in inputs]
+    assert first == [reg.route(dict(item, currentPrice=123)) for item in inputs]
+    assert 0.25 < first.count('candidate') / len(first) < 0.35
+
+
+def test_canary_crops_always_go_to_the_candidate():
+    reg = registry(canary_crops=['Onion'])
+    assert reg.route({'crop': 'Onion', 'mandi': 'Anywhere'}) == 'candidate'
+    assert reg.route({'crop': 'Wheat', 'mandi': 'Anywhere'}) == 'primary'
+
+
+def test_routing_changes_reach_every_worker(tmp_path):
+    path = str(tmp_path / 'routing.db')
+    first = registry(SQLiteRoutingStore(path))
+    second = registry(SQLiteRoutingStore(path), canary_fraction=0.0)
+    item = {'crop': 'Onion', 'mandi': 'Abohar'}
+    assert second.route(item) == 'primary'
+
+    first.set_routing(fraction=2.0, crops=['Onion'])
+    assert first.canary_fraction == 1.0
+    assert second.route(item) == 'candidate'
+    assert second.stats()['routing']['canary_crops'] == ['Onion']
+
+    second.set_routing(crops=[])
+    assert first.stats()['routing'] == {'canary_fraction': 1.0, 'canary_crops': [], 'shadow_sample_rate': 1.0}
+
+
+def test_saved_routing_wins_over_the_starting_split(tmp_path):
+    path = str(tmp_path / 'routing.db')
+    SQLiteRoutingStore(path).put(0.0, ['Wheat'])
+    reg = registry(SQLiteRoutingStore(path), canary_fraction=1.0)
+    assert reg.route({'crop': 'Onion', 'mandi': 'Abohar'}) == 'primary'
+    assert reg.route({'crop': 'Wheat', 'mandi': 'Abohar'}) == 'candidate'
+
+
+def test_shadow_scoring_runs_off_the_request_path():
+    reg = registry(canary_fraction=1.0)
+    reg.register('shadow', CANDIDATE)
+    reg.scorer = lambda bundle, input_data: 110.0 if bundle is reg.get('shadow') else 100.0
+    reg.submit({'crop': 'Wheat', 'mandi': 'Khanna'}, 'candidate', 105.0)
+
+    deadline = time.monotonic() + 5
+    while len(reg.stats()['prediction_diff']) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    diffs = reg.stats()['prediction_diff']
+    assert diffs['shadow_vs_candidate:abs']['mean'] == pytest.approx(5.0)
+    assert diffs['primary_vs_candidate:abs']['mean'] == pytest.approx(5.0)
+    assert diffs['primary_vs_candidate:pct']['mean'] == pytest.approx(-5 / 105 * 100, abs=1e-3)
+
+
+@pytest.mark.parametrize('payload', [
+    {'canaryFraction': 'half'},
+    {'canaryFraction': 1.5},
+    {'canaryFraction': -0.1},
+    {'canaryCrops': 'Onion'},
+    ['Onion'],
+])
+def test_routing_endpoint_rejects_bad_input(client, monkeypatch, payload):
+    monkeypatch.setenv('MODEL_ADMIN_TOKEN', 'secret')
+    assert client.post('/models/routing', json=payload, headers={'X-Admin-Token': 'secret'}).status_code == 400
+
+
+def test_routing_endpoint_needs_the_admin_token(client, monkeypatch):
+    monkeypatch.setenv('MODEL_ADMIN_TOKEN', 'secret')
+    assert client.post('/models/routing', json={'canaryFraction': 0.1}).status_code == 403
+    response = client.post('/models/routing', json={'canaryFraction': 0, 'canaryCrops': []},
+                           headers={'X-Admin-Token': 'secret'})
+    assert response.get_json()['canary_fraction'] == 0.0
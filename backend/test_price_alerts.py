@@ -0,0 +1,176 @@
+"""
+Tests for the server-side price alert engine
+"""
+import random
+import sqlite3
+
+import pytest
+
+from price_alerts import (
+    ANY_MANDI, AlertEngine, NotificationSink, SQLiteAlertStore, SQLiteNotificationSink, ThresholdIndex, parse_alert,
+    parse_event
+)
+
+
+class MemorySink(NotificationSink):
+    def __init__(self):
+        self.batches = []
+
+    def write_many(self, notifications):
+        self.batches.append(list(notifications))
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'alerts.db')
+
+
+def alert(**fields):
+    return parse_alert(dict({'userId': 'asha', 'crop': 'Wheat', 'targetPrice': 2000}, **fields))
+
+
+def test_triggered_matches_a_linear_scan():
+    rng = random.Random(3)
+    index = ThresholdIndex()
+    alerts = []
+    for number in range(500):
+        condition = rng.choice(['above', 'below'])
+        threshold = rng.randrange(1000, 3000, 50)
+        index.add(condition, threshold, number)
+        alerts.append((condition, threshold, number))
+    for price in (999, 1000, 1850, 2000, 2999, 3500):
+        above, below = index.triggered(price)
+        assert sorted(above) == sorted(n for c, t, n in alerts if c == 'above' and t <= price)
+        assert sorted(below) == sorted(n for c, t, n in alerts if c == 'below' and t >= price)
+
+
+def test_remove_and_discard():
+    index = ThresholdIndex()
+    for number, threshold in enumerate([100, 100, 200, 300]):
+        index.add('above', threshold, number)
+    assert index.remove('above', 100, 1)
+    assert not index.remove('above', 100, 1)
+    index.discard({0, 3})
+    assert index.triggered(1000) == ([2], [])
+    assert len(index) == 1
+
+
+def test_parse_alert_validates_and_ignores_client_ids():
+    row = alert(id='someone-elses', mandi=' Khanna ', condition='below', repeat=True)
+    assert row['id'] != 'someone-elses'
+    assert (row['crop'], row['mandi'], row['one_shot']) == ('wheat', 'khanna', 0)
+    assert alert()['mandi'] == ANY_MANDI
+    for bad in ({'userId': ''}, {'crop': ''}, {'condition': 'equal'}, {'field': 'volume'}, {'targetPrice': 0},
+                {'targetPrice': float('nan')}, {'targetPrice': float('inf')}, {'targetPrice': 'high'}):
+        with pytest.raises(ValueError):
+            alert(**bad)
+
+
+def test_parse_event_needs_a_crop_and_a_numeric_price():
+    assert parse_event({'crop': 'Wheat', 'price': '2100'})['price'] == 2100.0
+    assert parse_event({'crop': 'Wheat', 'forecast': 1900})['forecast'] == 1900.0
+    for bad in ({'crop': 'Wheat'}, {'price': 2000}, {'crop': 'Wheat', 'price': 'x'},
+                {'crop': 'Wheat', 'price': float('nan')}, ['Wheat', 2000]):
+        with pytest.raises(ValueError):
+            parse_event(bad)
+
+
+def test_sink_must_implement_write_many():
+    with pytest.raises(TypeError):
+        NotificationSink()
+
+
+def test_evaluation_fires_one_shot_alerts_once(store_path):
+    sink = MemorySink()
+    engine = AlertEngine(SQLiteAlertStore(store_path), sink)
+    once, repeating, elsewhere, below = engine.register([
+        alert(mandi='Khanna'), alert(targetPrice=2100, repeat=True), alert(mandi='Abohar'),
+        alert(condition='below', targetPrice=1500)
+    ])
+
+    stats = engine.evaluate([{'crop': 'Wheat', 'mandi': 'Khanna', 'price': 2150}])
+    assert stats['notifications'] == 2
+    assert {n['alertId'] for n in sink.batches[0]} == {once, repeating}
+    assert stats['deactivated'] == 1
+
+    engine.evaluate([{'crop': 'wheat', 'mandi': 'KHANNA', 'price': 2200}])
+    assert [n['alertId'] for n in sink.batches[1]] == [repeating]
+
+    # Price alerts ignore forecasts, and an evaluation without matches writes nothing
+    assert engine.evaluate([{'crop': 'Wheat', 'mandi': 'Khanna', 'forecast': 1400}])['notifications'] == 0
+    assert len(sink.batches) == 2
+    engine.evaluate([{'crop': 'Wheat', 'mandi': 'Ludhiana', 'price': 1400}])
+    assert [n['alertId'] for n in sink.batches[2]] == [below]
+    assert elsewhere in engine.alerts
+
+
+def test_a_failing_sink_keeps_one_shot_alerts(store_path):
+    class BrokenSink(MemorySink):
+        def write_many(self, notifications):
+            raise OSError('sink down')
+
+    engine = AlertEngine(SQLiteAlertStore(store_path), BrokenSink())
+    [alert_id] = engine.register([alert()])
+    with pytest.raises(OSError):
+        engine.evaluate([{'crop': 'Wheat', 'price': 2500}])
+
+    engine.sink = MemorySink()
+    assert engine.evaluate([{'crop': 'Wheat', 'price': 2500}])['notifications'] == 1
+    assert engine.sink.batches[0][0]['alertId'] == alert_id
+
+
+def test_workers_share_alerts_through_the_store(store_path):
+    first = AlertEngine(SQLiteAlertStore(store_path), MemorySink())
+    second = AlertEngine(SQLiteAlertStore(store_path), MemorySink())
+    [alert_id] = first.register([alert()])
+
+    assert second.stats()['active_alerts'] == 1
+    first.evaluate([{'crop': 'Wheat', 'price': 2500}])
+    # The one-shot alert was spent by the other worker
+    assert second.evaluate([{'crop': 'Wheat', 'price': 2500}])['notifications'] == 0
+    assert alert_id not in second.alerts
+
+
+def test_only_the_owner_can_remove_an_alert(store_path):
+    engine = AlertEngine(SQLiteAlertStore(store_path), MemorySink())
+    [alert_id] = engine.register([alert(userId='asha')])
+    assert engine.remove([alert_id], 'ravi') == []
+    assert alert_id in engine.alerts
+    assert engine.remove([alert_id], 'asha') == [alert_id]
+    assert AlertEngine(SQLiteAlertStore(store_path), MemorySink()).stats()['active_alerts'] == 0
+
+
+def test_sqlite_sink_writes_a_batch(tmp_path, store_path):
+    sink = SQLiteNotificationSink(str(tmp_path / 'notifications.db'))
+    engine = AlertEngine(SQLiteAlertStore(store_path), sink)
+    engine.register([alert(repeat=True), alert(targetPrice=1000)])
+    assert engine.evaluate([{'crop': 'Wheat', 'price': 2500}])['notifications'] == 2
+
+    with sqlite3.connect(sink.path) as conn:
+        assert conn.execute('select count(*) from alert_notifications').fetchone()[0] == 2
+
+
+def test_alert_endpoints(client, monkeypatch):
+    registered = client.post('/alerts', json={'alerts': [
+        {'userId': 'asha', 'crop': 'Onion', 'targetPrice': 1800, 'id': 'fixed'}
+    ]}).get_json()
+    [alert_id] = registered['ids']
+    assert alert_id != 'fixed'
+    assert client.post('/alerts', json={'crop': 'Onion', 'targetPrice': 1800}).status_code == 400
+
+    assert client.delete(f'/alerts/{alert_id}').status_code == 400
+    assert client.delete(f'/alerts/{alert_id}?userId=ravi').status_code == 404
+    assert client.delete(f'/alerts/{alert_id}', headers={'X-User-Id': 'asha'}).status_code == 200
+    assert client.delete(f'/alerts/{alert_id}?userId=asha').status_code == 404
+
+    monkeypatch.setenv('ALERTS_ADMIN_TOKEN', 'secret')
+    events = {'events': [{'crop': 'Onion', 'price': 2000}]}
+    assert client.post('/alerts/evaluate', json=events).status_code == 403
+    assert client.post('/alerts/evaluate', json=events, headers={'X-Admin-Token': 'secret'}).status_code == 200
+
+    for bad in ([{'crop': 'Onion'}], [{'crop': 'Onion', 'price': 'high'}], ['Onion'],
+                [{'crop': 'Onion', 'price': 2000, 'currentDate': 'today'}]):
+        response = client.post('/alerts/evaluate', json={'events': bad, 'predict': True},
+                               headers={'X-Admin-Token': 'secret'})
+        assert response.status_code == 400
+        assert response.get_json()['error'].startswith('Event 0')
@@ -0,0 +1,196 @@
+"""
+Tests for pooled, cached and coalesced current-price lookups
+"""
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from price_lookup import (
+    IST, PriceLookup, PriceLookupError, PriceNotFound, SingleFlight, SQLitePriceStore, latest_record, lookup_key
+)
+
+RECORD = {'price': 2200.0, 'arrivalDate': '2025-03-10', 'market': 'Khanna', 'commodity': 'Wheat'}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'prices.db')
+
+
+def lookup_with(store_path, fetch, **kwargs):
+    """PriceLookup whose upstream is the given function"""
+    service = PriceLookup(SQLitePriceStore(store_path), **kwargs)
+    service.fetch_upstream = fetch
+    return service
+
+
+def fresh_record():
+    # Arrived today, so it stays valid until tomorrow's update
+    return dict(RECORD, arrivalDate=datetime.now(IST).date().isoformat())
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls, release = [], threading.Event()
+    results = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'price'
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('wheat', slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert {result for result, _ in results} == {'price'}
+
+
+def test_single_flight_shares_errors_and_forgets_the_key():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do('wheat', lambda: (_ for _ in ()).throw(ValueError('down')))
+    assert flight.do('wheat', lambda: 1) == (1, False)
+
+
+def test_expiry_follows_the_next_mandi_update(store_path):
+    service = PriceLookup(SQLitePriceStore(store_path), refresh_hour=10, pending_ttl=1800)
+    now = datetime(2025, 3, 10, 15, tzinfo=IST).timestamp()
+    assert service.expires_at(RECORD, now) == datetime(2025, 3, 11, 10, tzinfo=IST).timestamp()
+    # Past the update with no newer arrival yet, or nothing found: check again soon
+    later = datetime(2025, 3, 11, 12, tzinfo=IST).timestamp()
+    assert service.expires_at(RECORD, later) == later + 1800
+    assert service.expires_at(None, now) == now + 1800
+
+
+def test_latest_record_picks_the_newest_usable_price():
+    records = [
+        {'commodity': 'Wheat', 'district': 'Ludhiana', 'market': 'Khanna', 'arrival_date': '09/03/2025',
+         'modal_price': '2100'},
+        {'commodity': 'Wheat', 'district': 'Ludhiana', 'market': 'Khanna', 'arrival_date': '10/03/2025',
+         'modal_price': '0', 'max_price': '2300'},
+        {'commodity': 'Wheat', 'district': 'Ludhiana', 'market': 'Khanna', 'arrival_date': 'soon',
+         'modal_price': '9999'},
+        {'commodity': 'Onion', 'district': 'Ludhiana', 'market': 'Khanna', 'arrival_date': '11/03/2025',
+         'modal_price': '1500'},
+    ]
+    best = latest_record(records, 'wheat', 'ludhiana', 'khanna')
+    assert (best['price'], best['arrivalDate']) == (2300.0, '2025-03-10')
+    assert latest_record(records, 'Potato', 'Ludhiana', 'Khanna') is None
+    # An empty market or district is not a wildcard
+    assert latest_record(records, 'Wheat', 'Ludhiana', '') is None
+    assert latest_record(records, 'Wheat', None, 'Khanna') is None
+    assert lookup_key(' Wheat', 'Punjab', 'Khanna', 'KHANNA ') == lookup_key('wheat', 'punjab', 'khanna', 'khanna')
+
+
+def test_repeat_lookups_are_served_from_memory_then_the_shared_store(store_path):
+    calls = []
+    first = lookup_with(store_path, lambda *args: calls.append(args) or fresh_record())
+    assert first.lookup('Wheat', 'Khanna')['cache'] == 'upstream'
+    assert first.lookup('wheat', 'KHANNA')['cache'] == 'memory'
+
+    # Another worker finds the price in the store instead of calling the upstream
+    second = lookup_with(store_path, lambda *args: calls.append(args) or fresh_record())
+    assert second.lookup('Wheat', 'Khanna')['cache'] == 'store'
+    assert calls == [('Wheat', 'Punjab', 'Khanna', 'Khanna')]
+    assert second.stats()['store_hits'] == 1
+
+
+def test_concurrent_misses_make_one_upstream_call(store_path):
+    calls = []
+
+    def slow_fetch(*args):
+        calls.append(args)
+        time.sleep(0.2)
+        return fresh_record()
+
+    service = lookup_with(store_path, slow_fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.lookup('Wheat', 'Khanna'))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(r['cache'] for r in results) == ['coalesced'] * 5 + ['upstream']
+
+
+def test_missing_price_is_cached_as_not_found(store_path):
+    calls = []
+    service = lookup_with(store_path, lambda *args: calls.append(args))
+    for _ in range(2):
+        with pytest.raises(PriceNotFound):
+            service.lookup('Saffron', 'Khanna')
+    assert len(calls) == 1
+    assert service.stats()['not_found'] == 2
+
+
+def test_stored_price_is_served_stale_while_the_upstream_is_down(store_path):
+    fetched_at = time.time() - 3600
+    store = SQLitePriceStore(store_path)
+    store.put(lookup_key('Wheat', 'Punjab', 'Khanna', 'Khanna'), RECORD, fetched_at, fetched_at + 60)
+
+    def down(*args):
+        raise ConnectionError('upstream down')
+
+    service = lookup_with(store_path, down)
+    result = service.lookup('Wheat', 'Khanna')
+    assert (result['cache'], result['stale'], result['price']) == ('stale', True, 2200.0)
+    assert service.lookup('Wheat', 'Khanna')['cache'] == 'memory'
+    assert service.stats()['stale_served'] == 1
+
+
+def test_failing_upstream_with_nothing_stored_fails_fast(store_path):
+    calls = []
+
+    def down(*args):
+        calls.append(args)
+        raise ConnectionError('upstream down')
+
+    service = lookup_with(store_path, down, stale_max_age=0)
+    with pytest.raises(PriceLookupError, match='upstream down'):
+        service.lookup('Wheat', 'Khanna')
+    with pytest.raises(PriceLookupError, match='upstream down'):
+        service.lookup('Wheat', 'Khanna')
+    assert len(calls) == 1
+    stats = service.stats()
+    assert (stats['errors'], stats['failed_fast'], stats['failing_keys']) == (1, 1, 1)
+
+
+def test_predict_looks_up_prices_only_when_asked(client, app_module, monkeypatch):
+    calls = []
+    monkeypatch.setattr(app_module.price_lookup, 'fetch_upstream', lambda *args: calls.append(args))
+    body = {'crop': 'Wheat', 'mandi': 'Patti', 'currentPrice': 2200}
+    assert client.post('/predict', json=body).status_code == 200
+    assert calls == []
+
+    response = client.post('/predict', json=dict(body, livePrice=True))
+    assert response.status_code == 404
+    assert response.get_json()['status'] == 'price_not_found'
+    assert len(calls) == 1
+
+
+def test_live_price_needs_crop_and_mandi(client, app_module, monkeypatch):
+    calls = []
+    monkeypatch.setattr(app_module.price_lookup, 'fetch_upstream', lambda *args: calls.append(args))
+    for body in ({'crop': 'Wheat'}, {'crop': 'Wheat', 'mandi': '  '}, {'mandi': 'Khanna'}):
+        response = client.post('/predict', json=dict(body, livePrice=True))
+        assert response.status_code == 400
+    assert calls == []
+
+
+def test_price_endpoints_report_unavailable_upstream(client):
+    # The test upstream is unreachable, so there is nothing to serve
+    response = client.post('/predict', json={'crop': 'Onion', 'mandi': 'Bathinda', 'livePrice': True})
+    assert response.status_code == 502
+    assert response.get_json()['status'] == 'price_unavailable'
+    assert client.get('/prices/current?crop=Onion&mandi=Bathinda').status_code == 502
+    assert client.get('/prices/current?crop=Onion').status_code == 400
+    assert client.get('/prices/stats').get_json()['failed_fast'] >= 1
@@ -0,0 +1,62 @@
+"""
+Tests for on-demand request profiling
+"""
+import pytest
+from flask import Flask, jsonify
+
+import profiling
+from profiling import approximate_size, init_profiling, profile_stage
+
+
+@pytest.fixture
+def profiled_app(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILING_TOKEN', 'secret')
+    app = Flask(__name__)
+    init_profiling(app)
+
+    @app.route('/work')
+    def work():
+        with profile_stage('build'):
+            total = sum(range(1000))
+        return jsonify({'total': total})
+
+    return app.test_client()
+
+
+def test_approximate_size_counts_shared_objects_once():
+    item = list(range(100))
+    assert approximate_size([item, item]) < approximate_size([item, list(range(100))])
+    assert approximate_size({'a': item}) > approximate_size(item)
+
+
+def test_profile_stage_is_a_no_op_outside_profiled_requests():
+    with profile_stage('idle'):
+        pass
+    assert getattr(profiling._stage_state, 'stages', None) is None
+
+
+def test_stage_timings_need_the_token(profiled_app):
+    body = profiled_app.get('/work', headers={'X-Profile': 'stages'}).get_json()
+    assert 'profile' not in body
+
+    response = profiled_app.get('/work', headers={'X-Profile': 'stages', 'X-Profile-Token': 'secret'})
+    report = response.get_json()['profile']
+    assert 'build' in report['stages_ms']
+    assert 'top_functions' not in report
+    assert 'X-Profile-Duration-Ms' in response.headers
+
+
+def test_cprofile_mode_reports_top_functions(profiled_app):
+    response = profiled_app.get('/work?profile_top=5', headers={'X-Profile': 'cprofile',
+                                                                'Authorization': 'Bearer secret'})
+    report = response.get_json()['profile']
+    assert 0 < len(report['top_functions']) <= 5
+
+
+def test_debug_endpoints_are_guarded(profiled_app, monkeypatch):
+    assert profiled_app.get('/debug/memory?snapshot=0').status_code == 403
+    assert profiled_app.get('/debug/memory?snapshot=0', headers={'X-Profile-Token': 'secret'}).status_code == 200
+
+    monkeypatch.setattr(profiling, 'PROFILING_TOKEN', '')
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', False)
+    assert profiled_app.get('/debug/memory').status_code == 404
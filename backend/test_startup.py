@@ -0,0 +1,37 @@
+"""
+Tests for the startup budget: lazy ML imports and the timing report
+"""
+import json
+import subprocess
+import sys
+
+COLD_START = '''
+import json, sys
+import app
+client = app.app.test_client()
+print(json.dumps({
+    'heavy_loaded': [m for m in app.HEAVY_MODULES if m in sys.modules],
+    'report': app.startup_report,
+    'ping': client.get('/ping').status_code,
+    'models_loaded': app.models_loaded
+}))
+'''
+
+
+def test_app_import_leaves_the_ml_libraries_unloaded():
+    # A fresh interpreter, since this test session has imported numpy already
+    output = subprocess.run([sys.executable, '-c', COLD_START], capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result['heavy_loaded'] == []
+    assert result['report']['ml_modules_imported_at_startup'] == []
+    assert result['report']['app_import_ms'] > 0
+    assert result['ping'] == 200
+    assert not result['models_loaded']
+
+
+def test_model_loading_records_import_and_artifact_timings(app_module):
+    assert app_module.load_models_on_demand()
+    report = app_module.startup_report
+    assert {'numpy', 'xgboost'} <= set(report['imports_ms'])
+    assert set(report['artifacts_ms']) == {'model', 'encoders', 'feature_columns', 'metadata'}
+    assert report['models_ready_s'] > 0
@@ -0,0 +1,114 @@
+"""
+Tests for the vectorized hold-vs-sell optimizer and /storage/optimize
+"""
+from datetime import date
+
+import numpy as np
+import pytest
+
+from storage_optimizer import forecast_from_prediction, lot_parameters, optimize_lots, solve
+
+LOT = {'crop': 'Wheat', 'mandi': 'Khanna', 'currentPrice': 2200, 'quantity': 50, 'storageCostPerTonMonth': 120}
+
+
+def brute_force(prices, quantity, storage_cost, spoilage, daily_discount, handling_cost):
+    """Value of selling on each day, computed day by day"""
+    values = []
+    for day in range(len(prices)):
+        paid = sum((quantity * (1 - spoilage) ** k * storage_cost + handling_cost) / (1 + daily_discount) ** k
+                   for k in range(day))
+        sold = quantity * (1 - spoilage) ** day * prices[day] / (1 + daily_discount) ** day
+        values.append(sold - paid)
+    return values
+
+
+def test_solve_matches_brute_force_on_random_lots():
+    rng = np.random.default_rng(5)
+    lots, days = 40, 25
+    prices = rng.uniform(1000, 3000, (lots, days)).cumsum(axis=1) / np.arange(1, days + 1)
+    horizons = rng.integers(0, days, lots)
+    valid = np.arange(days)[None, :] <= horizons[:, None]
+    quantity = rng.uniform(1, 100, lots)
+    storage_cost = rng.uniform(0, 20, lots)
+    spoilage = rng.uniform(0, 0.02, lots)
+    discount = rng.uniform(0, 0.0005, lots)
+    handling = rng.uniform(0, 50, lots)
+
+    best_day, best_value, net = solve(prices, valid, quantity, storage_cost, spoilage, discount, handling)
+    for i in range(lots):
+        expected = brute_force(prices[i, :horizons[i] + 1], quantity[i], storage_cost[i], spoilage[i],
+                               discount[i], handling[i])
+        np.testing.assert_allclose(net[i, :horizons[i] + 1], expected, rtol=1e-9)
+        assert best_day[i] == int(np.argmax(expected))
+        assert best_value[i] == pytest.approx(max(expected))
+
+
+def test_forecast_path_runs_through_the_horizons():
+    path = forecast_from_prediction(100, 110, 130, 160, horizon=40)
+    assert (path[0], path[1], path[7], path[30], path[40]) == (100, 110, 130, 160, 160)
+
+
+def test_rising_prices_are_held_and_falling_prices_sold():
+    lots = [dict(LOT, lotId='up'), dict(LOT, lotId='down')]
+    forecasts = [[2200 + 20 * d for d in range(31)], [2200 - 20 * d for d in range(31)]]
+    up, down = optimize_lots(lots, forecasts, start_date=date(2025, 1, 1), include_curve=True)
+    assert up['action'] == 'hold' and up['optimalSellDay'] == 30
+    assert up['sellDate'] == '2025-01-31'
+    assert up['expectedNetGain'] > 0
+    assert down['action'] == 'sell_now' and down['expectedNetGain'] == 0
+    assert len(up['valueBySellDay']) == 31
+
+
+def test_shelf_life_caps_the_horizon():
+    params = lot_parameters(dict(LOT, horizonDays=60, shelfLifeDays=10), default_horizon=30)
+    assert params['horizon'] == 10
+    assert params['storage_cost'] == pytest.approx(120 / 10 / 30)
+
+
+@pytest.mark.parametrize('lot, message', [
+    (dict(LOT, quantity=0), 'quantity must be positive'),
+    (dict(LOT, spoilageRatePerDay=1.5), 'spoilageRatePerDay'),
+    (dict(LOT, storageCostPerDay='cheap'), 'storageCostPerDay must be a number'),
+    (dict(LOT, horizonDays=2.5), 'horizonDays must be an integer'),
+])
+def test_lot_parameters_name_the_bad_field(lot, message):
+    with pytest.raises(ValueError, match=message):
+        lot_parameters(lot, default_horizon=30)
+
+
+def test_endpoint_predicts_missing_forecasts_in_one_batch(client):
+    body = client.post('/storage/optimize', json={'lots': [LOT, dict(LOT, forecast=[2300, 2400])]}).get_json()
+    assert body['count'] == 2
+    assert body['modelForecasts'] == 1
+    assert body['plans'][1]['horizonDays'] == 2
+
+
+def test_endpoint_scores_numeric_strings_as_numbers(client):
+    lots = [dict(LOT, currentPrice='2200', quantity='50', currentDate='2025-01-15')]
+    response = client.post('/storage/optimize', json={'lots': lots})
+    assert response.status_code == 200
+    assert response.get_json()['modelForecasts'] == 1
+
+
+def test_endpoint_names_the_lot_with_a_bad_date(client):
+    lots = [LOT, dict(LOT, currentDate='15/01/2025')]
+    response = client.post('/storage/optimize', json={'lots': lots})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Lot 1: currentDate')
+
+
+@pytest.mark.parametrize('payload', [
+    {'lots': [LOT], 'horizonDays': 'ten'},
+    {'lots': [dict(LOT, currentPrice='abc')]},
+    {'lots': [dict(LOT, currentPrice=-5)]},
+    {'lots': [dict(LOT, horizonDays=None)]},
+    {'lots': [dict(LOT, forecast=[2300, 'x'])]},
+    {'lots': [dict(LOT, forecast='2300')]},
+    {'lots': [dict(LOT, quantity=[1])]},
+    {'lots': [dict(LOT, currentDate=20250115)]},
+    {'lots': ['lot']},
+    {'lots': []},
+    ['lot'],
+])
+def test_endpoint_rejects_bad_input_with_400(client, payload):
+    assert client.post('/storage/optimize', json=payload).status_code == 400
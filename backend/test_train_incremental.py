@@ -0,0 +1,109 @@
+"""
+Tests for streamed history features and out-of-core retraining
+"""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from history_features import HistoryFeatureBuilder, iter_history_chunks, normalize_columns
+from model_registry import load_bundle
+from train_incremental import regression_metrics, train_booster, training_params, write_bundle
+
+
+@pytest.fixture(scope='module')
+def bundle():
+    with open('models/encoders.pkl', 'rb') as f:
+        encoders = pickle.load(f)
+    with open('models/feature_columns.pkl', 'rb') as f:
+        feature_columns = pickle.load(f)
+    return encoders, feature_columns
+
+
+def test_normalize_columns_accepts_data_gov_names():
+    df = normalize_columns(pd.DataFrame({
+        'Arrival_Date': ['31/01/2024'], 'Commodity': ['Wheat'], 'Market': ['Khanna'], 'Modal_x0020_Price': ['2200']
+    }))
+    assert df['date'].iloc[0] == pd.Timestamp(2024, 1, 31)
+    assert df['min_price'].iloc[0] == df['max_price'].iloc[0] == 2200
+    assert df['district'].iloc[0] == 'Khanna'
+
+    with pytest.raises(ValueError, match='modal_price'):
+        normalize_columns(pd.DataFrame({'date': ['2024-01-01'], 'crop': ['Wheat'], 'mandi': ['Khanna']}))
+
+
+def build_rows(paths, chunksize, encoders, feature_columns):
+    builder = HistoryFeatureBuilder(encoders, feature_columns)
+    rows = pd.concat([builder.process(chunk) for chunk in iter_history_chunks(paths, chunksize)], ignore_index=True)
+    return rows.sort_values(['crop', 'mandi', 'date']).reset_index(drop=True)
+
+
+def test_streamed_features_match_a_single_pass(history_csv, bundle):
+    encoders, feature_columns = bundle
+    whole = build_rows(history_csv, 10 ** 6, encoders, feature_columns)
+    streamed = build_rows(history_csv, 97, encoders, feature_columns)
+    pd.testing.assert_frame_equal(whole, streamed)
+
+
+def test_target_is_the_next_observation_of_the_series(history_csv, bundle):
+    encoders, feature_columns = bundle
+    rows = build_rows(history_csv, 200, encoders, feature_columns)
+    history = normalize_columns(pd.read_csv(history_csv)).sort_values(['crop', 'mandi', 'date'])
+    series = history[(history['crop'] == 'Onion') & (history['mandi'] == 'Abohar')]
+    onion = rows[(rows['crop'] == 'Onion') & (rows['mandi'] == 'Abohar')]
+    # Every observation but the last gets a label
+    assert len(onion) == len(series) - 1
+    np.testing.assert_allclose(onion['target'].to_numpy(), series['modal_price'].to_numpy()[1:])
+    assert (onion['target_date'] - onion['date'] == pd.Timedelta(days=1)).all()
+
+
+def test_train_end_keeps_later_labels_out_of_training(history_csv, bundle):
+    encoders, feature_columns = bundle
+    params = dict(training_params(None, max_bin=32, nthread=1), max_depth=3)
+    train_end = pd.Timestamp(2024, 3, 1)
+    booster, iterator = train_booster(history_csv, 150, encoders, feature_columns, params, rounds=5,
+                                      train_end=train_end)
+    rows = build_rows(history_csv, 10 ** 6, encoders, feature_columns)
+    assert iterator.train_rows == int((rows['target_date'] < train_end).sum())
+    assert booster.num_boosted_rounds() == 5
+
+
+def test_holdout_rows_are_collected_not_trained(history_csv, bundle):
+    encoders, feature_columns = bundle
+    params = dict(training_params(None, max_bin=32, nthread=1), max_depth=3)
+    holdout_start = pd.Timestamp(2024, 6, 1)
+    _, iterator = train_booster(history_csv, 150, encoders, feature_columns, params, rounds=2,
+                                holdout_start=holdout_start)
+    holdout = pd.concat(iterator.holdout)
+    assert (holdout['date'] >= holdout_start).all()
+    rows = build_rows(history_csv, 10 ** 6, encoders, feature_columns)
+    assert iterator.train_rows + len(holdout) == len(rows)
+
+
+def test_regression_metrics():
+    metrics = regression_metrics([100, 200], [110, 190])
+    assert metrics['mae'] == pytest.approx(10)
+    assert metrics['rmse'] == pytest.approx(10)
+    assert metrics['mape'] == pytest.approx(7.5)
+
+
+def test_write_bundle_swaps_the_whole_directory(tmp_path):
+    output_dir = tmp_path / 'models'
+    output_dir.mkdir()
+    (output_dir / 'market_price_model.pkl').write_bytes(pickle.dumps('old model'))
+
+    write_bundle(str(output_dir), 'model 1', {}, ['a'], {'version': '1'})
+    assert os.path.islink(output_dir)
+    assert load_bundle(str(output_dir))['model'] == 'model 1'
+    first = os.path.realpath(output_dir)
+
+    for version in ('2', '3'):
+        write_bundle(str(output_dir), f'model {version}', {}, ['a'], {'version': version})
+    bundle = load_bundle(str(output_dir))
+    assert (bundle['model'], bundle['metadata']['version']) == ('model 3', '3')
+    # Only the new and the previous bundle directories are kept
+    kept = sorted(entry for entry in os.listdir(tmp_path) if entry.startswith('.models-'))
+    assert len(kept) == 2
+    assert not os.path.exists(first)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Out-of-core incremental retraining pipeline
+Streams historical mandi prices in chunks through XGBoost's external-memory
+data iterator, continues boosting from the current model (or trains from
+scratch), recomputes performance_metrics on a held-out window and writes the
+four artifacts load_ml_models() consumes.
+
+Usage:
+    python train_incremental.py --data history.csv
+    python train_incremental.py --data 2024.csv 2025.csv --rounds 200 --holdout-days 45
+    python train_incremental.py --data history.csv --from-scratch --output-dir models
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import argparse
+import resource
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.preprocessing import LabelEncoder
+
+from history_features import (
+    CATEGORICAL_COLUMNS, HistoryFeatureBuilder, default_feature_columns, iter_history_chunks,
+    season_for_months
+)
+
+from drift import build_training_profile
+from model_registry import MODEL_FILES, load_bundle
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def scan_history(paths, chunksize):
+    """First pass: date range, category values and crop/mandi record counts"""
+    max_date = None
+    min_date = None
+    categories = {column: set() for column in CATEGORICAL_COLUMNS}
+    counts = {}
+    for chunk in iter_history_chunks(paths, chunksize):
+        chunk_max, chunk_min = chunk['date'].max(), chunk['date'].min()
+        max_date = chunk_max if max_date is None else max(max_date, chunk_max)
+        min_date = chunk_min if min_date is None else min(min_date, chunk_min)
+        chunk = chunk.assign(season=season_for_months(chunk['date'].dt.month.to_numpy()))
+        for column in CATEGORICAL_COLUMNS:
+            categories[column].update(chunk[column].astype(str).unique())
+        for (crop, mandi), count in chunk.groupby(['crop', 'mandi']).size().items():
+            counts[(crop, mandi)] = counts.get((crop, mandi), 0) + int(count)
+    return min_date, max_date, categories, counts
+
+
+def fit_encoders(categories):
+    """Fit fresh LabelEncoders when training from scratch"""
+    encoders = {}
+    for column, values in categories.items():
+        encoder = LabelEncoder()
+        encoder.fit(sorted(values))
+        encoders[column] = encoder
+    return encoders
+
+
+class HistoryIterator(xgb.DataIter):
+    """Feeds training rows chunk by chunk and collects the holdout window on the first pass
+
+    With train_end set, only rows whose label was observed before train_end are
+    used (walk-forward folds) and reading stops at the first later chunk.
+    """
+
+    def __init__(self, paths, chunksize, encoders, feature_columns, holdout_start, cache_dir, train_end=None):
+        self.paths = paths
+        self.chunksize = chunksize
+        self.builder = HistoryFeatureBuilder(encoders, feature_columns)
+        self.feature_columns = list(feature_columns)
+        self.holdout_start = holdout_start
+        self.train_end = train_end
+        self.holdout = []
+        self.train_rows = 0
+        self.first_pass_done = False
+        self._chunks = None
+        super().__init__(cache_prefix=os.path.join(cache_dir, 'history'))
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = iter_history_chunks(self.paths, self.chunksize)
+        for chunk in self._chunks:
+            if self.train_end is not None and chunk['date'].min() >= self.train_end:
+                # Every row this chunk (or its carry) would emit is labelled on or after train_end
+                break
+            rows = self.builder.process(chunk)
+            if self.train_end is not None:
+                rows = rows[rows['target_date'] < self.train_end]
+            if self.holdout_start is None:
+                holdout_mask = pd.Series(False, index=rows.index)
+            else:
+                holdout_mask = rows['date'] >= self.holdout_start
+            if not self.first_pass_done and holdout_mask.any():
+                self.holdout.append(rows[holdout_mask])
+            train = rows[~holdout_mask]
+            if len(train) == 0:
+                continue
+            if not self.first_pass_done:
+                self.train_rows += len(train)
+            input_data(data=train[self.feature_columns].to_numpy(), label=train['target'].to_numpy(),
+                       feature_names=self.feature_columns)
+            return True
+        self.first_pass_done = True
+        return False
+
+    def reset(self):
+        self._chunks = None
+        self.builder.reset()
+
+
+def build_training_matrix(iterator, max_bin):
+    """External-memory DMatrix over the iterator (quantile pages when available)"""
+    if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+        return xgb.ExtMemQuantileDMatrix(iterator, max_bin=max_bin)
+    return xgb.DMatrix(iterator)
+
+
+def regression_metrics(y_true, y_pred):
+    """MAE, MSE, RMSE, R2 and MAPE in the format stored in model_metadata"""
+    y_true = np.asarray(y_true, dtype=float)
+    y_pred = np.asarray(y_pred, dtype=float)
+    errors = y_pred - y_true
+    mse = float(np.mean(errors ** 2))
+    ss_tot = float(np.sum((y_true - y_true.mean()) ** 2))
+    nonzero = y_true != 0
+    return {
+        'mae': float(np.mean(np.abs(errors))),
+        'mse': mse,
+        'rmse': float(np.sqrt(mse)),
+        'r2': float(1 - np.sum(errors ** 2) / ss_tot) if ss_tot > 0 else 0.0,
+        'mape': float(np.mean(np.abs(errors[nonzero] / y_true[nonzero])) * 100) if nonzero.any() else 0.0
+    }
+
+
+def training_params(base_model, max_bin=256, learning_rate=None, nthread=None):
+    """Booster params from the current model, overridable from the command line"""
+    params = {
+        'objective': 'reg:squarederror',
+        'tree_method': 'hist',
+        'learning_rate': 0.05,
+        'max_depth': 6,
+        'subsample': 0.8,
+        'reg_alpha': 0.5,
+        'reg_lambda': 5,
+        'max_bin': max_bin
+    }
+    if base_model is not None:
+        for key, value in base_model.get_xgb_params().items():
+            if value is not None and key in params:
+                params[key] = value
+    if learning_rate is not None:
+        params['learning_rate'] = learning_rate
+    params['nthread'] = nthread or os.cpu_count() or 1
+    params['eta'] = params.pop('learning_rate')
+    params['alpha'] = params.pop('reg_alpha')
+    params['lambda'] = params.pop('reg_lambda')
+    return params
+
+
+def train_booster(paths, chunksize, encoders, feature_columns, params, rounds, holdout_start=None,
+                  train_end=None, base_booster=None):
+    """Boost `rounds` trees over the streamed history; returns (booster, iterator)
+
+    The iterator carries train_rows and the holdout rows collected on the first pass.
+    """
+    with tempfile.TemporaryDirectory(prefix='xgb-extmem-') as cache_dir:
+        iterator = HistoryIterator(paths, chunksize, encoders, feature_columns, holdout_start, cache_dir,
+                                   train_end=train_end)
+        dtrain = build_training_matrix(iterator, params.get('max_bin', 256))
+        booster = xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=base_booster)
+        del dtrain
+    return booster, iterator
+
+
+def trained_until(metadata):
+    """First date the bundle was not trained on (rows from it on are out-of-sample), or None if unknown"""
+    report = metadata.get('training_report') or {}
+    if report.get('trained_until'):
+        return pd.Timestamp(report['trained_until'])
+    if report.get('holdout_start'):
+        return pd.Timestamp(report['holdout_start'])
+    if report.get('history_range'):
+        return pd.Timestamp(report['history_range'][1]) + timedelta(days=1)
+    if metadata.get('training_date'):
+        # Bundles trained before the report existed: assume data up to the training day
+        return pd.Timestamp(metadata['training_date']).normalize() + timedelta(days=1)
+    return None
+
+
+def write_bundle(output_dir, model, encoders, feature_columns, metadata):
+    """Write the serving artifacts and switch output_dir to them in one rename
+
+    The files go into a new sibling directory and output_dir becomes a symlink to
+    it, swapped with os.replace, so a crash leaves either the old bundle or the
+    new one, never a model next to another bundle's encoders or metadata. The
+    previous directory is kept for readers still loading from it.
+    """
+    output_dir = os.path.abspath(output_dir)
+    parent, name = os.path.split(output_dir)
+    prefix = f'.{name}-'
+    staging = tempfile.mkdtemp(prefix=prefix, dir=parent)
+    objects = {'model': model, 'encoders': encoders, 'feature_columns': feature_columns, 'metadata': metadata}
+    for key, filename in MODEL_FILES.items():
+        with open(os.path.join(staging, filename), 'wb') as f:
+            pickle.dump(objects[key], f)
+            f.flush()
+            os.fsync(f.fileno())
+    os.chmod(staging, 0o755)
+
+    if os.path.islink(output_dir):
+        previous = os.path.realpath(output_dir)
+    elif os.path.isdir(output_dir):
+        # First switch of a plain directory: move it aside so output_dir can become the link
+        previous = tempfile.mkdtemp(prefix=prefix, dir=parent)
+        os.rename(output_dir, previous)
+    else:
+        previous = None
+
+    link = os.path.join(parent, f'{prefix}link-{os.getpid()}')
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(staging), link)
+    os.replace(link, output_dir)
+
+    # Drop older bundle directories, keeping the new and the previous one
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if (entry.startswith(prefix) and os.path.isdir(path) and not os.path.islink(path)
+                and path not in (staging, previous)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally retrain the market price model out of core')
+    parser.add_argument('--data', nargs='+', required=True, help='Date-ordered history CSV file(s)')
+    parser.add_argument('--models-dir', default=os.path.join(BACKEND_DIR, 'models'),
+                        help='Current serving artifacts to continue from')
+    parser.add_argument('--output-dir', default=os.path.join(BACKEND_DIR, 'models_candidate'),
+                        help='Where to write the new artifacts (use models/ to replace the served model)')
+    parser.add_argument('--from-scratch', action='store_true', help='Fit new encoders and a new model')
+    parser.add_argument('--rounds', type=int, default=100, help='Boosting rounds to add')
+    parser.add_argument('--chunksize', type=int, default=200000, help='CSV rows per chunk')
+    parser.add_argument('--holdout-days', type=int, default=30, help='Most recent days held out for metrics')
+    parser.add_argument('--learning-rate', type=float)
+    parser.add_argument('--max-bin', type=int, default=256)
+    parser.add_argument('--nthread', type=int)
+    parser.add_argument('--version', help='Version string for the new bundle')
+    parser.add_argument('--no-profile', action='store_true',
+                        help='Skip the training profile used as the /drift baseline (saves one pass over the data)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    print("🚂 Out-of-core incremental training")
+
+    base = None if args.from_scratch else load_bundle(args.models_dir)
+    if base is None and not args.from_scratch:
+        print(f"⚠️  No artifacts in {args.models_dir}, training from scratch")
+
+    print("🔍 Scanning history...")
+    min_date, max_date, categories, counts = scan_history(args.data, args.chunksize)
+    if max_date is None:
+        print("❌ No history rows found")
+        return 1
+    holdout_start = max_date - timedelta(days=args.holdout_days - 1)
+    print(f"   {min_date.date()} .. {max_date.date()}, holdout from {holdout_start.date()}")
+
+    if base is not None:
+        encoders = base['encoders']
+        feature_columns = base['feature_columns']
+        base_model = base['model']
+        unseen = {c: len(categories[c] - set(map(str, encoders[c].classes_)))
+                  for c in categories if c in encoders}
+        if any(unseen.values()):
+            print(f"   Unseen categories map to classes_[0] when continuing: {unseen}")
+    else:
+        encoders = fit_encoders(categories)
+        feature_columns = default_feature_columns()
+        base_model = None
+
+    params = training_params(base_model, args.max_bin, args.learning_rate, args.nthread)
+    previous = base_model.get_booster() if base_model is not None else None
+    print(f"🌲 Boosting {args.rounds} rounds" + (" on top of the current model" if previous else "")
+          + " over an external-memory training matrix")
+    booster, iterator = train_booster(args.data, args.chunksize, encoders, feature_columns, params, args.rounds,
+                                      holdout_start=pd.Timestamp(holdout_start), base_booster=previous)
+    print(f"   {iterator.train_rows} training rows, {sum(len(h) for h in iterator.holdout)} holdout rows")
+
+    model = xgb.XGBRegressor()
+    model.load_model(bytearray(booster.save_raw('json')))
+    model.set_params(n_jobs=1)
+
+    holdout = pd.concat(iterator.holdout, ignore_index=True) if iterator.holdout else None
+    if holdout is not None and len(holdout):
+        predictions = model.predict(holdout[feature_columns].to_numpy())
+        metrics = regression_metrics(holdout['target'], predictions)
+    else:
+        print("⚠️  Holdout window is empty, keeping previous metrics")
+        metrics = dict(base['metadata'].get('performance_metrics', {})) if base else {}
+
+    previous_version = base['metadata'].get('version', '2.0_fixed') if base else '3.0'
+    version = args.version or (f"{previous_version}+inc{datetime.now():%Y%m%d}" if base else previous_version)
+    combinations = [
+        {'crop': crop, 'mandi': mandi, 'count': count}
+        for (crop, mandi), count in sorted(counts.items(), key=lambda item: -item[1])
+    ]
+    # Continued trees keep whatever the base model was trained on
+    out_of_sample_from = pd.Timestamp(holdout_start)
+    base_until = trained_until(base['metadata']) if base else None
+    if base_until is not None:
+        out_of_sample_from = max(out_of_sample_from, base_until)
+    wall_time = time.perf_counter() - started
+    training_report = {
+        'data': args.data,
+        'continued_from': previous_version if base else None,
+        'rounds_added': args.rounds,
+        'total_rounds': booster.num_boosted_rounds(),
+        'train_rows': iterator.train_rows,
+        'holdout_rows': 0 if holdout is None else len(holdout),
+        'holdout_start': str(holdout_start.date()),
+        'history_range': [str(min_date.date()), str(max_date.date())],
+        'trained_until': str(out_of_sample_from.date()),
+        'wall_time_s': round(wall_time, 2),
+        'peak_memory_mb': round(peak_memory_mb(), 1)
+    }
+    metadata = {
+        'performance_metrics': metrics,
+        'training_date': datetime.now().isoformat(),
+        'version': version,
+        'available_combinations': combinations,
+        'training_report': training_report
+    }
+    if not args.no_profile:
+        print("📊 Building training profile for drift monitoring...")
+        metadata['training_profile'] = build_training_profile(args.data, model, encoders, feature_columns,
+                                                              args.chunksize)
+        print(f"   {metadata['training_profile']['rows']} rows in {metadata['training_profile']['build_time_s']}s")
+    write_bundle(args.output_dir, model, encoders, feature_columns, metadata)
+
+    print("\n✅ Training complete")
+    print(f"   Version: {version}")
+    print("   R2: {:.4f}  MAE: Rs.{:.2f}  RMSE: Rs.{:.2f}  MAPE: {:.2f}%".format(
+        metrics.get('r2', 0), metrics.get('mae', 0), metrics.get('rmse', 0), metrics.get('mape', 0)))
+    print(f"   Wall time: {training_report['wall_time_s']}s, peak memory: {training_report['peak_memory_mb']} MB")
+    print(f"   Artifacts written to {args.output_dir}")
+    with open(os.path.join(args.output_dir, 'training_report.json'), 'w') as f:
+        json.dump({'version': version, 'performance_metrics': metrics, **training_report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1208,15 +1208,9 @@ export const getMLMarketPredictionWithRealPrices = async (crop: string, location
     
     console.log(`Parsed location - District: ${district}, Market: ${market}, State: ${state}`)
     
-    // First, get real current price from Data.gov.in API with fallback
-    const realPriceData = await getRealCurrentPricesWithFallback(crop, district, market, state)
-    const currentPrice = realPriceData.price
-    
-    console.log(`Real current price for ${crop} in ${market}, ${district}, ${state}: ₹${currentPrice}`)
-    
-    // Call the real ML backend API with real current price
+    // The backend looks up the current price itself (pooled, cached Data.gov.in lookups)
     const ML_BACKEND_URL = process.env.NEXT_PUBLIC_ML_BACKEND_URL || 'http://localhost:5000'
-    const response = await fetch(`${ML_BACKEND_URL}/predict`, {
+    const requestPrediction = (body: Record<string, unknown>) => fetch(`${ML_BACKEND_URL}/predict`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -1225,16 +1219,29 @@ export const getMLMarketPredictionWithRealPrices = async (crop: string, location
         crop,
         mandi: market,
         state: state,
-        currentPrice,
-        currentDate: new Date().toISOString().split('T')[0]
+        currentDate: new Date().toISOString().split('T')[0],
+        ...body
       })
     })
 
+    let realPriceData: any = null
+    let response = await requestPrediction({ district, livePrice: true })
+    if (response.status === 502 || response.status === 404 || response.status === 400) {
+      // Backend could not reach the price API, has no price here or could not parse the location,
+      // use the direct lookup and its fallback dataset
+      realPriceData = await getRealCurrentPricesWithFallback(crop, district, market, state)
+      response = await requestPrediction({ currentPrice: realPriceData.price })
+    }
+
     if (!response.ok) {
       throw new Error(`ML API error: ${response.status} ${response.statusText}`)
     }
 
     const prediction = await response.json()
+    realPriceData = realPriceData || prediction.currentPriceData
+    const currentPrice = realPriceData.price
+    
+    console.log(`Real current price for ${crop} in ${market}, ${district}, ${state}: ₹${currentPrice}`)
     
     // Add real price data to the response
     return {
@@ -1378,6 +1385,56 @@ export const getAvailableMLCombinations = async () => {
   }
 }
 
+// Optimal hold/sell day for stored lots (storage cost, spoilage and the ML forecast)
+export const optimizeStorageLots = async (lots: Array<{
+  lotId?: string
+  crop?: string
+  mandi?: string
+  currentPrice: number
+  quantity: number
+  storageCostPerTonMonth?: number
+  spoilageRatePerDay?: number
+  shelfLifeDays?: number
+  forecast?: number[]
+}>, horizonDays = 30) => {
+  const ML_BACKEND_URL = process.env.NEXT_PUBLIC_ML_BACKEND_URL || 'http://localhost:5000'
+  const response = await fetch(`${ML_BACKEND_URL}/storage/optimize`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ lots, horizonDays })
+  })
+  if (!response.ok) {
+    throw new Error(`ML API error: ${response.status}`)
+  }
+  return response.json()
+}
+
+// Register price alerts with the backend alert engine (evaluated server-side); returns the server-generated ids
+export const registerPriceAlerts = async (alerts: Array<{
+  userId: string
+  crop: string
+  mandi?: string
+  targetPrice: number
+  condition: 'above' | 'below'
+  field?: 'price' | 'forecast'
+  repeat?: boolean
+}>) => {
+  const ML_BACKEND_URL = process.env.NEXT_PUBLIC_ML_BACKEND_URL || 'http://localhost:5000'
+  const response = await fetch(`${ML_BACKEND_URL}/alerts`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ alerts })
+  })
+  if (!response.ok) {
+    throw new Error(`ML API error: ${response.status}`)
+  }
+  return response.json()
+}
+
 // Get nearby mandi prices with real data from API
 export const getNearbyMandiPrices = async (crop: string, currentLocation: string, currentPrice: number) => {
   try {